@@ -1,3 +1,4 @@
+import os
 import pygame
 import sys
 from Logik import Game, QLearningAI, train_ai_selfplay, reset_ai
@@ -15,34 +16,64 @@ BUTTON_COLOR = (180, 180, 220)
 BUTTON_HOVER = (120, 180, 255)
 BUTTON_TEXT = (30, 30, 30)
 
-def draw_board(screen, game, selected=None, valid_moves=[]):
-    offset_x = (WIDTH - BOARD_SIZE * SQUARE_SIZE) // 2
-    offset_y = (HEIGHT - BOARD_SIZE * SQUARE_SIZE) // 2
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            rect = pygame.Rect(offset_x + c*SQUARE_SIZE, offset_y + r*SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-            color = WHITE if (r+c)%2==0 else GREEN
-            if selected == (r, c):
-                color = BLUE
-            elif any(move[1] == (r, c) for move in valid_moves):
-                color = RED
-            pygame.draw.rect(screen, color, rect)
-            piece = game.board[r][c]
-            if piece == 'w':
-                pygame.draw.circle(screen, (220,220,220), rect.center, SQUARE_SIZE//3)
-            elif piece == 'b':
-                pygame.draw.circle(screen, (50,50,50), rect.center, SQUARE_SIZE//3)
-    pygame.display.flip()
+FPS = 60  # Obergrenze für alle Schleifen, gezeichnet wird trotzdem nur, was sich geändert hat
+
+class BoardRenderer:
+    # Felder und Steine werden einmal vorgerendert. draw() merkt sich, was in jedem Feld zu sehen ist,
+    # und schickt nur die geänderten Felder per pygame.display.update an den Bildschirm.
+    def __init__(self, screen):
+        self.screen = screen
+        self.offset_x = (WIDTH - BOARD_SIZE * SQUARE_SIZE) // 2
+        self.offset_y = (HEIGHT - BOARD_SIZE * SQUARE_SIZE) // 2
+        self.squares = {}
+        for color in (WHITE, GREEN, BLUE, RED):
+            square = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE)).convert()
+            square.fill(color)
+            self.squares[color] = square
+        self.pieces = {}
+        for piece, color in (('w', (220,220,220)), ('b', (50,50,50))):
+            surf = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA).convert_alpha()
+            pygame.draw.circle(surf, color, (SQUARE_SIZE//2, SQUARE_SIZE//2), SQUARE_SIZE//3)
+            self.pieces[piece] = surf
+        self.shown = None  # (r, c) -> (Farbe, Stein) wie zuletzt gezeichnet; None = alles neu
+
+    def invalidate(self):
+        self.shown = None
+
+    def draw(self, board, selected=None, valid_moves=()):
+        targets = {move[1] for move in valid_moves}
+        full = self.shown is None
+        if full:
+            self.screen.fill(MENU_BG)
+            self.shown = {}
+        dirty = []
+        for r in range(BOARD_SIZE):
+            for c in range(BOARD_SIZE):
+                color = WHITE if (r+c)%2==0 else GREEN
+                if selected == (r, c):
+                    color = BLUE
+                elif (r, c) in targets:
+                    color = RED
+                cell = (color, board[r][c])
+                if self.shown.get((r, c)) == cell:
+                    continue
+                self.shown[(r, c)] = cell
+                pos = (self.offset_x + c*SQUARE_SIZE, self.offset_y + r*SQUARE_SIZE)
+                self.screen.blit(self.squares[color], pos)
+                if cell[1] in self.pieces:
+                    self.screen.blit(self.pieces[cell[1]], pos)
+                dirty.append(pygame.Rect(pos, (SQUARE_SIZE, SQUARE_SIZE)))
+        if full:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
 
-def draw_menu(screen, font, buttons, title="3x3 Schach mit 3 Bauern"):
+def draw_menu(screen, title_surf, buttons, labels, hovered):
     screen.fill(MENU_BG)
-    title_surf = font.render(title, True, (255,255,255))
     screen.blit(title_surf, (WIDTH//2 - title_surf.get_width()//2, 40))
-    mouse = pygame.mouse.get_pos()
-    for rect, text in buttons:
-        color = BUTTON_HOVER if rect.collidepoint(mouse) else BUTTON_COLOR
+    for i, ((rect, _), text_surf) in enumerate(zip(buttons, labels)):
+        color = BUTTON_HOVER if i == hovered else BUTTON_COLOR
         pygame.draw.rect(screen, color, rect, border_radius=10)
-        text_surf = font.render(text, True, BUTTON_TEXT)
         screen.blit(text_surf, (rect.x + rect.width//2 - text_surf.get_width()//2,
                                 rect.y + rect.height//2 - text_surf.get_height()//2))
     pygame.display.flip()
@@ -57,8 +88,18 @@ def menu_loop(screen):
         (pygame.Rect(WIDTH//2 - btn_w//2, start_y + i*(btn_h + gap), btn_w, btn_h), text)
         for i, text in enumerate(["PvE", "PvP", "KI trainieren", "KI zurücksetzen"])
     ]
+    # Texte werden einmal gerendert, neu gezeichnet wird nur, wenn sich der Hover-Button ändert
+    title_surf = font.render("3x3 Schach mit 3 Bauern", True, (255,255,255))
+    labels = [font.render(text, True, BUTTON_TEXT) for _, text in buttons]
+    clock = pygame.time.Clock()
+    shown = -1
     while True:
-        draw_menu(screen, font, buttons)
+        clock.tick(FPS)
+        mouse = pygame.mouse.get_pos()
+        hovered = next((i for i, (rect, _) in enumerate(buttons) if rect.collidepoint(mouse)), None)
+        if hovered != shown:
+            draw_menu(screen, title_surf, buttons, labels, hovered)
+            shown = hovered
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -74,9 +115,12 @@ def gui_game(screen, vs_ai=True):
     ai = QLearningAI('b')
     selected = None
     valid_moves = []
+    renderer = BoardRenderer(screen)
+    clock = pygame.time.Clock()
     running = True
     while running:
-        draw_board(screen, game, selected, valid_moves)
+        clock.tick(FPS)
+        renderer.draw(game.board, selected, valid_moves)
         if game.is_game_over():
             msg = "Unentschieden!"
             if game.winner == 'w':
@@ -136,13 +180,14 @@ def show_training_progress(screen, episodes_done):
     text = font.render(msg, True, (255,255,255))
     screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - text.get_height()//2))
     pygame.display.flip()
+    pygame.event.pump()
 
 def train_ai_selfplay_gui(screen, episodes=5000):
     font = pygame.font.SysFont(None, 36)
     print(f"Starte Selbstlernmodus für {episodes} Spiele ...")
     def progress_callback(episodes_done):
         show_training_progress(screen, episodes_done)
-    train_ai_selfplay(episodes, progress_callback)
+    train_ai_selfplay(episodes, progress_callback, workers=os.cpu_count() or 1)
     print("Training abgeschlossen! Die KI wurde trainiert.")
     screen.fill(MENU_BG)
     text = font.render("Training abgeschlossen!", True, (255,255,255))
@@ -46,13 +46,14 @@ class Game:
         return tuple(tuple(row) for row in self.board), self.turn
 
 class QLearningAI:
-    def __init__(self, player, alpha=0.1, gamma=0.9, epsilon=0.05, qfile="qtable.pkl"):
+    def __init__(self, player, alpha=0.1, gamma=0.9, epsilon=0.05, qfile="qtable.pkl", q_table=None):
         self.player = player
         self.alpha = alpha
         self.gamma = gamma
         self.epsilon = epsilon
         self.qfile = qfile
-        self.q_table = self.load_qtable()
+        self.update_log = None  # Liste (key, target) je Update, wenn gesetzt (siehe _selfplay_worker)
+        self.q_table = self.load_qtable() if q_table is None else dict(q_table)
         self.last_state = None
         self.last_move = None
 
@@ -85,38 +86,98 @@ class QLearningAI:
     def update(self, reward, new_state, done, game):
         if self.last_state is None or self.last_move is None:
             return
-        old_q = self.q_table.get((self.last_state, self.last_move), 0)
+        key = (self.last_state, self.last_move)
+        old_q = self.q_table.get(key, 0)
         future_q = 0 if done else max([self.q_table.get((new_state, m), 0) for m in game.get_valid_moves(self.player)] + [0])
-        self.q_table[(self.last_state, self.last_move)] = old_q + self.alpha * (reward + self.gamma * future_q - old_q)
+        target = reward + self.gamma * future_q
+        self.q_table[key] = old_q + self.alpha * (target - old_q)
+        if self.update_log is not None:
+            self.update_log.append((key, target))
 
-def train_ai_selfplay(episodes=5000, progress_callback=None):
+def play_selfplay_episode(ai_white, ai_black):
+    game = Game()
+    ai_black.last_state = None
+    ai_black.last_move = None
+    ai_white.last_state = None
+    ai_white.last_move = None
+    while not game.is_game_over():
+        if game.turn == 'w':
+            move = ai_white.choose_move(game)
+            game.make_move(move)
+        else:
+            move = ai_black.choose_move(game)
+            game.make_move(move)
+        if game.is_game_over():
+            if game.winner == 'b':
+                ai_black.update(1, game.get_state(), True, game)
+                ai_white.update(-500, game.get_state(), True, game)
+            elif game.winner == 'w':
+                ai_black.update(-500, game.get_state(), True, game)
+                ai_white.update(1, game.get_state(), True, game)
+            else:
+                ai_black.update(0.5, game.get_state(), True, game)
+                ai_white.update(0.5, game.get_state(), True, game)
+    return game.winner
+
+def _selfplay_worker(job):
+    # Läuft im Worker-Prozess: spielt auf einer lokalen Kopie der Tabellen und liefert die Updates der Reihe nach
+    black_table, white_table, episodes, seed = job
+    random.seed(seed)
+    ai_black = QLearningAI('b', epsilon=0.05, q_table=black_table)
+    ai_white = QLearningAI('w', epsilon=0.05, q_table=white_table)
+    ai_black.update_log = []
+    ai_white.update_log = []
+    for _ in range(episodes):
+        play_selfplay_episode(ai_white, ai_black)
+    return ai_black.update_log, ai_white.update_log
+
+def _replay_updates(ai, worker_logs):
+    # Die Updates aller Worker nacheinander auf die Haupttabelle anwenden. Jedes Update zieht den Wert
+    # nur um alpha Richtung Ziel, die Werte bleiben so im Bereich der Belohnungen
+    for log in worker_logs:
+        for key, target in log:
+            old_q = ai.q_table.get(key, 0)
+            ai.q_table[key] = old_q + ai.alpha * (target - old_q)
+
+PROGRESS_INTERVAL = 0.1  # Sekunden zwischen zwei progress_callback-Aufrufen, solange die Worker rechnen
+
+def _train_parallel(ai_black, ai_white, episodes, progress_callback, workers, sync_interval, seed):
+    from concurrent.futures import ProcessPoolExecutor, wait
+    rng = random.Random(seed)
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while done < episodes:
+            remaining = episodes - done
+            round_size = min(remaining, workers * sync_interval)
+            chunks = [round_size // workers + (1 if i < round_size % workers else 0) for i in range(workers)]
+            chunks = [n for n in chunks if n]
+            black_snapshot = ai_black.q_table
+            white_snapshot = ai_white.q_table
+            jobs = [(black_snapshot, white_snapshot, n, rng.getrandbits(32)) for n in chunks]
+            futures = [pool.submit(_selfplay_worker, job) for job in jobs]
+            # Auch während einer Runde regelmäßig melden, damit die GUI ihre Events abarbeiten kann
+            while progress_callback and wait(futures, timeout=PROGRESS_INTERVAL).not_done:
+                progress_callback(done)
+            results = [future.result() for future in futures]
+            _replay_updates(ai_black, [black for black, _ in results])
+            _replay_updates(ai_white, [white for _, white in results])
+            done += round_size
+            if progress_callback:
+                progress_callback(done)
+
+def train_ai_selfplay(episodes=5000, progress_callback=None, workers=1, sync_interval=500, seed=None):
+    # workers > 1 verteilt die Episoden auf Prozesse; alle sync_interval Episoden pro Worker wird zusammengeführt
     ai_black = QLearningAI('b', epsilon=0.05)
     ai_white = QLearningAI('w', epsilon=0.05, qfile="qtable_white.pkl")
-    for episode in range(episodes):
-        game = Game()
-        ai_black.last_state = None
-        ai_black.last_move = None
-        ai_white.last_state = None
-        ai_white.last_move = None
-        while not game.is_game_over():
-            if game.turn == 'w':
-                move = ai_white.choose_move(game)
-                game.make_move(move)
-            else:
-                move = ai_black.choose_move(game)
-                game.make_move(move)
-            if game.is_game_over():
-                if game.winner == 'b':
-                    ai_black.update(1, game.get_state(), True, game)
-                    ai_white.update(-500, game.get_state(), True, game)
-                elif game.winner == 'w':
-                    ai_black.update(-500, game.get_state(), True, game)
-                    ai_white.update(1, game.get_state(), True, game)
-                else:
-                    ai_black.update(0.5, game.get_state(), True, game)
-                    ai_white.update(0.5, game.get_state(), True, game)
-        if progress_callback and (episode+1) % 500 == 0:
-            progress_callback(episode+1)
+    if workers > 1:
+        _train_parallel(ai_black, ai_white, episodes, progress_callback, workers, sync_interval, seed)
+    else:
+        if seed is not None:
+            random.seed(seed)
+        for episode in range(episodes):
+            play_selfplay_episode(ai_white, ai_black)
+            if progress_callback and (episode+1) % 500 == 0:
+                progress_callback(episode+1)
     ai_black.save_qtable()
     ai_white.save_qtable()
 
@@ -1,9 +1,32 @@
 import random
 import pickle
 import os
-from flask import Flask, request, jsonify
+import sys
+import atexit
+import functools
+import json
+import math
+import ast
+import mmap
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict, Counter
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
 
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:  # WebSocket-Kanal ist optional, die HTTP-Endpunkte laufen auch ohne flask-sock
+    Sock = None
+
+try:
+    import numpy as np
+except ImportError:  # numpy wird nur für DenseQTable gebraucht
+    np = None
+
 BOARD_SIZE = 3
 
 class Game:
@@ -29,8 +52,10 @@ class Game:
         return moves
 
     def make_move(self, move):
+        # Gibt einen Undo-Satz zurück, mit dem unmake_move den Zug ohne Brettkopie zurücknimmt
         (r1, c1), (r2, c2) = move
         player = self.board[r1][c1]
+        undo = (move, self.board[r2][c2], self.turn, self.winner)
         self.board[r1][c1] = '.'
         self.board[r2][c2] = player
         if (player == 'w' and r2 == BOARD_SIZE - 1) or (player == 'b' and r2 == 0):
@@ -43,6 +68,21 @@ class Game:
             self.turn = 'b' if self.turn == 'w' else 'w'
             if not self.get_valid_moves(self.turn):
                 self.winner = "draw"
+        return undo
+
+    def unmake_move(self, undo):
+        ((r1, c1), (r2, c2)), captured, turn, winner = undo
+        self.board[r1][c1] = self.board[r2][c2]
+        self.board[r2][c2] = captured
+        self.turn = turn
+        self.winner = winner
+
+    def copy(self):
+        game = Game.__new__(Game)
+        game.board = [row[:] for row in self.board]
+        game.turn = self.turn
+        game.winner = self.winner
+        return game
 
     def is_game_over(self):
         return self.winner is not None or not self.get_valid_moves(self.turn)
@@ -50,27 +90,598 @@ class Game:
     def get_state(self):
         return tuple(tuple(row) for row in self.board), self.turn
 
+# --- Bitboard-Variante von Game ---
+# Feld (r, c) liegt auf Bit r*3 + c, pro Farbe eine Maske mit 9 Bits.
+FULL_MASK = (1 << BOARD_SIZE * BOARD_SIZE) - 1
+COL_LEFT = sum(1 << (r * BOARD_SIZE) for r in range(BOARD_SIZE))
+COL_RIGHT = COL_LEFT << (BOARD_SIZE - 1)
+ROW_TOP = (1 << BOARD_SIZE) - 1
+ROW_BOTTOM = ROW_TOP << (BOARD_SIZE * (BOARD_SIZE - 1))
+SQUARES = [divmod(sq, BOARD_SIZE) for sq in range(BOARD_SIZE * BOARD_SIZE)]
+MASK_BITS = [tuple(sq for sq in range(BOARD_SIZE * BOARD_SIZE) if mask >> sq & 1) for mask in range(FULL_MASK + 1)]
+_BB_MOVE_CACHE = {'w': {}, 'b': {}}
+_BB_STATE_CACHE = {}
+
+def _bitboard_moves(own, opp, player):
+    # Ziele aller Bauern auf einmal per Shift, Reihenfolge wie in Game.get_valid_moves
+    empty = FULL_MASK & ~(own | opp)
+    if player == 'w':
+        step = BOARD_SIZE
+        push = (own << step) & empty
+        cap_left = ((own & ~COL_LEFT) << (step - 1)) & opp
+        cap_right = ((own & ~COL_RIGHT) << (step + 1)) & opp
+    else:
+        step = -BOARD_SIZE
+        push = (own >> BOARD_SIZE) & empty
+        cap_left = ((own & ~COL_LEFT) >> (BOARD_SIZE + 1)) & opp
+        cap_right = ((own & ~COL_RIGHT) >> (BOARD_SIZE - 1)) & opp
+    # Nur die gesetzten Zielbits durchgehen, das Startfeld ergibt sich aus dem Shift
+    found = []
+    for kind, target, shift in ((0, push, step), (1, cap_left, step - 1), (2, cap_right, step + 1)):
+        for to in MASK_BITS[target]:
+            found.append((to - shift, kind, to))
+    found.sort()
+    return tuple((SQUARES[sq], SQUARES[to]) for sq, _, to in found)
+
+class BitboardGame:
+    def __init__(self):
+        self.white = ROW_TOP
+        self.black = ROW_BOTTOM
+        self.turn = 'w'
+        self.winner = None
+
+    @property
+    def board(self):
+        # Nur lesbar (Tupel): Änderungen gehen über den Setter oder make_move
+        return self.get_state()[0]
+
+    @board.setter
+    def board(self, board):
+        self.white = 0
+        self.black = 0
+        for r in range(BOARD_SIZE):
+            for c in range(BOARD_SIZE):
+                if board[r][c] == 'w':
+                    self.white |= 1 << (r * BOARD_SIZE + c)
+                elif board[r][c] == 'b':
+                    self.black |= 1 << (r * BOARD_SIZE + c)
+
+    def get_valid_moves(self, player):
+        # Zuglisten sind pro Stellung gecacht (als Tupel, damit niemand den Cache verändert)
+        key = self.white << 9 | self.black
+        cache = _BB_MOVE_CACHE[player]
+        moves = cache.get(key)
+        if moves is None:
+            if player == 'w':
+                moves = cache[key] = _bitboard_moves(self.white, self.black, player)
+            else:
+                moves = cache[key] = _bitboard_moves(self.black, self.white, player)
+        return moves
+
+    def make_move(self, move):
+        (r1, c1), (r2, c2) = move
+        src = 1 << (r1 * BOARD_SIZE + c1)
+        dst = 1 << (r2 * BOARD_SIZE + c2)
+        if self.white & src:
+            player = 'w'
+            self.white = (self.white & ~src) | dst
+            self.black &= ~dst
+        else:
+            player = 'b'
+            self.black = (self.black & ~src) | dst
+            self.white &= ~dst
+        if (player == 'w' and dst & ROW_BOTTOM) or (player == 'b' and dst & ROW_TOP):
+            self.winner = player
+        elif not self.black:
+            self.winner = 'w'
+        elif not self.white:
+            self.winner = 'b'
+        else:
+            self.turn = 'b' if self.turn == 'w' else 'w'
+            if not self.get_valid_moves(self.turn):
+                self.winner = "draw"
+
+    def is_game_over(self):
+        return self.winner is not None or not self.get_valid_moves(self.turn)
+
+    def copy(self):
+        game = BitboardGame.__new__(BitboardGame)
+        game.white = self.white
+        game.black = self.black
+        game.turn = self.turn
+        game.winner = self.winner
+        return game
+
+    def get_state(self):
+        key = self.white << 9 | self.black
+        board = _BB_STATE_CACHE.get(key)
+        if board is None:
+            rows = [['.'] * BOARD_SIZE for _ in range(BOARD_SIZE)]
+            for sq in MASK_BITS[self.white]:
+                r, c = SQUARES[sq]
+                rows[r][c] = 'w'
+            for sq in MASK_BITS[self.black]:
+                r, c = SQUARES[sq]
+                rows[r][c] = 'b'
+            board = _BB_STATE_CACHE[key] = tuple(tuple(row) for row in rows)
+        return board, self.turn
+
+# --- Ganzzahlige Kodierung von Stellungen und Zügen ---
+# Stellung: neun Felder zur Basis 3 ('.'=0, 'w'=1, 'b'=2) und ein Bit für den Spieler am Zug.
+# Zug: Startfeld * 3 + Richtung (0 = schlägt links, 1 = geradeaus, 2 = schlägt rechts).
+CELL_CODES = {'.': 0, 'w': 1, 'b': 2}
+CELL_CHARS = '.wb'
+NUM_CELLS = BOARD_SIZE * BOARD_SIZE
+NUM_STATES = 3 ** NUM_CELLS * 2
+NUM_MOVE_SLOTS = NUM_CELLS * 3
+_STATE_INDEX_CACHE = {}
+
+def state_index(state):
+    index = _STATE_INDEX_CACHE.get(state)
+    if index is None:
+        board, turn = state
+        index = 0
+        for row in board:
+            for cell in row:
+                index = index * 3 + CELL_CODES[cell]
+        index = _STATE_INDEX_CACHE[state] = index * 2 + (turn == 'b')
+    return index
+
+def index_state(index):
+    index, turn_bit = divmod(int(index), 2)
+    cells = []
+    for _ in range(NUM_CELLS):
+        index, code = divmod(index, 3)
+        cells.append(CELL_CHARS[code])
+    cells.reverse()
+    board = tuple(tuple(cells[r * BOARD_SIZE:(r + 1) * BOARD_SIZE]) for r in range(BOARD_SIZE))
+    return board, 'b' if turn_bit else 'w'
+
+def move_index(move):
+    (r1, c1), (r2, c2) = move
+    return (r1 * BOARD_SIZE + c1) * 3 + (c2 - c1 + 1)
+
+def index_move(slot, player):
+    square, direction = divmod(int(slot), 3)
+    r1, c1 = divmod(square, BOARD_SIZE)
+    r2 = r1 + (1 if player == 'w' else -1)
+    return (r1, c1), (r2, c1 + direction - 1)
+
+# --- Spiegelsymmetrie an der mittleren Spalte ---
+# Jede Stellung wird auf die Variante mit dem kleineren state_index abgebildet, Züge werden mitgespiegelt.
+# In spiegelsymmetrischen Stellungen sind Zug und Spiegelzug gleichwertig und teilen sich den kleineren Zug.
+_CANONICAL_CACHE = {}
+_SELF_MIRRORED = set()
+
+def mirror_state(state):
+    board, turn = state
+    return tuple(row[::-1] for row in board), turn
+
+def mirror_move(move):
+    (r1, c1), (r2, c2) = move
+    return (r1, BOARD_SIZE - 1 - c1), (r2, BOARD_SIZE - 1 - c2)
+
+def canonical_state(state):
+    # Liefert (kanonische Stellung, gespiegelt?)
+    entry = _CANONICAL_CACHE.get(state)
+    if entry is None:
+        mirrored = mirror_state(state)
+        if state_index(mirrored) < state_index(state):
+            entry = (mirrored, True)
+        else:
+            entry = (state, False)
+            if mirrored == state:
+                _SELF_MIRRORED.add(state)
+        _CANONICAL_CACHE[state] = entry
+    return entry
+
+def canonical_key(state, move):
+    state, flipped = canonical_state(state)
+    if flipped:
+        return state, mirror_move(move)
+    if state in _SELF_MIRRORED:
+        return state, min(move, mirror_move(move))
+    return state, move
+
+def canonicalize_qtable(table):
+    # Einmalige Migration alter Tabellen: Spiegelpaare werden gemittelt
+    merged = {}
+    for (state, move), value in table.items():
+        key = canonical_key(state, move)
+        total, count = merged.get(key, (0, 0))
+        merged[key] = (total + value, count + 1)
+    return {key: total / count for key, (total, count) in merged.items()}
+
+def migrate_qtable_symmetric(qfile):
+    write_qtable_file(qfile, canonicalize_qtable(read_qtable_file(qfile)))
+
+MIRROR_SLOTS = [move_index(mirror_move(index_move(slot, 'w'))) for slot in range(NUM_MOVE_SLOTS)]
+CANONICAL_SLOTS = [min(slot, mirror) for slot, mirror in enumerate(MIRROR_SLOTS)]  # für spiegelsymmetrische Stellungen
+_MIRROR_INDICES = None
+
+def mirror_state_indices():
+    # state_index(mirror_state(index_state(i))) für alle i als numpy-Array (wird beim ersten Aufruf berechnet)
+    global _MIRROR_INDICES
+    if _MIRROR_INDICES is None:
+        boards, turns = np.divmod(np.arange(NUM_STATES, dtype=np.int64), 2)
+        powers = 3 ** np.arange(NUM_CELLS - 1, -1, -1, dtype=np.int64)
+        cells = boards[:, None] // powers % 3
+        mirrored = cells.reshape(-1, BOARD_SIZE, BOARD_SIZE)[:, :, ::-1].reshape(-1, NUM_CELLS)
+        _MIRROR_INDICES = (mirrored @ powers) * 2 + turns
+    return _MIRROR_INDICES
+
+class DenseQTable:
+    # Q-Werte als float32-Array (Stellungen x Zug-Slots), Zugriff wie beim Dict über (state, move).
+    # Im Zug-für-Zug-Training etwa so schnell wie das Dict, den Gewinn bringt erst der VectorEnv-Pfad.
+    def __init__(self):
+        if np is None:
+            raise ImportError("DenseQTable benötigt numpy")
+        self.values = np.zeros((NUM_STATES, NUM_MOVE_SLOTS), dtype=np.float32)
+        self.known = np.zeros((NUM_STATES, NUM_MOVE_SLOTS), dtype=bool)
+
+    @classmethod
+    def from_dict(cls, table):
+        dense = cls()
+        for key, value in table.items():
+            dense[key] = value
+        return dense
+
+    @classmethod
+    def from_records(cls, records):
+        # records mit QTABLE_DTYPE, z.B. QTableFile.records(): ohne Umweg über Python-Tupel
+        dense = cls()
+        dense.values[records["state"], records["move"]] = records["value"]
+        dense.known[records["state"], records["move"]] = True
+        return dense
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def is_canonical(self):
+        # Gleiche Prüfung wie canonical_key(state, move) == (state, move) für alle Einträge
+        rows, cols = np.nonzero(self.known)
+        mirrored = mirror_state_indices()[rows]
+        same = (mirrored == rows) & (cols != np.array(CANONICAL_SLOTS)[cols])
+        return not ((mirrored < rows).any() or same.any())
+
+    def copy(self):
+        dense = DenseQTable.__new__(DenseQTable)
+        dense.values = self.values.copy()
+        dense.known = self.known.copy()
+        return dense
+
+    def get(self, key, default=0):
+        i, j = state_index(key[0]), move_index(key[1])
+        if self.known[i, j]:
+            return float(self.values[i, j])
+        return default
+
+    def __getitem__(self, key):
+        i, j = state_index(key[0]), move_index(key[1])
+        if not self.known[i, j]:
+            raise KeyError(key)
+        return float(self.values[i, j])
+
+    def __setitem__(self, key, value):
+        i, j = state_index(key[0]), move_index(key[1])
+        self.values[i, j] = value
+        self.known[i, j] = True
+
+    def __contains__(self, key):
+        return bool(self.known[state_index(key[0]), move_index(key[1])])
+
+    def __len__(self):
+        return int(self.known.sum())
+
+    def items(self):
+        for i, j in np.argwhere(self.known):
+            state = index_state(i)
+            yield (state, index_move(j, state[1])), float(self.values[i, j])
+
+    def q_values(self, state, moves):
+        # Unbekannte Einträge sind 0, genau wie dict.get(key, 0). Die Zeile wird als Liste geholt:
+        # Fancy-Indexing kostet bei den wenigen Zügen pro Stellung ein Vielfaches davon.
+        row = self.values[state_index(state)].tolist()
+        return [row[move_index(m)] for m in moves]
+
+    def update(self, state, move, target, alpha):
+        i, j = state_index(state), move_index(move)
+        delta = float(target - self.values[i, j])
+        self.values[i, j] += alpha * delta
+        self.known[i, j] = True
+        return delta
+
+    def __getstate__(self):
+        # Nur belegte Einträge pickeln, das volle Array ist größtenteils leer
+        rows, cols = np.nonzero(self.known)
+        return {"rows": rows.astype(np.uint32), "cols": cols.astype(np.uint8), "values": self.values[rows, cols]}
+
+    def __setstate__(self, data):
+        self.__init__()
+        self.values[data["rows"], data["cols"]] = data["values"]
+        self.known[data["rows"], data["cols"]] = True
+
+# --- Binäres Q-Table-Format ---
+# Kopf: Magic, Version, Satzgröße, Anzahl. Danach nach (state_id, move_id) sortierte Sätze
+# (uint32 state_index, uint32 move_index, float32 Wert), little-endian.
+QTABLE_MAGIC = b"BSQT"
+QTABLE_VERSION = 1
+QTABLE_HEADER = struct.Struct("<4sHHI")
+QTABLE_RECORD = struct.Struct("<IIf")
+if np is not None:
+    QTABLE_DTYPE = np.dtype([("state", "<u4"), ("move", "<u4"), ("value", "<f4")])
+
+class QTableFile:
+    # Schreibgeschützter Zugriff per mmap, Lookups per binärer Suche ohne die Datei einzulesen
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path}: leere Datei")
+        if len(self._mm) < QTABLE_HEADER.size:
+            self.close()
+            raise ValueError(f"{path}: kein Q-Table-Kopf")
+        magic, version, record_size, count = QTABLE_HEADER.unpack_from(self._mm, 0)
+        if magic != QTABLE_MAGIC or version != QTABLE_VERSION or record_size != QTABLE_RECORD.size:
+            self.close()
+            raise ValueError(f"{path}: unbekanntes Q-Table-Format")
+        if QTABLE_HEADER.size + count * record_size > len(self._mm):
+            self.close()
+            raise ValueError(f"{path}: Datei ist abgeschnitten")
+        self.count = count
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def record(self, i):
+        return QTABLE_RECORD.unpack_from(self._mm, QTABLE_HEADER.size + i * QTABLE_RECORD.size)
+
+    def lookup(self, state_id, move_id, default=None):
+        lo, hi = 0, self.count
+        target = (state_id, move_id)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            s, m, value = self.record(mid)
+            if (s, m) < target:
+                lo = mid + 1
+            elif (s, m) > target:
+                hi = mid
+            else:
+                return value
+        return default
+
+    def get(self, key, default=0):
+        return self.lookup(state_index(key[0]), move_index(key[1]), default)
+
+    def __contains__(self, key):
+        return self.lookup(state_index(key[0]), move_index(key[1])) is not None
+
+    def records(self):
+        # Mit numpy ein Array direkt auf dem mmap (ohne Kopie), sonst Tupel
+        if np is not None:
+            return np.frombuffer(self._mm, dtype=QTABLE_DTYPE, count=self.count, offset=QTABLE_HEADER.size)
+        return [self.record(i) for i in range(self.count)]
+
+    def items(self):
+        for i in range(self.count):
+            state_id, move_id, value = self.record(i)
+            state = index_state(state_id)
+            yield (state, index_move(move_id, state[1])), value
+
+def _legacy_key(key):
+    # Ganz alte Tabellen (z.B. Lokal/qtable_bauernschach.pkl) nutzen str(board) + turn und str(move) als Schlüssel
+    state, move = key
+    if isinstance(state, str):
+        board = tuple(tuple(row) for row in ast.literal_eval(state[:-1]))
+        state = (board, state[-1])
+    if isinstance(move, str):
+        move = tuple(tuple(square) for square in ast.literal_eval(move))
+    return state, move
+
+def read_qtable_file(path, dense=False):
+    # Liest das Binärformat; alte Pickle-Dateien werden noch erkannt (siehe convert_qtable_pickle).
+    # dense=True liefert eine DenseQTable, beim Binärformat direkt aus den Sätzen im mmap.
+    with open(path, "rb") as f:
+        magic = f.read(len(QTABLE_MAGIC))
+    if magic == QTABLE_MAGIC:
+        with QTableFile(path) as qf:
+            if dense:
+                return DenseQTable.from_records(qf.records())
+            return dict(qf.items())
+    with open(path, "rb") as f:
+        table = pickle.load(f)
+    if isinstance(table, DenseQTable):
+        return table if dense else table.to_dict()
+    table = {_legacy_key(key): value for key, value in table.items()}
+    return DenseQTable.from_dict(table) if dense else table
+
+def write_qtable_file(path, table):
+    # Atomar: erst in eine Temp-Datei im selben Ordner schreiben, dann per os.replace umbenennen
+    if isinstance(table, DenseQTable):
+        rows, cols = np.nonzero(table.known)
+        data = np.empty(len(rows), dtype=QTABLE_DTYPE)
+        data["state"], data["move"], data["value"] = rows, cols, table.values[rows, cols]
+        payload = data.tobytes()
+        count = len(rows)
+    else:
+        records = sorted((state_index(state), move_index(move), value) for (state, move), value in table.items())
+        payload = b"".join(QTABLE_RECORD.pack(*record) for record in records)
+        count = len(records)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".qtable-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(QTABLE_HEADER.pack(QTABLE_MAGIC, QTABLE_VERSION, QTABLE_RECORD.size, count))
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Journal: nur geänderte Einträge werden angehängt (gleiche Sätze wie im Binärformat).
+# Beim Laden gilt Snapshot + "<qfile>.journal.compacting" + "<qfile>.journal", spätere Sätze gewinnen.
+QTABLE_JOURNAL_MAGIC = b"BSQJ"
+QTABLE_JOURNAL_HEADER = struct.Struct("<4sHH")
+
+def append_qtable_journal(path, items):
+    new_file = not os.path.exists(path) or os.path.getsize(path) < QTABLE_JOURNAL_HEADER.size
+    with open(path, "wb" if new_file else "ab") as f:
+        if new_file:
+            f.write(QTABLE_JOURNAL_HEADER.pack(QTABLE_JOURNAL_MAGIC, QTABLE_VERSION, QTABLE_RECORD.size))
+        f.write(b"".join(QTABLE_RECORD.pack(state_index(state), move_index(move), value) for (state, move), value in items))
+        f.flush()
+        os.fsync(f.fileno())
+
+def replay_qtable_journal(path, table):
+    if not os.path.exists(path):
+        return table
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < QTABLE_JOURNAL_HEADER.size:
+        return table
+    magic, version, record_size = QTABLE_JOURNAL_HEADER.unpack_from(data, 0)
+    if magic != QTABLE_JOURNAL_MAGIC or version != QTABLE_VERSION or record_size != QTABLE_RECORD.size:
+        raise ValueError(f"{path}: unbekanntes Journal-Format")
+    # Ein halb geschriebener letzter Satz (Absturz beim Anhängen) wird ignoriert
+    end = QTABLE_JOURNAL_HEADER.size + (len(data) - QTABLE_JOURNAL_HEADER.size) // record_size * record_size
+    for state_id, move_id, value in QTABLE_RECORD.iter_unpack(data[QTABLE_JOURNAL_HEADER.size:end]):
+        state = index_state(state_id)
+        table[(state, index_move(move_id, state[1]))] = value
+    return table
+
+def convert_qtable_pickle(pkl_path, bin_path=None):
+    if bin_path is None:
+        bin_path = os.path.splitext(pkl_path)[0] + ".bin"
+    write_qtable_file(bin_path, read_qtable_file(pkl_path))
+    return bin_path
+
 # KI-Klassen und Training wie gehabt (optional, für PvE/Training)
 class QLearningAI:
-    def __init__(self, player, alpha=0.1, gamma=0.9, epsilon=0.05, qfile="qtable.pkl"):
+    # backend="dict" (Standard) oder "dense" für die numpy-Tabelle DenseQTable.
+    # symmetric=True legt gespiegelte Stellungen auf einen gemeinsamen Eintrag (siehe canonical_key).
+    # save_qtable hängt nur geänderte Einträge an "<qfile>.journal" an; ab journal_limit Bytes wird
+    # das Journal in den Snapshot übernommen (mit background_compaction in einem eigenen Thread).
+    def __init__(self, player, alpha=0.1, gamma=0.9, epsilon=0.05, qfile="qtable.bin", backend="dict", q_table=None,
+                 symmetric=True, journal_limit=64 * 1024, background_compaction=True):
         self.player = player
         self.alpha = alpha
         self.gamma = gamma
         self.epsilon = epsilon
         self.qfile = qfile
-        self.q_table = self.load_qtable()
+        self.backend = backend
+        self.symmetric = symmetric
+        self.journal_file = qfile + ".journal"
+        self.journal_limit = journal_limit
+        self.background_compaction = background_compaction
+        self.dirty = set()
+        self.dirty_all = False
+        self._compaction = None
+        self.td_error_sum = 0.0  # Summe |TD-Fehler| seit dem letzten Auslesen (siehe TrainingMonitor)
+        self.td_updates = 0
+        self.update_log = None  # Liste (key, target) je Update, wenn gesetzt (siehe _selfplay_worker)
+        self.q_table = self.load_qtable() if q_table is None else self._convert_table(q_table)
         self.last_state = None
         self.last_move = None
 
+    def _convert_table(self, table):
+        if self.backend == "dense":
+            return table if isinstance(table, DenseQTable) else DenseQTable.from_dict(table)
+        return table.to_dict() if isinstance(table, DenseQTable) else dict(table)
+
     def load_qtable(self):
+        dense = self.backend == "dense"
+        table = DenseQTable() if dense else {}
+        legacy = os.path.splitext(self.qfile)[0] + ".pkl"
+        if not os.path.exists(self.qfile) and legacy != self.qfile and os.path.exists(legacy):
+            convert_qtable_pickle(legacy, self.qfile)
         if os.path.exists(self.qfile):
-            with open(self.qfile, "rb") as f:
-                return pickle.load(f)
-        return {}
+            table = read_qtable_file(self.qfile, dense=dense)
+        replay_qtable_journal(self.journal_file + ".compacting", table)
+        replay_qtable_journal(self.journal_file, table)
+        if self.symmetric:
+            if dense:
+                if not table.is_canonical():
+                    table = canonicalize_qtable(table.to_dict())
+            elif any(canonical_key(state, move) != (state, move) for state, move in table):
+                table = canonicalize_qtable(table)
+        return self._convert_table(table)
+
+    def _key(self, state, move):
+        return canonical_key(state, move) if self.symmetric else (state, move)
+
+    def _q_values(self, state, moves):
+        if self.symmetric:
+            state, flipped = canonical_state(state)
+            if flipped:
+                moves = [mirror_move(m) for m in moves]
+            elif state in _SELF_MIRRORED:
+                moves = [min(m, mirror_move(m)) for m in moves]
+        if self.backend == "dense":
+            return self.q_table.q_values(state, moves)
+        return [self.q_table.get((state, m), 0) for m in moves]
 
     def save_qtable(self):
-        with open(self.qfile, "wb") as f:
-            pickle.dump(self.q_table, f)
+        self.wait_for_compaction()
+        if self.dirty_all or not os.path.exists(self.qfile) or len(self.dirty) * 2 > len(self.q_table):
+            # Viele Änderungen (z.B. nach dem Training): gleich einen neuen Snapshot schreiben
+            write_qtable_file(self.qfile, self.q_table)
+            for path in (self.journal_file, self.journal_file + ".compacting"):
+                if os.path.exists(path):
+                    os.remove(path)
+        else:
+            if self.dirty:
+                append_qtable_journal(self.journal_file, [(key, self.q_table.get(key, 0)) for key in self.dirty])
+            if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > self.journal_limit:
+                self.compact_qtable()
+        self.dirty.clear()
+        self.dirty_all = False
+
+    def compact_qtable(self):
+        # Das Journal wird umbenannt, neue Sätze landen in einem frischen Journal; der Snapshot
+        # entsteht aus einer Kopie der Tabelle, die genau dem Stand des umbenannten Journals entspricht.
+        compacting = self.journal_file + ".compacting"
+        if os.path.exists(compacting):
+            # Rest einer abgebrochenen Verdichtung: nicht überschreiben, sondern sofort einen Snapshot
+            # schreiben, der den Stand beider Journale enthält
+            write_qtable_file(self.qfile, self.q_table)
+            os.remove(compacting)
+            os.remove(self.journal_file)
+            return
+        os.replace(self.journal_file, compacting)
+        table = self.q_table.copy()
+
+        def compact():
+            write_qtable_file(self.qfile, table)
+            os.remove(compacting)
+
+        if self.background_compaction:
+            self._compaction = threading.Thread(target=compact, name="qtable-compaction")
+            self._compaction.start()
+        else:
+            compact()
+
+    def wait_for_compaction(self):
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
 
     def choose_move(self, game):
         state = game.get_state()
@@ -80,7 +691,7 @@ class QLearningAI:
         if random.random() < self.epsilon:
             move = random.choice(moves)
         else:
-            qs = [self.q_table.get((state, m), 0) for m in moves]
+            qs = self._q_values(state, moves)
             max_q = max(qs)
             best_moves = [m for m, q in zip(moves, qs) if q == max_q]
             move = random.choice(best_moves)
@@ -91,58 +702,1161 @@ class QLearningAI:
     def update(self, reward, new_state, done, game):
         if self.last_state is None or self.last_move is None:
             return
-        old_q = self.q_table.get((self.last_state, self.last_move), 0)
-        future_q = 0 if done else max([self.q_table.get((new_state, m), 0) for m in game.get_valid_moves(self.player)] + [0])
-        self.q_table[(self.last_state, self.last_move)] = old_q + self.alpha * (reward + self.gamma * future_q - old_q)
-
-def train_ai_selfplay(episodes=5000, progress_callback=None):
-    ai_black = QLearningAI('b', epsilon=0.05)
-    ai_white = QLearningAI('w', epsilon=0.05, qfile="qtable_white.pkl")
-    for episode in range(episodes):
-        game = Game()
-        ai_black.last_state = None
-        ai_black.last_move = None
-        ai_white.last_state = None
-        ai_white.last_move = None
-        while not game.is_game_over():
-            if game.turn == 'w':
-                move = ai_white.choose_move(game)
-                game.make_move(move)
+        key = self._key(self.last_state, self.last_move)
+        if self.backend == "dense":
+            future_q = 0
+            if not done:
+                moves = game.get_valid_moves(self.player)
+                if moves:
+                    future_q = max(max(self._q_values(new_state, moves)), 0)
+            target = reward + self.gamma * future_q
+            delta = self.q_table.update(key[0], key[1], target, self.alpha)
+            if self.update_log is not None:
+                self.update_log.append((key, target))
+            self.td_error_sum += abs(delta)
+            self.td_updates += 1
+            self.dirty.add(key)
+            return
+        old_q = self.q_table.get(key, 0)
+        future_q = 0 if done else max(list(self._q_values(new_state, game.get_valid_moves(self.player))) + [0])
+        target = reward + self.gamma * future_q
+        delta = target - old_q
+        self.q_table[key] = old_q + self.alpha * delta
+        if self.update_log is not None:
+            self.update_log.append((key, target))
+        self.td_error_sum += abs(delta)
+        self.td_updates += 1
+        self.dirty.add(key)
+
+    # Batch-Varianten für VectorEnv (nur mit backend="dense")
+    def choose_moves_batch(self, state_indices, legal, rng, mirrored_indices=None):
+        # Mit mirrored_indices werden die Werte wie bei canonical_key aus der kanonischen Zeile gelesen,
+        # jeder Slot an der Stelle, unter der canonical_key ihn ablegt.
+        q = self.q_table.values[state_indices]
+        if self.symmetric and mirrored_indices is not None:
+            flipped = mirrored_indices < state_indices
+            same = mirrored_indices == state_indices
+            q = self.q_table.values[np.minimum(state_indices, mirrored_indices)]
+            q = np.where(flipped[:, None], q[:, MIRROR_SLOTS], np.where(same[:, None], q[:, CANONICAL_SLOTS], q))
+        q = np.where(legal, q, -np.inf)
+        best = legal & (q == q.max(axis=1, keepdims=True))
+        explore = rng.random(len(state_indices)) < self.epsilon
+        candidates = np.where(explore[:, None], legal, best)
+        # Zufällige Auswahl unter den Kandidaten jeder Zeile
+        return np.where(candidates, rng.random(candidates.shape), -1.0).argmax(axis=1)
+
+    def update_batch(self, state_indices, slots, rewards, mirrored_indices=None):
+        # Nur Endzustände (done=True), wie in play_selfplay_episode
+        if self.symmetric and mirrored_indices is not None:
+            flipped = mirrored_indices < state_indices
+            same = mirrored_indices == state_indices
+            state_indices = np.where(flipped, mirrored_indices, state_indices)
+            slots = np.where(flipped, np.array(MIRROR_SLOTS)[slots], np.where(same, np.array(CANONICAL_SLOTS)[slots], slots))
+        values = self.q_table.values
+        old_q = values[state_indices, slots]
+        values[state_indices, slots] = old_q + self.alpha * (rewards - old_q)
+        self.q_table.known[state_indices, slots] = True
+        self.td_error_sum += float(np.abs(rewards - old_q).sum())
+        self.td_updates += len(slots)
+        self.dirty_all = True
+
+# --- Perfektes Spiel: der komplette Spielbaum wird einmal gelöst ---
+_PERFECT_TABLE = None
+
+def solve_game():
+    """Negamax mit Memo über alle erreichbaren Stellungen ab Game().
+
+    Liefert state -> (wert, halbzüge, beste_züge), wert aus Sicht des Spielers am Zug
+    (1 Sieg, 0 Remis, -1 Niederlage). Endstellungen sind nicht enthalten.
+    """
+    table = {}
+
+    def negamax(game):
+        state = game.get_state()
+        entry = table.get(state)
+        if entry is not None:
+            return entry
+        player = game.turn
+        scored = []
+        for move in game.get_valid_moves(player):
+            child = game.copy()
+            child.make_move(move)
+            if child.winner == player:
+                value, plies = 1, 1
+            elif child.winner == "draw":
+                value, plies = 0, 1
             else:
-                move = ai_black.choose_move(game)
-                game.make_move(move)
-            if game.is_game_over():
-                if game.winner == 'b':
-                    ai_black.update(1, game.get_state(), True, game)
-                    ai_white.update(-500, game.get_state(), True, game)
-                elif game.winner == 'w':
-                    ai_black.update(-500, game.get_state(), True, game)
-                    ai_white.update(1, game.get_state(), True, game)
+                child_value, child_plies, _ = negamax(child)
+                value, plies = -child_value, child_plies + 1
+            scored.append(((value, -plies * value), value, plies, move))
+        # Schnellster Sieg bzw. spätester Verlust zuerst
+        best_key = max(s[0] for s in scored)
+        best = [s for s in scored if s[0] == best_key]
+        entry = table[state] = (best[0][1], best[0][2], tuple(s[3] for s in best))
+        return entry
+
+    negamax(BitboardGame())
+    return table
+
+def perfect_table():
+    global _PERFECT_TABLE
+    if _PERFECT_TABLE is None:
+        _PERFECT_TABLE = solve_game()
+    return _PERFECT_TABLE
+
+class PerfectAI:
+    # Gleiche Schnittstelle wie QLearningAI, aber ohne Training: jeder Zug ist ein Dict-Lookup
+    def __init__(self, player):
+        self.player = player
+        self.table = perfect_table()
+        self.last_state = None
+        self.last_move = None
+
+    def choose_move(self, game):
+        state = game.get_state()
+        entry = self.table.get(state)
+        if entry is not None and state[1] == self.player:
+            move = random.choice(entry[2])
+        else:
+            moves = game.get_valid_moves(self.player)
+            if not moves:
+                return None
+            move = random.choice(moves)
+        self.last_state = state
+        self.last_move = move
+        return move
+
+    def value(self, game):
+        entry = self.table.get(game.get_state())
+        return None if entry is None else entry[0]
+
+    def update(self, reward, new_state, done, game):
+        pass
+
+    def save_qtable(self):
+        pass
+
+class PolicyAI:
+    # Nur-Lese-Spieler für den Server (/ai_move): die Q-Table bleibt per QTableFile eingeblendet, diese Seiten
+    # teilt das Betriebssystem zwischen allen (geforkten) Worker-Prozessen. Das Journal ist klein und liegt
+    # als Dict obendrauf. Stellungen ohne einen einzigen Eintrag übernimmt PerfectAI.
+    def __init__(self, player, qfile, symmetric=True):
+        self.player = player
+        self.symmetric = symmetric
+        legacy = os.path.splitext(qfile)[0] + ".pkl"
+        if not os.path.exists(qfile) and legacy != qfile and os.path.exists(legacy):
+            convert_qtable_pickle(legacy, qfile)
+        self.table = QTableFile(qfile) if os.path.exists(qfile) else None
+        self.overlay = {}
+        replay_qtable_journal(qfile + ".journal.compacting", self.overlay)
+        replay_qtable_journal(qfile + ".journal", self.overlay)
+        self.fallback = PerfectAI(player)
+        self.last_state = None
+        self.last_move = None
+
+    def q_value(self, state, move):
+        key = canonical_key(state, move) if self.symmetric else (state, move)
+        value = self.overlay.get(key)
+        if value is None and self.table is not None:
+            value = self.table.lookup(state_index(key[0]), move_index(key[1]))
+        return value
+
+    def choose_move(self, game):
+        state = game.get_state()
+        moves = game.get_valid_moves(self.player)
+        if not moves:
+            return None
+        qs = [self.q_value(state, m) for m in moves]
+        if all(q is None for q in qs):
+            move = self.fallback.choose_move(game)
+        else:
+            qs = [0 if q is None else q for q in qs]
+            max_q = max(qs)
+            move = random.choice([m for m, q in zip(moves, qs) if q == max_q])
+        self.last_state = state
+        self.last_move = move
+        return move
+
+    def update(self, reward, new_state, done, game):
+        pass
+
+    def save_qtable(self):
+        pass
+
+# --- Alpha-Beta-Suche ---
+# Zobrist-Schlüssel: eine Zufallszahl je (Feld, Stein) und eine für "Schwarz am Zug", fest geseedet
+_ZOBRIST_RNG = random.Random(0x5EA5C4)
+ZOBRIST = [{'w': _ZOBRIST_RNG.getrandbits(64), 'b': _ZOBRIST_RNG.getrandbits(64), '.': 0} for _ in range(NUM_CELLS)]
+ZOBRIST_BLACK = _ZOBRIST_RNG.getrandbits(64)
+SEARCH_WIN = 1000  # Sieg in n Halbzügen: SEARCH_WIN - n, schnellere Siege zählen mehr
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+def zobrist_key(game):
+    key = ZOBRIST_BLACK if game.turn == 'b' else 0
+    for r in range(BOARD_SIZE):
+        for c in range(BOARD_SIZE):
+            key ^= ZOBRIST[r * BOARD_SIZE + c][game.board[r][c]]
+    return key
+
+class SearchTimeout(Exception):
+    pass
+
+class SearchAI:
+    # Gleiche Schnittstelle wie QLearningAI, aber ohne Tabelle: iterative Vertiefung mit Negamax und Alpha-Beta
+    # auf einer Kopie der Partie (Züge per make_move/unmake_move). Umwandlungen und Schlagzüge werden zuerst
+    # probiert, davor der beste Zug aus der Transpositionstabelle. Die Tabelle hat tt_size feste Plätze
+    # (Zobrist-Schlüssel modulo tt_size); ein Eintrag wird ersetzt, wenn er aus einer früheren Suche stammt
+    # oder der neue mindestens so tief gesucht wurde. time_budget: Sekunden pro Zug, die letzte fertige Tiefe zählt.
+    def __init__(self, player, time_budget=0.2, max_depth=32, tt_size=1 << 16):
+        self.player = player
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.tt_size = tt_size
+        self.table = [None] * tt_size  # (schlüssel, tiefe, wert, art, bester zug, suche)
+        self.age = 0
+        self.nodes = 0
+        self.depth = 0  # zuletzt fertig durchsuchte Tiefe
+        self.deadline = None
+        self.lock = threading.Lock()  # eine Suche gleichzeitig pro Instanz (Server-Threads)
+        self.last_state = None
+        self.last_move = None
+
+    def choose_move(self, game, time_budget=None):
+        moves = game.get_valid_moves(self.player)
+        if not moves:
+            return None
+        with self.lock:
+            move = self.search(game, self.time_budget if time_budget is None else time_budget)
+        self.last_state = game.get_state()
+        self.last_move = move
+        return move
+
+    def search(self, game, time_budget):
+        root = Game.__new__(Game)
+        root.board = [list(row) for row in game.board]
+        root.turn = game.turn
+        root.winner = game.winner
+        key = zobrist_key(root)
+        moves = root.get_valid_moves(root.turn)
+        random.shuffle(moves)  # gleich gute Züge in zufälliger Reihenfolge, wie bei den anderen KIs
+        self.age += 1
+        self.nodes = 0
+        self.deadline = time.perf_counter() + time_budget
+        best_move = self.order_moves(root, moves, None)[0]
+        self.depth = 0
+        for depth in range(1, self.max_depth + 1):
+            try:
+                value, move = self.search_root(root, moves, depth, key)
+            except SearchTimeout:
+                break
+            best_move = move
+            self.depth = depth
+            if abs(value) >= SEARCH_WIN - self.max_depth:
+                break  # Ergebnis steht fest, tiefer suchen ändert nichts
+        return best_move
+
+    def search_root(self, game, moves, depth, key):
+        alpha, beta = -SEARCH_WIN - 1, SEARCH_WIN + 1
+        best_value, best_move = None, None
+        for move in self.order_moves(game, moves, self.tt_move(key)):
+            value = -self.child_value(game, move, depth, -beta, -alpha, 0, key)
+            if best_value is None or value > best_value:
+                best_value, best_move = value, move
+            alpha = max(alpha, value)
+        self.store(key, depth, best_value, TT_EXACT, best_move, 0)
+        return best_value, best_move
+
+    def child_value(self, game, move, depth, alpha, beta, ply, key):
+        # Wert der Stellung nach move aus Sicht des Gegners (der Aufrufer negiert)
+        player = game.turn
+        (r1, c1), (r2, c2) = move
+        sq_from, sq_to = r1 * BOARD_SIZE + c1, r2 * BOARD_SIZE + c2
+        child_key = (key ^ ZOBRIST[sq_from][player] ^ ZOBRIST[sq_to][game.board[r2][c2]]
+                     ^ ZOBRIST[sq_to][player] ^ ZOBRIST_BLACK)
+        undo = game.make_move(move)
+        try:
+            if game.winner == player:
+                return -(SEARCH_WIN - ply - 1)
+            if game.winner == "draw":
+                return 0
+            return self.negamax(game, depth - 1, alpha, beta, ply + 1, child_key)
+        finally:
+            game.unmake_move(undo)
+
+    def negamax(self, game, depth, alpha, beta, ply, key):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        if depth <= 0:
+            return self.evaluate(game)
+        entry = self.table[key % self.tt_size]
+        tt_move = None
+        if entry is not None and entry[0] == key:
+            tt_move = entry[4]
+            if entry[1] >= depth:
+                value = self.from_tt(entry[2], ply)
+                if entry[3] == TT_EXACT:
+                    return value
+                if entry[3] == TT_LOWER:
+                    alpha = max(alpha, value)
                 else:
-                    ai_black.update(0.5, game.get_state(), True, game)
-                    ai_white.update(0.5, game.get_state(), True, game)
-        if progress_callback and (episode+1) % 500 == 0:
-            progress_callback(episode+1)
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+        alpha_start = alpha
+        best_value, best_move = -SEARCH_WIN - 1, None
+        for move in self.order_moves(game, game.get_valid_moves(game.turn), tt_move):
+            value = -self.child_value(game, move, depth, -beta, -alpha, ply, key)
+            if value > best_value:
+                best_value, best_move = value, move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        if best_value <= alpha_start:
+            flag = TT_UPPER
+        elif best_value >= beta:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+        self.store(key, depth, best_value, flag, best_move, ply)
+        return best_value
+
+    def order_moves(self, game, moves, tt_move):
+        # Zuerst der Zug aus der Tabelle, dann Umwandlungen, dann Schlagzüge, dann der Rest
+        last_row = BOARD_SIZE - 1 if game.turn == 'w' else 0
+
+        def rank(move):
+            if move == tt_move:
+                return 0
+            (_, _), (r2, c2) = move
+            if r2 == last_row:
+                return 1
+            if game.board[r2][c2] != '.':
+                return 2
+            return 3
+
+        return sorted(moves, key=rank)
+
+    def evaluate(self, game):
+        # Grobe Bewertung für den Spieler am Zug: Bauern zählen 10, jede Reihe Fortschritt 1 dazu
+        score = 0
+        for r in range(BOARD_SIZE):
+            for c in range(BOARD_SIZE):
+                piece = game.board[r][c]
+                if piece == 'w':
+                    value = 10 + r
+                elif piece == 'b':
+                    value = 10 + BOARD_SIZE - 1 - r
+                else:
+                    continue
+                score += value if piece == game.turn else -value
+        return score
+
+    def tt_move(self, key):
+        entry = self.table[key % self.tt_size]
+        return entry[4] if entry is not None and entry[0] == key else None
+
+    def store(self, key, depth, value, flag, move, ply):
+        slot = key % self.tt_size
+        entry = self.table[slot]
+        if entry is None or entry[0] == key or entry[5] != self.age or depth >= entry[1]:
+            self.table[slot] = (key, depth, self.to_tt(value, ply), flag, move, self.age)
+
+    @staticmethod
+    def to_tt(value, ply):
+        # Siegwerte hängen vom Abstand zur Wurzel ab, in der Tabelle stehen sie relativ zur Stellung
+        if value >= SEARCH_WIN - 100:
+            return value + ply
+        if value <= -SEARCH_WIN + 100:
+            return value - ply
+        return value
+
+    @staticmethod
+    def from_tt(value, ply):
+        if value >= SEARCH_WIN - 100:
+            return value - ply
+        if value <= -SEARCH_WIN + 100:
+            return value + ply
+        return value
+
+    def update(self, reward, new_state, done, game):
+        pass
+
+    def save_qtable(self):
+        pass
+
+# --- K Partien gleichzeitig als numpy-Array ---
+# Felder: 0 leer, 1 weiß, 2 schwarz (wie CELL_CODES); turns: 0 weiß, 1 schwarz;
+# winners: 0 läuft, 1 weiß, 2 schwarz, 3 remis. Züge sind Slots wie bei move_index.
+WINNER_CODES = {None: 0, 'w': 1, 'b': 2, "draw": 3}
+WINNER_NAMES = {code: name for name, code in WINNER_CODES.items()}
+
+class VectorEnv:
+    def __init__(self, num_envs, seed=None):
+        if np is None:
+            raise ImportError("VectorEnv benötigt numpy")
+        self.num_envs = num_envs
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((num_envs, NUM_CELLS), dtype=np.int8)
+        self.turns = np.zeros(num_envs, dtype=np.int8)
+        self.winners = np.zeros(num_envs, dtype=np.int8)
+        slots = np.arange(NUM_MOVE_SLOTS)
+        self.slot_from = slots // 3
+        direction = slots % 3 - 1
+        row, col = self.slot_from // BOARD_SIZE, self.slot_from % BOARD_SIZE
+        self.slot_push = direction == 0
+        # Zielfeld und Gültigkeit der Geometrie je Farbe (Zeile 0: weiß, Zeile 1: schwarz)
+        self.slot_to = np.zeros((2, NUM_MOVE_SLOTS), dtype=np.int64)
+        self.slot_ok = np.zeros((2, NUM_MOVE_SLOTS), dtype=bool)
+        for color, step in ((0, 1), (1, -1)):
+            to_row, to_col = row + step, col + direction
+            ok = (0 <= to_row) & (to_row < BOARD_SIZE) & (0 <= to_col) & (to_col < BOARD_SIZE)
+            self.slot_ok[color] = ok
+            self.slot_to[color] = np.where(ok, to_row * BOARD_SIZE + to_col, 0)
+        self.target_row = np.array([BOARD_SIZE - 1, 0])
+        self.powers = 3 ** np.arange(NUM_CELLS - 1, -1, -1, dtype=np.int64)
+        self.reset()
+
+    def reset(self, envs=None):
+        if envs is None:
+            envs = np.arange(self.num_envs)
+        start = np.array([CELL_CODES[cell] for row in Game().board for cell in row], dtype=np.int8)
+        self.boards[envs] = start
+        self.turns[envs] = 0
+        self.winners[envs] = 0
+
+    def state_indices(self, mirrored=False):
+        # Gleiche Kodierung wie state_index(game.get_state()) bzw. state_index(mirror_state(...))
+        boards = self.boards.reshape(-1, BOARD_SIZE, BOARD_SIZE)[:, :, ::-1].reshape(-1, NUM_CELLS) if mirrored else self.boards
+        return (boards.astype(np.int64) @ self.powers) * 2 + self.turns
+
+    def legal_mask(self, envs=None):
+        if envs is None:
+            envs = np.arange(self.num_envs)
+        boards = self.boards[envs]
+        turns = self.turns[envs].astype(np.int64)
+        own = (turns + 1)[:, None]
+        rows = np.arange(len(envs))[:, None]
+        source = boards[:, self.slot_from] == own
+        target = boards[rows, self.slot_to[turns]]
+        free = np.where(self.slot_push, target == 0, target == 3 - own)
+        return source & free & self.slot_ok[turns]
+
+    def step(self, slots, envs):
+        # Wendet slots[i] auf Partie envs[i] an und prüft danach Sieg, Schlagen aller Bauern und Remis
+        turns = self.turns[envs].astype(np.int64)
+        own = (turns + 1).astype(np.int8)
+        src = self.slot_from[slots]
+        dst = self.slot_to[turns, slots]
+        self.boards[envs, src] = 0
+        self.boards[envs, dst] = own
+        promoted = dst // BOARD_SIZE == self.target_row[turns]
+        opponent_left = (self.boards[envs] == (3 - own)[:, None]).any(axis=1)
+        won = promoted | ~opponent_left
+        self.winners[envs[won]] = own[won]
+        going_on = envs[~won]
+        self.turns[going_on] = 1 - self.turns[going_on]
+        if going_on.size:
+            stuck = ~self.legal_mask(going_on).any(axis=1)
+            self.winners[going_on[stuck]] = WINNER_CODES["draw"]
+
+# --- Profiling (nur auf Wunsch) ---
+# Eingeschaltet über BAUERNSCHACH_PROFILE (1 oder ein Dateipräfix) bzw. profile=True in train_ai_selfplay und
+# create_app. Ohne das wird nichts umgehängt, die normalen Methoden laufen unverändert mit voller Geschwindigkeit.
+# Bericht: <präfix>.folded (eine Zeile "thread;funktion;... anzahl" je Stack, für flamegraph.pl oder speedscope)
+# und <präfix>.json mit Aufrufen und Gesamtzeit je eingehängter Funktion (inklusive verschachtelter Aufrufe).
+# Worker-Prozesse von train_ai_selfplay(workers > 1) werden nicht mitgezählt.
+PROFILE_ENV = "BAUERNSCHACH_PROFILE"
+PROFILE_INTERVAL = 0.005  # Sekunden zwischen zwei Stichproben
+PROFILE_TARGETS = [
+    ("Game", "get_valid_moves"), ("Game", "make_move"), ("Game", "get_state"),
+    ("QLearningAI", "choose_move"), ("QLearningAI", "update"),
+    ("QLearningAI", "load_qtable"), ("QLearningAI", "save_qtable"), ("QLearningAI", "compact_qtable"),
+    (None, "read_qtable_file"), (None, "write_qtable_file"),
+    (None, "append_qtable_journal"), (None, "replay_qtable_journal"),
+]
+_profiler = None
+
+class Profiler:
+    def __init__(self, prefix, interval=PROFILE_INTERVAL):
+        self.prefix = prefix
+        self.interval = interval
+        self.counters = {}  # "Klasse.methode" -> [aufrufe, sekunden]
+        self.samples = Counter()  # gefalteter Stack -> anzahl
+        self._restore = []
+        self._stop = threading.Event()
+        self._sampler = None
+        self._wrapper_code = None
+
+    def _wrap(self, owner, name, label):
+        original = getattr(owner, name)
+        stats = self.counters[label] = [0, 0.0]
+        clock = time.perf_counter
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                stats[0] += 1
+                stats[1] += clock() - start
+
+        setattr(owner, name, timed)
+        self._restore.append((owner, name, original))
+        self._wrapper_code = timed.__code__  # taucht in den Stichproben nicht auf
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    if code is not self._wrapper_code:
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        module = sys.modules[__name__]
+        for owner_name, name in PROFILE_TARGETS:
+            owner = module if owner_name is None else getattr(module, owner_name)
+            self._wrap(owner, name, name if owner_name is None else f"{owner_name}.{name}")
+        self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        # Hängt die Originale wieder ein und schreibt den Bericht
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        for owner, name, original in reversed(self._restore):
+            setattr(owner, name, original)
+        self._restore.clear()
+        with open(self.prefix + ".folded", "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        report = {label: {"calls": calls, "seconds": seconds, "mean_us": seconds / calls * 1e6 if calls else 0.0}
+                  for label, (calls, seconds) in sorted(self.counters.items(), key=lambda item: -item[1][1])}
+        with open(self.prefix + ".json", "w") as f:
+            json.dump({"interval": self.interval, "samples": sum(self.samples.values()), "functions": report}, f, indent=2)
+        print(f"Profil geschrieben: {self.prefix}.folded, {self.prefix}.json")
+        for label, entry in list(report.items())[:5]:
+            print(f"  {label}: {entry['calls']} Aufrufe, {entry['seconds']:.3f} s")
+
+def start_profiling(profile, default_prefix):
+    # profile: True, ein Dateipräfix, False oder None (dann entscheidet BAUERNSCHACH_PROFILE).
+    # Gibt den Profiler zurück, None wenn aus oder wenn schon ein Profiler läuft (der schreibt dann alles).
+    global _profiler
+    if profile is None:
+        profile = os.environ.get(PROFILE_ENV, "")
+    if profile in (False, "", "0"):
+        return None
+    if _profiler is not None:
+        return None
+    prefix = profile if isinstance(profile, str) and profile not in ("1", "true") else default_prefix
+    _profiler = Profiler(prefix).start()
+    return _profiler
+
+def stop_profiling(profiler):
+    global _profiler
+    if profiler is not None and profiler is _profiler:
+        _profiler = None
+        profiler.stop()
+
+# --- Kennzahlen während des Trainings ---
+class EpisodeStats:
+    # Zähler für einen Abschnitt des Trainings; Worker-Prozesse schicken ihre Kopie mit zurück
+    def __init__(self):
+        self.episodes = 0
+        self.plies = 0
+        self.winners = {'w': 0, 'b': 0, "draw": 0}
+        self.td_error_sum = 0.0
+        self.td_updates = 0
+
+    def add_episode(self, winner, plies):
+        self.episodes += 1
+        self.plies += plies
+        self.winners[winner or "draw"] += 1
+
+    def take_td_errors(self, *ais):
+        # Übernimmt die TD-Fehler der KIs und setzt deren Zähler zurück
+        for ai in ais:
+            self.td_error_sum += ai.td_error_sum
+            self.td_updates += ai.td_updates
+            ai.td_error_sum = 0.0
+            ai.td_updates = 0
+
+    def merge(self, other):
+        self.episodes += other.episodes
+        self.plies += other.plies
+        for winner, count in other.winners.items():
+            self.winners[winner] += count
+        self.td_error_sum += other.td_error_sum
+        self.td_updates += other.td_updates
+
+class CsvSink:
+    # Eine Zeile pro Bericht, die Spalten kommen aus dem ersten Bericht
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._writer = None
+
+    def __call__(self, metrics):
+        if self._file is None:
+            import csv
+            self._file = open(self.path, "w", newline="")
+            self._writer = csv.DictWriter(self._file, fieldnames=list(metrics))
+            self._writer.writeheader()
+        self._writer.writerow(metrics)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class JsonlSink:
+    # Ein JSON-Objekt pro Zeile und Bericht
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __call__(self, metrics):
+        if self._file is None:
+            self._file = open(self.path, "w")
+        self._file.write(json.dumps(metrics) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def metrics_sinks(target):
+    # target: Dateiname (.csv oder .jsonl), Funktion, die ein Dict bekommt, oder eine Liste davon
+    if target is None:
+        return []
+    if isinstance(target, (list, tuple)):
+        return [sink for item in target for sink in metrics_sinks(item)]
+    if isinstance(target, str):
+        if target.endswith(".csv"):
+            return [CsvSink(target)]
+        if target.endswith(".jsonl"):
+            return [JsonlSink(target)]
+        raise ValueError(f"{target}: erwartet .csv oder .jsonl")
+    return [target]
+
+class EarlyStopping:
+    # Stoppt, wenn sich metric über patience Berichte nicht um mehr als min_delta verbessert hat.
+    # mode="max" für Werte wie perfect_agreement, "min" z.B. für td_error.
+    def __init__(self, metric="perfect_agreement", patience=5, min_delta=0.001, mode="max"):
+        self.metric = metric
+        self.patience = patience
+        self.min_delta = min_delta
+        self.sign = 1 if mode == "max" else -1
+        self.best = None
+        self.stale = 0
+
+    def __call__(self, metrics):
+        value = self.sign * metrics[self.metric]
+        if self.best is None or value > self.best + self.min_delta:
+            self.best = value
+            self.stale = 0
+        else:
+            self.stale += 1
+        return self.stale >= self.patience
+
+class TrainingMonitor:
+    # Alle interval Episoden ein Bericht als Dict an die Sinks: Tempo, Sieg/Remis/Niederlage je Farbe,
+    # Tabellengröße, mittlerer |TD-Fehler| und die greedy Politik beider KIs auf allen Stellungen von
+    # perfect_table(): Anteil geänderter Stellungen seit dem letzten Bericht (policy_change) und Anteil,
+    # in dem nur perfekte Züge die besten Q-Werte haben (perfect_agreement).
+    def __init__(self, ai_white, ai_black, sinks=(), interval=500, early_stop=None):
+        self.ais = {'w': ai_white, 'b': ai_black}
+        self.sinks = list(sinks)
+        self.interval = interval
+        self.early_stop = early_stop
+        self.stats = EpisodeStats()
+        self.history = []
+        self.reported = 0
+        self.started = self.last_time = time.perf_counter()
+        self.positions = []  # (state, gültige Züge, perfekte Züge)
+        for state, (_, _, best) in perfect_table().items():
+            game = Game()
+            game.board = [list(row) for row in state[0]]
+            game.turn = state[1]
+            self.positions.append((state, game.get_valid_moves(state[1]), frozenset(best)))
+        self.policy = {}
+
+    def due(self, done):
+        return done // self.interval > self.reported // self.interval
+
+    def greedy_policy(self):
+        policy = {}
+        for state, moves, _ in self.positions:
+            qs = list(self.ais[state[1]]._q_values(state, moves))
+            max_q = max(qs)
+            policy[state] = frozenset(m for m, q in zip(moves, qs) if q == max_q)
+        return policy
+
+    def report(self, done):
+        # Schreibt einen Bericht und gibt True zurück, wenn early_stop das Training beenden will
+        now = time.perf_counter()
+        seconds = now - self.last_time
+        stats = self.stats
+        stats.take_td_errors(*self.ais.values())
+        policy = self.greedy_policy()
+        changed = sum(policy[state] != self.policy.get(state) for state in policy) if self.policy else len(policy)
+        agree = sum(policy[state] <= best for state, _, best in self.positions)
+        episodes = stats.episodes or 1
+        metrics = {
+            "episodes": done,
+            "seconds": round(now - self.started, 3),
+            "episodes_per_sec": stats.episodes / seconds if seconds else 0.0,
+            "plies_per_sec": stats.plies / seconds if seconds else 0.0,
+            "white_win": stats.winners['w'] / episodes,
+            "white_loss": stats.winners['b'] / episodes,
+            "black_win": stats.winners['b'] / episodes,
+            "black_loss": stats.winners['w'] / episodes,
+            "draw": stats.winners["draw"] / episodes,
+            "qtable_size_white": len(self.ais['w'].q_table),
+            "qtable_size_black": len(self.ais['b'].q_table),
+            "td_error": stats.td_error_sum / stats.td_updates if stats.td_updates else 0.0,
+            "policy_change": changed / len(policy) if policy else 0.0,
+            "perfect_agreement": agree / len(policy) if policy else 0.0,
+        }
+        self.policy = policy
+        self.stats = EpisodeStats()
+        self.last_time = now
+        self.reported = done
+        self.history.append(metrics)
+        for sink in self.sinks:
+            sink(metrics)
+        return bool(self.early_stop and self.early_stop(metrics))
+
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+def _train_vectorized(ai_black, ai_white, episodes, progress_callback, batch_size, seed, monitor=None):
+    env = VectorEnv(min(batch_size, episodes), seed)
+    rng = env.rng
+    ais = (ai_white, ai_black)
+    last_idx = np.full((2, env.num_envs), -1, dtype=np.int64)
+    last_mirrored = np.zeros((2, env.num_envs), dtype=np.int64)
+    last_slot = np.zeros((2, env.num_envs), dtype=np.int64)
+    active = np.ones(env.num_envs, dtype=bool)
+    started = env.num_envs
+    done = 0
+    while active.any():
+        envs = np.flatnonzero(active)
+        indices = env.state_indices()[envs]
+        mirrored = env.state_indices(mirrored=True)[envs]
+        legal = env.legal_mask(envs)
+        slots = np.zeros(len(envs), dtype=np.int64)
+        for color, ai in enumerate(ais):
+            sel = env.turns[envs] == color
+            if sel.any():
+                slots[sel] = ai.choose_moves_batch(indices[sel], legal[sel], rng, mirrored[sel])
+                last_idx[color, envs[sel]] = indices[sel]
+                last_mirrored[color, envs[sel]] = mirrored[sel]
+                last_slot[color, envs[sel]] = slots[sel]
+        env.step(slots, envs)
+        finished = envs[env.winners[envs] != 0]
+        if monitor:
+            monitor.stats.plies += len(envs)
+        if not finished.size:
+            continue
+        winners = env.winners[finished]
+        if monitor:
+            monitor.stats.episodes += finished.size
+            for name in monitor.stats.winners:
+                monitor.stats.winners[name] += int(np.count_nonzero(winners == WINNER_CODES[name]))
+        for color, ai in enumerate(ais):
+            rewards = np.where(winners == color + 1, 1.0, np.where(winners == WINNER_CODES["draw"], 0.5, -500.0))
+            played = last_idx[color, finished] >= 0
+            rows = finished[played]
+            ai.update_batch(last_idx[color, rows], last_slot[color, rows], rewards[played], last_mirrored[color, rows])
+        last_idx[:, finished] = -1
+        before = done
+        done += finished.size
+        restart = finished[:max(0, episodes - started)]
+        started += restart.size
+        env.reset(restart)
+        active[finished[restart.size:]] = False
+        if progress_callback and done // 500 > before // 500:
+            progress_callback(done // 500 * 500)
+        if monitor and monitor.due(done) and monitor.report(done):
+            break
+
+def play_selfplay_episode(ai_white, ai_black, game_cls=Game, stats=None):
+    # Mit stats (EpisodeStats) werden Sieger und Halbzüge mitgezählt
+    game = game_cls()
+    plies = 0
+    ai_black.last_state = None
+    ai_black.last_move = None
+    ai_white.last_state = None
+    ai_white.last_move = None
+    while not game.is_game_over():
+        if game.turn == 'w':
+            move = ai_white.choose_move(game)
+            game.make_move(move)
+        else:
+            move = ai_black.choose_move(game)
+            game.make_move(move)
+        plies += 1
+        if game.is_game_over():
+            if game.winner == 'b':
+                ai_black.update(1, game.get_state(), True, game)
+                ai_white.update(-500, game.get_state(), True, game)
+            elif game.winner == 'w':
+                ai_black.update(-500, game.get_state(), True, game)
+                ai_white.update(1, game.get_state(), True, game)
+            else:
+                ai_black.update(0.5, game.get_state(), True, game)
+                ai_white.update(0.5, game.get_state(), True, game)
+    if stats is not None:
+        stats.add_episode(game.winner, plies)
+    return game.winner
+
+def _selfplay_worker(job):
+    # Läuft im Worker-Prozess: spielt auf einer lokalen Kopie der Tabellen und liefert die Updates der Reihe nach
+    black_table, white_table, episodes, seed, backend = job
+    random.seed(seed)
+    ai_black = QLearningAI('b', epsilon=0.05, backend=backend, q_table=black_table)
+    ai_white = QLearningAI('w', epsilon=0.05, backend=backend, q_table=white_table)
+    ai_black.update_log = []
+    ai_white.update_log = []
+    stats = EpisodeStats()
+    for _ in range(episodes):
+        play_selfplay_episode(ai_white, ai_black, stats=stats)
+    stats.take_td_errors(ai_black, ai_white)
+    return ai_black.update_log, ai_white.update_log, stats
+
+def _replay_updates(ai, worker_logs):
+    # Die Updates aller Worker nacheinander auf die Haupttabelle anwenden. Jedes Update zieht den Wert
+    # nur um alpha Richtung Ziel, die Werte bleiben so im Bereich der Belohnungen (anders als beim
+    # Aufsummieren der Änderungen) und jeder Worker trägt voll zum Lernen bei.
+    for log in worker_logs:
+        for key, target in log:
+            old_q = ai.q_table.get(key, 0)
+            ai.q_table[key] = old_q + ai.alpha * (target - old_q)
+            ai.dirty.add(key)
+
+PROGRESS_INTERVAL = 0.1  # Sekunden zwischen zwei progress_callback-Aufrufen, solange die Worker rechnen
+
+def _train_parallel(ai_black, ai_white, episodes, progress_callback, workers, sync_interval, seed, backend,
+                    monitor=None):
+    from concurrent.futures import ProcessPoolExecutor, wait
+    rng = random.Random(seed)
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while done < episodes:
+            remaining = episodes - done
+            round_size = min(remaining, workers * sync_interval)
+            chunks = [round_size // workers + (1 if i < round_size % workers else 0) for i in range(workers)]
+            chunks = [n for n in chunks if n]
+            black_snapshot = ai_black.q_table.to_dict() if backend == "dense" else ai_black.q_table
+            white_snapshot = ai_white.q_table.to_dict() if backend == "dense" else ai_white.q_table
+            jobs = [(black_snapshot, white_snapshot, n, rng.getrandbits(32), backend) for n in chunks]
+            futures = [pool.submit(_selfplay_worker, job) for job in jobs]
+            # Auch während einer Runde regelmäßig melden, damit die GUI ihre Events abarbeiten kann
+            while progress_callback and wait(futures, timeout=PROGRESS_INTERVAL).not_done:
+                progress_callback(done)
+            results = [future.result() for future in futures]
+            _replay_updates(ai_black, [black for black, _, _ in results])
+            _replay_updates(ai_white, [white for _, white, _ in results])
+            done += round_size
+            if progress_callback:
+                progress_callback(done)
+            if monitor:
+                for _, _, stats in results:
+                    monitor.stats.merge(stats)
+                if monitor.due(done) and monitor.report(done):
+                    break
+
+def train_ai_selfplay(episodes=5000, progress_callback=None, backend="dict", workers=1, sync_interval=500, seed=None,
+                      engine="game", batch_size=256, metrics=None, metrics_interval=500, early_stop=None,
+                      profile=None):
+    # workers > 1 verteilt die Episoden auf Prozesse; alle sync_interval Episoden pro Worker wird zusammengeführt.
+    # engine="vector" spielt batch_size Partien gleichzeitig in einem VectorEnv (setzt backend="dense" voraus).
+    # metrics: Ziel für die Berichte von TrainingMonitor (siehe metrics_sinks), alle metrics_interval Episoden.
+    # early_stop: z.B. EarlyStopping(), bekommt jeden Bericht und beendet das Training vor episodes.
+    # profile: True oder Dateipräfix für einen Profiling-Bericht (siehe Profiler), sonst gilt BAUERNSCHACH_PROFILE.
+    # Rückgabe: Liste aller Berichte (leer ohne metrics und early_stop).
+    if engine == "vector":
+        backend = "dense"
+    profiler = start_profiling(profile, "profile-train")
+    try:
+        return _train_ai_selfplay(episodes, progress_callback, backend, workers, sync_interval, seed, engine,
+                                  batch_size, metrics, metrics_interval, early_stop)
+    finally:
+        stop_profiling(profiler)
+
+def _train_ai_selfplay(episodes, progress_callback, backend, workers, sync_interval, seed, engine, batch_size,
+                       metrics, metrics_interval, early_stop):
+    ai_black = QLearningAI('b', epsilon=0.05, backend=backend)
+    ai_white = QLearningAI('w', epsilon=0.05, qfile="qtable_white.bin", backend=backend)
+    monitor = None
+    if metrics is not None or early_stop is not None:
+        monitor = TrainingMonitor(ai_white, ai_black, metrics_sinks(metrics), metrics_interval, early_stop)
+    try:
+        if engine == "vector":
+            _train_vectorized(ai_black, ai_white, episodes, progress_callback, batch_size, seed, monitor)
+        elif workers > 1:
+            _train_parallel(ai_black, ai_white, episodes, progress_callback, workers, sync_interval, seed, backend,
+                            monitor)
+        else:
+            if seed is not None:
+                random.seed(seed)
+            stats = monitor.stats if monitor else None
+            for episode in range(episodes):
+                play_selfplay_episode(ai_white, ai_black, stats=stats)
+                if progress_callback and (episode+1) % 500 == 0:
+                    progress_callback(episode+1)
+                if monitor and monitor.due(episode+1):
+                    if monitor.report(episode+1):
+                        break
+                    stats = monitor.stats
+    finally:
+        if monitor:
+            monitor.close()
     ai_black.save_qtable()
     ai_white.save_qtable()
+    return monitor.history if monitor else []
 
 def reset_ai():
-    for fname in ["qtable.pkl", "qtable_white.pkl"]:
-        if os.path.exists(fname):
-            os.remove(fname)
+    for base in ["qtable", "qtable_white"]:
+        for fname in [base + ".bin", base + ".bin.journal", base + ".bin.journal.compacting", base + ".pkl"]:
+            if os.path.exists(fname):
+                os.remove(fname)
 
 # --- Flask Backend für Netzwerk-PvP ---
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)
-games = {}
+versions = {}  # session_id -> Zähler, steigt bei jeder Änderung
+state_lock = threading.RLock()  # schützt games, versions und die Partien selbst
+session_changed = {}  # session_id -> [Condition auf state_lock, Anzahl Wartende], nur solange jemand wartet
+WAIT_TIMEOUT_MAX = 60
+rooms = {}  # session_id -> offene WebSocket-Verbindungen
+sockets_lock = threading.Lock()  # schützt nur rooms, gesendet wird außerhalb
+send_locks = {}  # WebSocket -> Lock, damit pro Verbindung nur ein Thread gleichzeitig sendet
+
+SESSION_IDLE_TTL = 30 * 60  # Sekunden ohne Zugriff, danach wird eine laufende Partie entfernt
+SESSION_FINISHED_TTL = 5 * 60  # beendete Partien werden früher aufgeräumt
+SESSION_MAX = 10000  # harte Obergrenze, darüber fliegt die am längsten unbenutzte Partie raus
+SESSION_REAP_INTERVAL = 30  # Sekunden zwischen zwei Durchläufen des Aufräum-Threads
+
+class SessionStore:
+    # session_id -> Game in LRU-Reihenfolge (zuletzt benutzt am Ende) mit Zeitpunkt des letzten Zugriffs.
+    # Benutzt state_lock als Sperre: entfernte Partien verlieren auch ihren Eintrag in versions,
+    # wartende Long-Polls wachen dann auf und bekommen 404. Partien mit offenem WebSocket räumt der
+    # Aufräum-Thread nicht weg, nur die Obergrenze.
+    def __init__(self, lock, idle_ttl=SESSION_IDLE_TTL, finished_ttl=SESSION_FINISHED_TTL,
+                 max_sessions=SESSION_MAX, reap_interval=SESSION_REAP_INTERVAL):
+        self.lock = lock
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.max_sessions = max_sessions
+        self.reap_interval = reap_interval
+        self.entries = OrderedDict()  # session_id -> [game, letzter Zugriff]
+        self.evicted = 0
+        self.expired = 0
+        self._reaper = None
+
+    def __contains__(self, session_id):
+        return session_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, session_id):
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is None:
+                return None
+            entry[1] = time.monotonic()
+            self.entries.move_to_end(session_id)
+            return entry[0]
+
+    def put(self, session_id, game):
+        with self.lock:
+            self.entries[session_id] = [game, time.monotonic()]
+            self.entries.move_to_end(session_id)
+            while len(self.entries) > self.max_sessions:
+                old_id, _ = self.entries.popitem(last=False)
+                self._forget(old_id)
+                self.evicted += 1
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+                self._reaper.start()
+
+    def _forget(self, session_id):
+        versions.pop(session_id, None)
+        notify_change(session_id)
+
+    def reap(self, now=None):
+        # Vorne stehen die am längsten unbenutzten Partien, ab der ersten zu jungen kann keine mehr ablaufen
+        now = time.monotonic() if now is None else now
+        min_ttl = min(self.idle_ttl, self.finished_ttl)
+        with self.lock:
+            for session_id, (game, last_access) in list(self.entries.items()):
+                if now - last_access <= min_ttl:
+                    break
+                ttl = self.finished_ttl if game.winner is not None else self.idle_ttl
+                if now - last_access > ttl and session_id not in rooms:
+                    del self.entries[session_id]
+                    self._forget(session_id)
+                    self.expired += 1
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reap_interval)
+            self.reap()
+
+    def stats(self):
+        with self.lock:
+            finished = sum(1 for game, _ in self.entries.values() if game.winner is not None)
+            return {
+                "live": len(self.entries) - finished,
+                "finished": finished,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "max_sessions": self.max_sessions,
+                "sockets": sum(len(sockets) for sockets in list(rooms.values()))
+            }
+
+games = SessionStore(state_lock)  # session_id -> Game
+
+# --- Metriken im Textformat von Prometheus (GET /metrics), siehe Gemeinsam/Metriken.py ---
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Gemeinsam"))
+from Metriken import Metrics, LATENCY_BUCKETS, FAST_BUCKETS
+
+metrics = Metrics()
+metrics.describe("bauernschach_http_requests_total", "counter", "Anfragen je Route, Methode und Status")
+metrics.describe("bauernschach_http_request_duration_seconds", "histogram", "Dauer der Anfragen je Route",
+                 LATENCY_BUCKETS)
+metrics.describe("bauernschach_moves_total", "counter", "Züge nach Ergebnis (ok, invalid, no_game)")
+metrics.describe("bauernschach_get_valid_moves_seconds", "histogram",
+                 "Zeit in Game.get_valid_moves beim Prüfen eines Zugs", FAST_BUCKETS)
+
+def valid_moves(game):
+    # game.get_valid_moves(game.turn) mit Zeitmessung
+    start = time.perf_counter()
+    moves = game.get_valid_moves(game.turn)
+    metrics.observe("bauernschach_get_valid_moves_seconds", time.perf_counter() - start)
+    return moves
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.inc("bauernschach_http_requests_total",
+                    (("route", route), ("method", request.method), ("status", response.status_code)))
+        metrics.observe("bauernschach_http_request_duration_seconds", time.perf_counter() - start, (("route", route),))
+    return response
+
+def state_payload(session_id, game):
+    return {
+        "board": game.board,
+        "turn": game.turn,
+        "winner": game.winner,
+        "version": versions.get(session_id, 0)
+    }
+
+def publish(session_id, payload):
+    # Schickt den neuen Stand an alle WebSocket-Teilnehmer der Partie (HTTP-Clients bekommen ihn über /wait_state)
+    # Ein langsamer Client hält so nur seine eigene Verbindung auf, nicht andere Partien oder /move.
+    message = json.dumps(dict(payload, type="state"))
+    with sockets_lock:
+        members = list(rooms.get(session_id, ()))
+    for ws in members:
+        try:
+            send_ws(ws, message)
+        except Exception:
+            with sockets_lock:
+                rooms.get(session_id, set()).discard(ws)
+            send_locks.pop(ws, None)
+
+def send_ws(ws, message):
+    with send_locks.setdefault(ws, threading.Lock()):
+        ws.send(message)
+
+def notify_change(session_id):
+    # Nur unter state_lock aufrufen: weckt die Long-Polls dieser einen Partie
+    entry = session_changed.get(session_id)
+    if entry is not None:
+        entry[0].notify_all()
+
+def wait_for_change(session_id, since, timeout):
+    # Nur unter state_lock aufrufen. Jede Partie hat ihre eigene Condition, ein Zug weckt nicht
+    # alle wartenden Long-Polls des Servers, sondern nur die seiner Partie.
+    entry = session_changed.get(session_id)
+    if entry is None:
+        entry = session_changed[session_id] = [threading.Condition(state_lock), 0]
+    entry[1] += 1
+    try:
+        entry[0].wait_for(lambda: versions.get(session_id) != since, timeout)
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del session_changed[session_id]
+
+def start_game(session_id):
+    with state_lock:
+        game = Game()
+        games.put(session_id, game)
+        versions[session_id] = versions.get(session_id, 0) + 1
+        notify_change(session_id)
+        payload = state_payload(session_id, game)
+    publish(session_id, payload)
+
+def apply_move(session_id, move):
+    # Gemeinsam für POST /move und den WebSocket-Kanal: (payload, fehler, statuscode)
+    if not isinstance(session_id, str):
+        return None, "Bad request", 400
+    game = games.get(session_id)
+    if not game:
+        metrics.inc("bauernschach_moves_total", (("result", "no_game"),))
+        return None, "No such game", 404
+    try:
+        move_tuple = (tuple(move[0]), tuple(move[1]))
+    except (TypeError, IndexError):
+        return None, "Bad request", 400
+    with state_lock:
+        if move_tuple not in valid_moves(game):
+            metrics.inc("bauernschach_moves_total", (("result", "invalid"),))
+            return None, "Invalid move", 400
+        game.make_move(move_tuple)
+        metrics.inc("bauernschach_moves_total", (("result", "ok"),))
+        versions[session_id] = versions.get(session_id, 0) + 1
+        notify_change(session_id)
+        payload = state_payload(session_id, game)
+    publish(session_id, payload)
+    return payload, None, 200
 
 @app.route("/new_game", methods=["POST"])
 def new_game():
     session_id = request.json.get("session_id")
-    games[session_id] = Game()
+    if not isinstance(session_id, str):
+        return jsonify({"error": "Bad request"}), 400
+    start_game(session_id)
     return jsonify({"status": "ok"})
 
 @app.route("/get_state", methods=["GET"])
@@ -151,28 +1865,247 @@ def get_state():
     game = games.get(session_id)
     if not game:
         return jsonify({"error": "No such game"}), 404
-    return jsonify({
-        "board": game.board,
-        "turn": game.turn,
-        "winner": game.winner
-    })
+    return jsonify(state_payload(session_id, game))
+
+@app.route("/wait_state", methods=["GET"])
+def wait_state():
+    # Long-Poll: antwortet erst, wenn sich die Version gegenüber "since" geändert hat (oder nach timeout Sekunden)
+    session_id = request.args.get("session_id")
+    since = request.args.get("since", type=int)
+    timeout = request.args.get("timeout", 25, type=float)
+    if not math.isfinite(timeout):
+        return jsonify({"error": "Bad request"}), 400
+    timeout = max(0.0, min(timeout, WAIT_TIMEOUT_MAX))
+    with state_lock:
+        wait_for_change(session_id, since, timeout)
+        game = games.get(session_id)
+        if not game:
+            return jsonify({"error": "No such game"}), 404
+        return jsonify(state_payload(session_id, game))
 
 @app.route("/move", methods=["POST"])
 def move():
     session_id = request.json.get("session_id")
     move = request.json.get("move")  # [[r1, c1], [r2, c2]]
-    game = games.get(session_id)
-    if not game:
-        return jsonify({"error": "No such game"}), 404
-    move_tuple = (tuple(move[0]), tuple(move[1]))
-    if move_tuple not in game.get_valid_moves(game.turn):
-        return jsonify({"error": "Invalid move"}), 400
-    game.make_move(move_tuple)
-    return jsonify({
-        "board": game.board,
-        "turn": game.turn,
-        "winner": game.winner
-    })
+    payload, error, status = apply_move(session_id, move)
+    if error:
+        return jsonify({"error": error}), status
+    return jsonify(payload)
+
+BATCH_MAX = 1000  # Operationen pro /batch-Anfrage
+
+def run_op(op):
+    # Eine Operation aus /batch: (statuscode, body) genau wie beim einzelnen Endpunkt
+    session_id = op.get("session_id")
+    kind = op.get("op")
+    if not isinstance(session_id, str):
+        return 400, {"error": "Bad request"}
+    if kind == "new_game":
+        start_game(session_id)
+        return 200, {"status": "ok"}
+    if kind == "get_state":
+        game = games.get(session_id)
+        if not game:
+            return 404, {"error": "No such game"}
+        return 200, state_payload(session_id, game)
+    if kind == "move":
+        try:
+            payload, error, status = apply_move(session_id, op.get("move"))
+        except (TypeError, IndexError):
+            return 400, {"error": "Bad request"}
+        if error:
+            return status, {"error": error}
+        return 200, payload
+    return 400, {"error": "Unknown op"}
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    # Für Bots: [{"session_id": ..., "op": "new_game" | "get_state" | "move", "move": ...}, ...]
+    # werden der Reihe nach ausgeführt, Antwort {"results": [{"status": 200, "body": {...}}, ...]}
+    ops = request.json
+    if not isinstance(ops, list) or len(ops) > BATCH_MAX or not all(isinstance(op, dict) for op in ops):
+        return jsonify({"error": "Bad request"}), 400
+    results = []
+    for op in ops:
+        status, body = run_op(op)
+        results.append({"status": status, "body": body})
+    return jsonify({"results": results})
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify(games.stats())
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    session_stats = games.stats()
+    text = metrics.render([
+        ("bauernschach_sessions", "gauge", "Partien im Speicher",
+         [((("state", "active"),), session_stats["live"]), ((("state", "finished"),), session_stats["finished"])]),
+        ("bauernschach_sessions_removed_total", "counter", "Entfernte Partien (Obergrenze bzw. abgelaufen)",
+         [((("reason", "evicted"),), session_stats["evicted"]), ((("reason", "expired"),), session_stats["expired"])]),
+        ("bauernschach_websockets", "gauge", "Offene WebSocket-Verbindungen", [((), session_stats["sockets"])]),
+    ])
+    return text, 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+AI_QFILES = {'b': "qtable.bin", 'w': "qtable_white.bin"}  # dieselben Dateien wie beim Training
+ai_players = None
+
+def load_policy():
+    # Einmal pro Server. Mit geforkten Workern (z.B. gunicorn --preload) vor dem Fork aufrufen,
+    # dann liegen die Tabellen nur einmal im Speicher.
+    global ai_players
+    if ai_players is None:
+        ai_players = {player: PolicyAI(player, qfile) for player, qfile in AI_QFILES.items()}
+    return ai_players
+
+SEARCH_TIME_BUDGET = 0.2  # Sekunden pro Zug für "ai": "search"
+SEARCH_TIME_MAX = 2.0  # Obergrenze für "time_budget" in /ai_move
+SEARCH_POOL_SIZE = 4  # freie SearchAI-Instanzen, die pro Farbe aufgehoben werden
+
+class SearchPool:
+    # Jede Anfrage sucht mit einer eigenen SearchAI (samt eigener Transpositionstabelle), gleichzeitige
+    # Suchen warten so nicht aufeinander. Freie Instanzen werden wiederverwendet, höchstens size pro Farbe.
+    def __init__(self, time_budget, size):
+        self.time_budget = time_budget
+        self.size = size
+        self.free = {player: [] for player in "wb"}
+        self.lock = threading.Lock()
+
+    def choose_move(self, game, time_budget=None):
+        with self.lock:
+            free = self.free[game.turn]
+            ai = free.pop() if free else SearchAI(game.turn, self.time_budget)
+        try:
+            return ai.choose_move(game, time_budget)
+        finally:
+            with self.lock:
+                if len(free) < self.size:
+                    free.append(ai)
+
+search_pool = SearchPool(SEARCH_TIME_BUDGET, SEARCH_POOL_SIZE)
+
+@app.route("/ai_move", methods=["POST"])
+def ai_move():
+    # Zug der Server-KI für die Seite, die gerade dran ist.
+    # {"session_id": ...}: Zug wird in der Partie ausgeführt, Antwort wie /move plus "move".
+    # {"board": ..., "turn": ...}: nur berechnen, Antwort {"move": [[r1, c1], [r2, c2]]}.
+    # Optional "ai": "policy" (Q-Table, Standard) oder "search" (SearchAI) und "time_budget" in Sekunden.
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "Bad request"}), 400
+    kind = data.get("ai", "policy")
+    if kind == "search":
+        try:
+            budget = float(data.get("time_budget", SEARCH_TIME_BUDGET))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Bad request"}), 400
+        if not (math.isfinite(budget) and budget > 0):
+            return jsonify({"error": "Bad request"}), 400
+        budget = min(budget, SEARCH_TIME_MAX)
+        choose = lambda game: search_pool.choose_move(game, budget)
+    elif kind == "policy":
+        players = load_policy()
+        choose = lambda game: players[game.turn].choose_move(game)
+    else:
+        return jsonify({"error": "Unknown ai"}), 400
+    session_id = data.get("session_id")
+    if session_id is None:
+        # Erst prüfen, dann nachschlagen: board muss ein 3x3-Gitter aus '.', 'w', 'b' sein, turn 'w' oder 'b'
+        board, turn = data.get("board"), data.get("turn")
+        valid = (isinstance(board, list) and len(board) == BOARD_SIZE
+                 and all(isinstance(row, list) and len(row) == BOARD_SIZE
+                         and all(isinstance(cell, str) and cell in CELL_CODES for cell in row) for row in board))
+        if not valid or turn not in ('w', 'b'):
+            return jsonify({"error": "Bad request"}), 400
+        game = Game()
+        game.board = [list(row) for row in board]
+        game.turn = turn
+        move = choose(game)
+        if move is None:
+            return jsonify({"error": "No valid moves"}), 400
+        return jsonify({"move": [list(move[0]), list(move[1])]})
+    if not isinstance(session_id, str):
+        return jsonify({"error": "Bad request"}), 400
+    # Gerechnet wird auf einer Kopie außerhalb von state_lock, eine Suche hält so keine anderen Partien auf.
+    # Hat sich die Partie inzwischen geändert, wird der Zug verworfen.
+    with state_lock:
+        game = games.get(session_id)
+        if not game:
+            return jsonify({"error": "No such game"}), 404
+        if game.winner:
+            return jsonify({"error": "Game over"}), 400
+        game = game.copy()
+        version = versions.get(session_id)
+    move = choose(game)
+    with state_lock:
+        if versions.get(session_id) != version:
+            return jsonify({"error": "Game changed"}), 409
+        payload, error, status = apply_move(session_id, move)
+    if error:
+        return jsonify({"error": error}), status
+    return jsonify(dict(payload, move=[list(move[0]), list(move[1])]))
+
+# --- WebSocket-Kanal /ws (braucht flask-sock) ---
+# Client -> Server: {"type": "join", "session_id": ..., "new_game": false}
+#                   {"type": "move", "move": [[r1, c1], [r2, c2]]}
+# Server -> Client: {"type": "state", "board": ..., "turn": ..., "winner": ..., "version": ...}
+#                   {"type": "error", "error": ...}
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route("/ws")
+    def game_socket(ws):
+        session_id = None
+        try:
+            while True:
+                # Ein kaputter Frame (kein JSON, falsche Felder) wird mit einem Fehler beantwortet,
+                # die Verbindung bleibt offen
+                error = None
+                try:
+                    message = json.loads(ws.receive())
+                    if not isinstance(message, dict):
+                        raise ValueError("message is not an object")
+                    if message.get("type") == "join":
+                        if not isinstance(message.get("session_id"), str):
+                            raise ValueError("session_id missing")
+                        with sockets_lock:
+                            if session_id is not None:
+                                rooms.get(session_id, set()).discard(ws)
+                            session_id = message["session_id"]
+                            rooms.setdefault(session_id, set()).add(ws)
+                        game = games.get(session_id)
+                        if message.get("new_game") or game is None:
+                            start_game(session_id)
+                        else:
+                            send_ws(ws, json.dumps(dict(state_payload(session_id, game), type="state")))
+                    elif message.get("type") == "move":
+                        if session_id is None:
+                            error = "Join a game first"
+                        else:
+                            _, error, _ = apply_move(session_id, message.get("move"))
+                except (ValueError, TypeError, IndexError):
+                    error = "Bad request"
+                if error:
+                    send_ws(ws, json.dumps({"type": "error", "error": error}))
+        except ConnectionClosed:
+            pass
+        finally:
+            with sockets_lock:
+                if session_id in rooms:
+                    rooms[session_id].discard(ws)
+                    if not rooms[session_id]:
+                        del rooms[session_id]
+            send_locks.pop(ws, None)
+
+def create_app(profile=None):
+    # Für WSGI-Server, z.B. gunicorn "Backend:create_app(profile=True)". Mit profile (oder BAUERNSCHACH_PROFILE)
+    # läuft der Profiler bis zum Prozessende und schreibt dann profile-server-<pid>.folded/.json (ein Bericht
+    # je Worker-Prozess, und der Reloader von debug=True überschreibt den Bericht seines Kindprozesses nicht).
+    profiler = start_profiling(profile, f"profile-server-{os.getpid()}")
+    if profiler is not None:
+        atexit.register(stop_profiling, profiler)
+    load_policy()  # mit gunicorn --preload vor dem Fork der Worker, dann teilen sie sich die Tabellen
+    return app
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
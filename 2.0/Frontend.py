@@ -1,7 +1,9 @@
+import os
 import pygame
 import sys
-import requests
-from Backend import Game, QLearningAI, train_ai_selfplay, reset_ai
+from Backend import Game, QLearningAI, SearchAI, EarlyStopping, train_ai_selfplay, reset_ai
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Gemeinsam"))  # Netzwerk.py liegt in Gemeinsam/
+from Netzwerk import HttpGameClient, WebSocketClient, optimistic_state
 
 BOARD_SIZE = 3
 SQUARE_SIZE = 120
@@ -16,35 +18,69 @@ BUTTON_COLOR = (180, 180, 220)
 BUTTON_HOVER = (120, 180, 255)
 BUTTON_TEXT = (30, 30, 30)
 SERVER = "http://10.0.3.27:5000"  # <--- Hier deine Server-IP eintragen!
+WAIT_TIMEOUT = 5  # Sekunden pro Long-Poll auf /wait_state (läuft im Hintergrund-Thread)
+USE_WEBSOCKET = True  # PvP über /ws, falls Server und websocket-client das können, sonst HTTP
+PVE_AI = "qlearning"  # Gegner im PvE: "qlearning" (lernt mit) oder "search" (Alpha-Beta-Suche, SearchAI)
+SEARCH_TIME_BUDGET = 0.3  # Sekunden Bedenkzeit pro Zug für SearchAI
 
-def draw_board(screen, game, selected=None, valid_moves=[]):
-    offset_x = (WIDTH - BOARD_SIZE * SQUARE_SIZE) // 2
-    offset_y = (HEIGHT - BOARD_SIZE * SQUARE_SIZE) // 2
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            rect = pygame.Rect(offset_x + c*SQUARE_SIZE, offset_y + r*SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-            color = WHITE if (r+c)%2==0 else GREEN
-            if selected == (r, c):
-                color = BLUE
-            elif any(move[1] == (r, c) for move in valid_moves):
-                color = RED
-            pygame.draw.rect(screen, color, rect)
-            piece = game.board[r][c]
-            if piece == 'w':
-                pygame.draw.circle(screen, (220,220,220), rect.center, SQUARE_SIZE//3)
-            elif piece == 'b':
-                pygame.draw.circle(screen, (50,50,50), rect.center, SQUARE_SIZE//3)
-    pygame.display.flip()
+FPS = 60  # Obergrenze für alle Schleifen, gezeichnet wird trotzdem nur, was sich geändert hat
+
+class BoardRenderer:
+    # Felder und Steine werden einmal vorgerendert. draw() merkt sich, was in jedem Feld zu sehen ist,
+    # und schickt nur die geänderten Felder per pygame.display.update an den Bildschirm.
+    def __init__(self, screen):
+        self.screen = screen
+        self.offset_x = (WIDTH - BOARD_SIZE * SQUARE_SIZE) // 2
+        self.offset_y = (HEIGHT - BOARD_SIZE * SQUARE_SIZE) // 2
+        self.squares = {}
+        for color in (WHITE, GREEN, BLUE, RED):
+            square = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE)).convert()
+            square.fill(color)
+            self.squares[color] = square
+        self.pieces = {}
+        for piece, color in (('w', (220,220,220)), ('b', (50,50,50))):
+            surf = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA).convert_alpha()
+            pygame.draw.circle(surf, color, (SQUARE_SIZE//2, SQUARE_SIZE//2), SQUARE_SIZE//3)
+            self.pieces[piece] = surf
+        self.shown = None  # (r, c) -> (Farbe, Stein) wie zuletzt gezeichnet; None = alles neu
+
+    def invalidate(self):
+        self.shown = None
+
+    def draw(self, board, selected=None, valid_moves=()):
+        targets = {move[1] for move in valid_moves}
+        full = self.shown is None
+        if full:
+            self.screen.fill(MENU_BG)
+            self.shown = {}
+        dirty = []
+        for r in range(BOARD_SIZE):
+            for c in range(BOARD_SIZE):
+                color = WHITE if (r+c)%2==0 else GREEN
+                if selected == (r, c):
+                    color = BLUE
+                elif (r, c) in targets:
+                    color = RED
+                cell = (color, board[r][c])
+                if self.shown.get((r, c)) == cell:
+                    continue
+                self.shown[(r, c)] = cell
+                pos = (self.offset_x + c*SQUARE_SIZE, self.offset_y + r*SQUARE_SIZE)
+                self.screen.blit(self.squares[color], pos)
+                if cell[1] in self.pieces:
+                    self.screen.blit(self.pieces[cell[1]], pos)
+                dirty.append(pygame.Rect(pos, (SQUARE_SIZE, SQUARE_SIZE)))
+        if full:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
 
-def draw_menu(screen, font, buttons, title="3x3 Schach mit 3 Bauern"):
+def draw_menu(screen, title_surf, buttons, labels, hovered):
     screen.fill(MENU_BG)
-    title_surf = font.render(title, True, (255,255,255))
     screen.blit(title_surf, (WIDTH//2 - title_surf.get_width()//2, 40))
-    mouse = pygame.mouse.get_pos()
-    for rect, text in buttons:
-        color = BUTTON_HOVER if rect.collidepoint(mouse) else BUTTON_COLOR
+    for i, ((rect, _), text_surf) in enumerate(zip(buttons, labels)):
+        color = BUTTON_HOVER if i == hovered else BUTTON_COLOR
         pygame.draw.rect(screen, color, rect, border_radius=10)
-        text_surf = font.render(text, True, BUTTON_TEXT)
         screen.blit(text_surf, (rect.x + rect.width//2 - text_surf.get_width()//2,
                                 rect.y + rect.height//2 - text_surf.get_height()//2))
     pygame.display.flip()
@@ -59,8 +95,18 @@ def menu_loop(screen):
         (pygame.Rect(WIDTH//2 - btn_w//2, start_y + i*(btn_h + gap), btn_w, btn_h), text)
         for i, text in enumerate(["PvE", "PvP (Netzwerk)", "KI trainieren", "KI zurücksetzen"])
     ]
+    # Texte werden einmal gerendert, neu gezeichnet wird nur, wenn sich der Hover-Button ändert
+    title_surf = font.render("3x3 Schach mit 3 Bauern", True, (255,255,255))
+    labels = [font.render(text, True, BUTTON_TEXT) for _, text in buttons]
+    clock = pygame.time.Clock()
+    shown = -1
     while True:
-        draw_menu(screen, font, buttons)
+        clock.tick(FPS)
+        mouse = pygame.mouse.get_pos()
+        hovered = next((i for i, (rect, _) in enumerate(buttons) if rect.collidepoint(mouse)), None)
+        if hovered != shown:
+            draw_menu(screen, title_surf, buttons, labels, hovered)
+            shown = hovered
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -71,15 +117,21 @@ def menu_loop(screen):
                         return i+1  # 1: KI, 2: Netzwerk, 3: Training, 4: Reset
 
 def text_input_box(screen, prompt, y, font):
+    # Neu gezeichnet wird nur, wenn sich die Eingabe ändert
+    clock = pygame.time.Clock()
+    prompt_surf = font.render(prompt, True, (255,255,255))
     input_text = ""
+    changed = True
     active = True
     while active:
-        screen.fill((60, 60, 80))
-        prompt_surf = font.render(prompt, True, (255,255,255))
-        screen.blit(prompt_surf, (WIDTH//2 - prompt_surf.get_width()//2, y))
-        input_surf = font.render(input_text, True, (255,255,0))
-        screen.blit(input_surf, (WIDTH//2 - input_surf.get_width()//2, y+50))
-        pygame.display.flip()
+        clock.tick(FPS)
+        if changed:
+            screen.fill((60, 60, 80))
+            screen.blit(prompt_surf, (WIDTH//2 - prompt_surf.get_width()//2, y))
+            input_surf = font.render(input_text, True, (255,255,0))
+            screen.blit(input_surf, (WIDTH//2 - input_surf.get_width()//2, y+50))
+            pygame.display.flip()
+            changed = False
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -89,25 +141,30 @@ def text_input_box(screen, prompt, y, font):
                     active = False
                 elif event.key == pygame.K_BACKSPACE:
                     input_text = input_text[:-1]
+                    changed = True
                 else:
                     if len(input_text) < 20:
                         input_text += event.unicode
+                        changed = True
     return input_text.strip()
 
 def color_choice_box(screen, font):
+    # Der Bildschirm ändert sich nicht: einmal zeichnen, danach nur noch auf einen Klick warten
+    clock = pygame.time.Clock()
+    screen.fill((60, 60, 80))
+    prompt = font.render("Welche Farbe spielst du?", True, (255,255,255))
+    screen.blit(prompt, (WIDTH//2 - prompt.get_width()//2, HEIGHT//2 - 60))
+    w_box = pygame.Rect(WIDTH//2 - 110, HEIGHT//2, 80, 50)
+    b_box = pygame.Rect(WIDTH//2 + 30, HEIGHT//2, 80, 50)
+    pygame.draw.rect(screen, (220,220,220), w_box)
+    pygame.draw.rect(screen, (50,50,50), b_box)
+    w_text = font.render("Weiß", True, (0,0,0))
+    b_text = font.render("Schwarz", True, (255,255,255))
+    screen.blit(w_text, (w_box.x + w_box.width//2 - w_text.get_width()//2, w_box.y + w_box.height//2 - w_text.get_height()//2))
+    screen.blit(b_text, (b_box.x + b_box.width//2 - b_text.get_width()//2, b_box.y + b_box.height//2 - b_text.get_height()//2))
+    pygame.display.flip()
     while True:
-        screen.fill((60, 60, 80))
-        prompt = font.render("Welche Farbe spielst du?", True, (255,255,255))
-        screen.blit(prompt, (WIDTH//2 - prompt.get_width()//2, HEIGHT//2 - 60))
-        w_box = pygame.Rect(WIDTH//2 - 110, HEIGHT//2, 80, 50)
-        b_box = pygame.Rect(WIDTH//2 + 30, HEIGHT//2, 80, 50)
-        pygame.draw.rect(screen, (220,220,220), w_box)
-        pygame.draw.rect(screen, (50,50,50), b_box)
-        w_text = font.render("Weiß", True, (0,0,0))
-        b_text = font.render("Schwarz", True, (255,255,255))
-        screen.blit(w_text, (w_box.x + w_box.width//2 - w_text.get_width()//2, w_box.y + w_box.height//2 - w_text.get_height()//2))
-        screen.blit(b_text, (b_box.x + b_box.width//2 - b_text.get_width()//2, b_box.y + b_box.height//2 - b_text.get_height()//2))
-        pygame.display.flip()
+        clock.tick(FPS)
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -124,45 +181,64 @@ def pvp_network_game(screen):
     server = SERVER
     session_id = text_input_box(screen, "Session-ID für das Spiel eingeben:", HEIGHT//2 - 60, font)
     player = color_choice_box(screen, font)
-    try:
-        requests.post(f"{server}/new_game", json={"session_id": session_id})
-    except Exception as e:
-        print("Konnte kein neues Spiel starten:", e)
+    client = None
+    if USE_WEBSOCKET:
+        try:
+            client = WebSocketClient(server, session_id, new_game=True)
+        except Exception as e:
+            print("WebSocket nicht verfügbar, spiele über HTTP:", e)
+    if client is None:
+        try:
+            client = HttpGameClient(server, session_id, new_game=True, wait_timeout=WAIT_TIMEOUT)
+        except Exception as e:
+            print("Konnte kein neues Spiel starten:", e)
+            return
+    pvp_online_game(screen, font, client, player)
+
+def pvp_online_game(screen, font, client, player):
+    # Das Netzwerk läuft in den Threads von client (WebSocket oder HTTP), hier wird nur gezeichnet.
+    # Ein eigener Zug erscheint sofort und wird zurückgenommen, wenn der Server ihn ablehnt.
+    clock = pygame.time.Clock()
+    renderer = BoardRenderer(screen)
+    confirmed = None  # letzter Stand vom Server
+    pending = None  # confirmed plus eigener, noch nicht bestätigter Zug
     selected = None
     valid_moves = []
     running = True
     while running:
-        resp = requests.get(f"{server}/get_state", params={"session_id": session_id})
-        if resp.status_code != 200:
-            print("Fehler beim Abrufen des Spielstands.")
-            pygame.time.wait(2000)
+        clock.tick(FPS)
+        new_state = client.latest_state()
+        if new_state is not None:
+            confirmed = new_state
+            pending = None
+        if client.pop_error():
+            print("Ungültiger Zug!")
+            pending = None
+        if client.closed:
+            print("Verbindung zum Server verloren.")
+            break
+        data = pending or confirmed
+        if data is None:
+            # Noch kein Stand vom Server: nur auf QUIT achten, damit sich das Fenster trotzdem schließen lässt
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                running = False
             continue
-        data = resp.json()
         board = data["board"]
-        turn = data["turn"]
-        winner = data["winner"]
-        # Dummy-Game-Objekt für draw_board
         game = Game()
         game.board = [row[:] for row in board]
-        draw_board(screen, game, selected, valid_moves)
-        if winner:
+        renderer.draw(board, selected, valid_moves)
+        if data["winner"]:
+            winner = data["winner"]
             msg = "Unentschieden!" if winner == "draw" else f"Spiel beendet! Gewinner: {winner}"
             text = font.render(msg, True, (255,0,0))
             screen.blit(text, (10, HEIGHT//2-20))
             pygame.display.flip()
             pygame.time.wait(2500)
-            running = False
-            continue
-        if turn != player:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-            pygame.time.wait(1000)
-            continue
+            break
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-            elif event.type == pygame.MOUSEBUTTONDOWN:
+            elif event.type == pygame.MOUSEBUTTONDOWN and data["turn"] == player and pending is None:
                 offset_x = (WIDTH - BOARD_SIZE * SQUARE_SIZE) // 2
                 offset_y = (HEIGHT - BOARD_SIZE * SQUARE_SIZE) // 2
                 x, y = event.pos
@@ -172,29 +248,27 @@ def pvp_network_game(screen):
                     if selected is None:
                         if board[r][c] == player:
                             selected = (r, c)
-                            dummy_game = Game()
-                            dummy_game.board = [row[:] for row in board]
-                            valid_moves = [m for m in dummy_game.get_valid_moves(player) if m[0] == selected]
+                            valid_moves = [m for m in game.get_valid_moves(player) if m[0] == selected]
                     else:
                         move = [list(selected), [r, c]]
-                        resp = requests.post(f"{server}/move", json={"session_id": session_id, "move": move})
-                        if resp.status_code == 200:
-                            selected = None
-                            valid_moves = []
-                        else:
-                            print("Ungültiger Zug!")
-                            selected = None
-                            valid_moves = []
+                        client.send_move(move)
+                        pending = optimistic_state(confirmed, move)
+                        selected = None
+                        valid_moves = []
+    client.close()
 
 def gui_game(screen, vs_ai=True):
     font = pygame.font.SysFont(None, 36)
     game = Game()
-    ai = QLearningAI('b')
+    ai = SearchAI('b', SEARCH_TIME_BUDGET) if PVE_AI == "search" else QLearningAI('b')
     selected = None
     valid_moves = []
+    renderer = BoardRenderer(screen)
+    clock = pygame.time.Clock()
     running = True
     while running:
-        draw_board(screen, game, selected, valid_moves)
+        clock.tick(FPS)
+        renderer.draw(game.board, selected, valid_moves)
         if game.is_game_over():
             msg = "Unentschieden!"
             if game.winner == 'w':
@@ -247,21 +321,36 @@ def gui_game(screen, vs_ai=True):
     if vs_ai:
         ai.save_qtable()
 
-def show_training_progress(screen, episodes_done):
+def show_training_progress(screen, episodes_done, metrics=None):
     font = pygame.font.SysFont(None, 36)
-    msg = f"{episodes_done} Spiele abgeschlossen."
+    lines = [f"{episodes_done} Spiele abgeschlossen."]
+    if metrics:
+        lines.append(f"{metrics['episodes_per_sec']:.0f} Spiele/s, Remis {metrics['draw']:.0%}")
+        lines.append(f"Perfekte Züge {metrics['perfect_agreement']:.0%}, TD-Fehler {metrics['td_error']:.3f}")
     screen.fill(MENU_BG)
-    text = font.render(msg, True, (255,255,255))
-    screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - text.get_height()//2))
+    y = HEIGHT//2 - len(lines) * 20
+    for line in lines:
+        text = font.render(line, True, (255,255,255))
+        screen.blit(text, (WIDTH//2 - text.get_width()//2, y))
+        y += 40
     pygame.display.flip()
+    pygame.event.pump()
 
 def train_ai_selfplay_gui(screen, episodes=50000):
+    # episodes ist nur die Obergrenze: EarlyStopping beendet das Training, sobald sich der Anteil
+    # perfekter Züge über mehrere Berichte nicht mehr verbessert
     font = pygame.font.SysFont(None, 36)
-    print(f"Starte Selbstlernmodus für {episodes} Spiele ...")
+    print(f"Starte Selbstlernmodus für höchstens {episodes} Spiele ...")
+    latest = {}
     def progress_callback(episodes_done):
-        show_training_progress(screen, episodes_done)
-    train_ai_selfplay(episodes, progress_callback)
-    print("Training abgeschlossen! Die KI wurde trainiert.")
+        show_training_progress(screen, episodes_done, latest)
+    def on_metrics(metrics):
+        latest.update(metrics)
+        show_training_progress(screen, metrics["episodes"], latest)
+    history = train_ai_selfplay(episodes, progress_callback, workers=os.cpu_count() or 1,
+                                metrics=on_metrics, metrics_interval=1000, early_stop=EarlyStopping())
+    played = history[-1]["episodes"] if history else episodes
+    print(f"Training abgeschlossen nach {played} Spielen! Die KI wurde trainiert.")
     screen.fill(MENU_BG)
     text = font.render("Training abgeschlossen!", True, (255,255,255))
     screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - text.get_height()//2))
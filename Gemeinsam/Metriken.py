@@ -0,0 +1,65 @@
+import bisect
+import threading
+
+# Metriken im Textformat von Prometheus (GET /metrics), gemeinsam für 2.0/Backend.py und Server/flask_app.py.
+# Zähler und Histogramme ohne prometheus_client. Eine Messung ist ein perf_counter-Paar plus ein kurzer
+# Lock, ein paar Mikrosekunden gegenüber mehreren hundert pro Anfrage, und kann daher immer an bleiben.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FAST_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2)
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}  # name -> (typ, hilfe, buckets)
+        self.values = {}  # (name, labels) -> zahl bzw. [zähler je bucket..., +Inf, summe, anzahl]
+
+    def describe(self, name, kind, text, buckets=None):
+        self.families[name] = (kind, text, buckets)
+
+    def inc(self, name, labels=(), value=1):
+        with self.lock:
+            self.values[(name, labels)] = self.values.get((name, labels), 0) + value
+
+    def observe(self, name, value, labels=()):
+        buckets = self.families[name][2]
+        i = bisect.bisect_left(buckets, value)
+        with self.lock:
+            hist = self.values.get((name, labels))
+            if hist is None:
+                hist = self.values[(name, labels)] = [0] * (len(buckets) + 1) + [0.0, 0]
+            hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def render(self, extra=()):
+        # extra: (name, typ, hilfe, [(labels, wert), ...]) für Werte, die erst beim Abruf gelesen werden
+        with self.lock:
+            values = {key: list(value) if isinstance(value, list) else value for key, value in self.values.items()}
+        lines = []
+        families = [(name, kind, text, buckets) for name, (kind, text, buckets) in self.families.items()]
+        for name, kind, text, buckets in families:
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (sample, labels), value in values.items():
+                if sample != name:
+                    continue
+                if kind != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+                    continue
+                total = 0
+                for bound, count in zip(buckets + ("+Inf",), value):
+                    total += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {total}")
+                lines.append(f"{name}_sum{format_labels(labels)} {value[-2]}")
+                lines.append(f"{name}_count{format_labels(labels)} {value[-1]}")
+        for name, kind, text, samples in extra:
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('%s="%s"' % (key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels) + "}"
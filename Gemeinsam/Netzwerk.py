@@ -0,0 +1,216 @@
+import json
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import websocket  # Paket "websocket-client"
+except ImportError:  # ohne das Paket spielen die Frontends weiter über HTTP
+    websocket = None
+
+class HttpClient:
+    # Eine requests.Session pro Server: die Verbindung bleibt offen (Keep-Alive), jede Anfrage kostet dann
+    # nur noch einen Round-Trip statt TCP- und TLS-Handshake. Verbindungsfehler werden mit Backoff wiederholt,
+    # GET zusätzlich bei 502/503/504 (POST nicht, sonst könnte ein Zug doppelt ankommen).
+    # Mit cache_key wird die letzte Antwort gemerkt: schickt der Server ein ETag, fragt der nächste GET mit
+    # If-None-Match und ein 304 liefert das alte Ergebnis; ist der Body byte-gleich, wird er nicht neu geparst.
+    def __init__(self, server, timeout=5, retries=3, backoff=0.2):
+        self.server = server.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(["GET"]), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.cache = {}  # cache_key -> (ETag, Body, geparstes JSON)
+
+    def get(self, path, params=None, cache_key=None, timeout=None):
+        # Liefert (statuscode, json); wirft requests.RequestException, wenn der Server nicht erreichbar ist
+        cached = self.cache.get(cache_key)
+        headers = {"If-None-Match": cached[0]} if cached is not None and cached[0] else {}
+        resp = self.session.get(self.server + path, params=params, headers=headers, timeout=timeout or self.timeout)
+        if resp.status_code == 304 and cached is not None:
+            return 200, cached[2]
+        return resp.status_code, self._json(resp, cache_key)
+
+    def post(self, path, data, cache_key=None, timeout=None):
+        resp = self.session.post(self.server + path, json=data, timeout=timeout or self.timeout)
+        return resp.status_code, self._json(resp, cache_key)
+
+    def _json(self, resp, cache_key):
+        if resp.status_code != 200 or cache_key is None:
+            try:
+                return resp.json()
+            except ValueError:
+                return None
+        cached = self.cache.get(cache_key)
+        if cached is not None and cached[1] == resp.content:
+            data = cached[2]
+        else:
+            data = resp.json()
+        self.cache[cache_key] = (resp.headers.get("ETag"), resp.content, data)
+        return data
+
+    def close(self):
+        self.session.close()
+
+def websocket_url(server):
+    # http://host:5000 -> ws://host:5000/ws, https://... -> wss://.../ws
+    if server.startswith("https://"):
+        return "wss://" + server[len("https://"):] + "/ws"
+    return "ws://" + server[len("http://"):] + "/ws"
+
+class WebSocketClient:
+    # Eine offene Verbindung pro Partie. Ein Lese-Thread legt jeden Stand, den der Server schickt,
+    # in self.states ab; abgelehnte Züge landen in self.errors. Das Frontend leert beide pro Frame.
+    def __init__(self, server, session_id, new_game=False, timeout=5):
+        if websocket is None:
+            raise ImportError("WebSocketClient benötigt das Paket websocket-client")
+        self.ws = websocket.create_connection(websocket_url(server), timeout=timeout)
+        self.ws.settimeout(None)
+        self.states = queue.Queue()
+        self.errors = queue.Queue()
+        self.closed = False
+        self._send({"type": "join", "session_id": session_id, "new_game": new_game})
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _send(self, message):
+        self.ws.send(json.dumps(message))
+
+    def _read(self):
+        try:
+            while True:
+                message = json.loads(self.ws.recv())
+                if message.get("type") == "state":
+                    self.states.put(message)
+                elif message.get("type") == "error":
+                    self.errors.put(message["error"])
+        except Exception:
+            self.closed = True
+
+    def send_move(self, move):
+        self._send({"type": "move", "move": move})
+
+    def latest_state(self):
+        # Nur der neueste Stand ist interessant, ältere werden verworfen
+        state = None
+        while True:
+            try:
+                state = self.states.get_nowait()
+            except queue.Empty:
+                return state
+
+    def pop_error(self):
+        try:
+            return self.errors.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+class HttpGameClient:
+    # Gleiche Schnittstelle wie WebSocketClient, nur über HTTP: ein Thread long-pollt /wait_state, ein zweiter
+    # schickt die Züge aus self.moves ab. Beide haben ihre eigene HttpClient-Verbindung, ein laufender
+    # Long-Poll hält also keinen Zug auf. Es landen nur Stände mit neuerer Version in self.states.
+    def __init__(self, server, session_id, new_game=False, wait_timeout=5, max_failures=5):
+        self.session_id = session_id
+        self.wait_timeout = wait_timeout
+        self.max_failures = max_failures
+        self.poll_http = HttpClient(server)
+        self.move_http = HttpClient(server)
+        if new_game:
+            self.move_http.post("/new_game", {"session_id": session_id})
+        self.states = queue.Queue()
+        self.errors = queue.Queue()
+        self.moves = queue.Queue()
+        self.closed = False
+        self.version = None
+        self._lock = threading.Lock()
+        self._poller = threading.Thread(target=self._poll, daemon=True)
+        self._sender = threading.Thread(target=self._send_moves, daemon=True)
+        self._poller.start()
+        self._sender.start()
+
+    def _publish(self, state):
+        with self._lock:
+            if self.version is not None and state["version"] <= self.version:
+                return
+            self.version = state["version"]
+        self.states.put(state)
+
+    def _poll(self):
+        failures = 0
+        while not self.closed:
+            params = {"session_id": self.session_id, "timeout": self.wait_timeout}
+            if self.version is not None:
+                params["since"] = self.version
+            try:
+                status, state = self.poll_http.get("/wait_state", params, cache_key=self.session_id,
+                                                   timeout=self.wait_timeout + 5)
+            except requests.RequestException:
+                status, state = None, None
+            if status == 200:
+                failures = 0
+                self._publish(state)
+                continue
+            failures += 1
+            if failures >= self.max_failures:
+                self.closed = True
+                break
+            time.sleep(min(2 ** failures * 0.1, 2))
+
+    def _send_moves(self):
+        while True:
+            move = self.moves.get()
+            if move is None:
+                break
+            try:
+                status, result = self.move_http.post("/move", {"session_id": self.session_id, "move": move},
+                                                     cache_key=self.session_id)
+            except requests.RequestException as e:
+                status, result = None, {"error": str(e)}
+            if status == 200:
+                self._publish(result)
+            else:
+                self.errors.put((result or {}).get("error", "HTTP %s" % status))
+
+    def send_move(self, move):
+        self.moves.put(move)
+
+    def latest_state(self):
+        state = None
+        while True:
+            try:
+                state = self.states.get_nowait()
+            except queue.Empty:
+                return state
+
+    def pop_error(self):
+        try:
+            return self.errors.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+        self.moves.put(None)
+        self.poll_http.close()
+        self.move_http.close()
+
+def optimistic_state(state, move):
+    # Eigener Zug sofort auf einer Kopie des Server-Stands, bis der Server antwortet (Sieger entscheidet er)
+    (r1, c1), (r2, c2) = move
+    board = [row[:] for row in state["board"]]
+    board[r2][c2] = board[r1][c1]
+    board[r1][c1] = '.'
+    return dict(state, board=board, turn='b' if state["turn"] == 'w' else 'w')
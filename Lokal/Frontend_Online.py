@@ -1,9 +1,14 @@
+import os
+import sys
 import requests
-import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Gemeinsam"))  # Netzwerk.py liegt in Gemeinsam/
+from Netzwerk import HttpClient
 
 SERVER = "http://10.0.3.104:5000"
+WAIT_TIMEOUT = 25  # Sekunden, die /wait_state höchstens auf eine Änderung wartet
 SESSION_ID = input("Session-ID für das Spiel eingeben (z.B. 'spiel123'): ")
 PLAYER = input("Welche Farbe spielst du? (w für Weiß, b für Schwarz): ").strip().lower()
+http = HttpClient(SERVER)  # eine offene Verbindung für alle Anfragen
 
 def print_board(board):
     print("  0 1 2")
@@ -13,22 +18,31 @@ def print_board(board):
 
 def main():
     try:
-        requests.post(f"{SERVER}/new_game", json={"session_id": SESSION_ID})
+        http.post("/new_game", {"session_id": SESSION_ID})
     except Exception as e:
         print("Konnte kein neues Spiel starten:", e)
 
     last_board = None
     last_turn = None
+    version = None
 
     while True:
-        resp = requests.get(f"{SERVER}/get_state", params={"session_id": SESSION_ID})
-        if resp.status_code != 200:
-            print("Fehler beim Abrufen des Spielstands:", resp.text)
+        # Long-Poll: der Server antwortet sofort, wenn sich seit "version" etwas geändert hat, sonst nach WAIT_TIMEOUT
+        params = {"session_id": SESSION_ID, "timeout": WAIT_TIMEOUT}
+        if version is not None:
+            params["since"] = version
+        try:
+            status, data = http.get("/wait_state", params, cache_key=SESSION_ID, timeout=WAIT_TIMEOUT + 5)
+        except requests.RequestException as e:
+            print("Server nicht erreichbar:", e)
+            break
+        if status != 200:
+            print("Fehler beim Abrufen des Spielstands:", data)
             break
-        data = resp.json()
         board = data["board"]
         turn = data["turn"]
         winner = data["winner"]
+        version = data["version"]
 
         # Nur anzeigen, wenn sich Brett oder Spieler geändert hat
         if board != last_board or turn != last_turn:
@@ -42,7 +56,6 @@ def main():
             break
 
         if turn != PLAYER:
-            time.sleep(2)
             continue
 
         move_str = input("Dein Zug (z.B. 0 0 1 0): ")
@@ -51,10 +64,13 @@ def main():
             move = [[r1, c1], [r2, c2]]
         except Exception:
             print("Ungültiges Format!")
+            version = None
             continue
-        resp = requests.post(f"{SERVER}/move", json={"session_id": SESSION_ID, "move": move})
-        if resp.status_code != 200:
-            print("Ungültiger Zug, bitte nochmal!", resp.text)
+        status, result = http.post("/move", {"session_id": SESSION_ID, "move": move}, cache_key=SESSION_ID)
+        if status != 200:
+            print("Ungültiger Zug, bitte nochmal!", result)
+            # Gleicher Stand wie vorher, also ohne Warten neu abfragen
+            version = None
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
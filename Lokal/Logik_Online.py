@@ -1,8 +1,19 @@
 import random
 import os
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:  # WebSocket-Kanal ist optional, die HTTP-Endpunkte laufen auch ohne flask-sock
+    Sock = None
+
 BOARD_SIZE = 3
 
 class Game:
@@ -54,12 +65,182 @@ class Game:
 app = Flask(__name__)
 CORS(app)
 
-games = {}  # session_id -> Game
+versions = {}  # session_id -> Zähler, steigt bei jeder Änderung
+state_lock = threading.RLock()  # schützt games, versions und die Partien selbst
+session_changed = {}  # session_id -> [Condition auf state_lock, Anzahl Wartende], nur solange jemand wartet
+WAIT_TIMEOUT_MAX = 60
+rooms = {}  # session_id -> offene WebSocket-Verbindungen
+sockets_lock = threading.Lock()  # schützt nur rooms, gesendet wird außerhalb
+send_locks = {}  # WebSocket -> Lock, damit pro Verbindung nur ein Thread gleichzeitig sendet
+
+SESSION_IDLE_TTL = 30 * 60  # Sekunden ohne Zugriff, danach wird eine laufende Partie entfernt
+SESSION_FINISHED_TTL = 5 * 60  # beendete Partien werden früher aufgeräumt
+SESSION_MAX = 10000  # harte Obergrenze, darüber fliegt die am längsten unbenutzte Partie raus
+SESSION_REAP_INTERVAL = 30  # Sekunden zwischen zwei Durchläufen des Aufräum-Threads
+
+class SessionStore:
+    # session_id -> Game in LRU-Reihenfolge (zuletzt benutzt am Ende) mit Zeitpunkt des letzten Zugriffs.
+    # Benutzt state_lock als Sperre: entfernte Partien verlieren auch ihren Eintrag in versions,
+    # wartende Long-Polls wachen dann auf und bekommen 404. Partien mit offenem WebSocket räumt der
+    # Aufräum-Thread nicht weg, nur die Obergrenze.
+    def __init__(self, lock, idle_ttl=SESSION_IDLE_TTL, finished_ttl=SESSION_FINISHED_TTL,
+                 max_sessions=SESSION_MAX, reap_interval=SESSION_REAP_INTERVAL):
+        self.lock = lock
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.max_sessions = max_sessions
+        self.reap_interval = reap_interval
+        self.entries = OrderedDict()  # session_id -> [game, letzter Zugriff]
+        self.evicted = 0
+        self.expired = 0
+        self._reaper = None
+
+    def __contains__(self, session_id):
+        return session_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, session_id):
+        with self.lock:
+            entry = self.entries.get(session_id)
+            if entry is None:
+                return None
+            entry[1] = time.monotonic()
+            self.entries.move_to_end(session_id)
+            return entry[0]
+
+    def put(self, session_id, game):
+        with self.lock:
+            self.entries[session_id] = [game, time.monotonic()]
+            self.entries.move_to_end(session_id)
+            while len(self.entries) > self.max_sessions:
+                old_id, _ = self.entries.popitem(last=False)
+                self._forget(old_id)
+                self.evicted += 1
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+                self._reaper.start()
+
+    def _forget(self, session_id):
+        versions.pop(session_id, None)
+        notify_change(session_id)
+
+    def reap(self, now=None):
+        # Vorne stehen die am längsten unbenutzten Partien, ab der ersten zu jungen kann keine mehr ablaufen
+        now = time.monotonic() if now is None else now
+        min_ttl = min(self.idle_ttl, self.finished_ttl)
+        with self.lock:
+            for session_id, (game, last_access) in list(self.entries.items()):
+                if now - last_access <= min_ttl:
+                    break
+                ttl = self.finished_ttl if game.winner is not None else self.idle_ttl
+                if now - last_access > ttl and session_id not in rooms:
+                    del self.entries[session_id]
+                    self._forget(session_id)
+                    self.expired += 1
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.reap_interval)
+            self.reap()
+
+    def stats(self):
+        with self.lock:
+            finished = sum(1 for game, _ in self.entries.values() if game.winner is not None)
+            return {
+                "live": len(self.entries) - finished,
+                "finished": finished,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "max_sessions": self.max_sessions,
+                "sockets": sum(len(sockets) for sockets in list(rooms.values()))
+            }
+
+games = SessionStore(state_lock)  # session_id -> Game
+
+def state_payload(session_id, game):
+    return {
+        "board": game.board,
+        "turn": game.turn,
+        "winner": game.winner,
+        "version": versions.get(session_id, 0)
+    }
+
+def publish(session_id, payload):
+    # Schickt den neuen Stand an alle WebSocket-Teilnehmer der Partie (HTTP-Clients bekommen ihn über /wait_state)
+    # Ein langsamer Client hält so nur seine eigene Verbindung auf, nicht andere Partien oder /move.
+    message = json.dumps(dict(payload, type="state"))
+    with sockets_lock:
+        members = list(rooms.get(session_id, ()))
+    for ws in members:
+        try:
+            send_ws(ws, message)
+        except Exception:
+            with sockets_lock:
+                rooms.get(session_id, set()).discard(ws)
+            send_locks.pop(ws, None)
+
+def send_ws(ws, message):
+    with send_locks.setdefault(ws, threading.Lock()):
+        ws.send(message)
+
+def notify_change(session_id):
+    # Nur unter state_lock aufrufen: weckt die Long-Polls dieser einen Partie
+    entry = session_changed.get(session_id)
+    if entry is not None:
+        entry[0].notify_all()
+
+def wait_for_change(session_id, since, timeout):
+    # Nur unter state_lock aufrufen. Jede Partie hat ihre eigene Condition, ein Zug weckt nicht
+    # alle wartenden Long-Polls des Servers, sondern nur die seiner Partie.
+    entry = session_changed.get(session_id)
+    if entry is None:
+        entry = session_changed[session_id] = [threading.Condition(state_lock), 0]
+    entry[1] += 1
+    try:
+        entry[0].wait_for(lambda: versions.get(session_id) != since, timeout)
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del session_changed[session_id]
+
+def start_game(session_id):
+    with state_lock:
+        game = Game()
+        games.put(session_id, game)
+        versions[session_id] = versions.get(session_id, 0) + 1
+        notify_change(session_id)
+        payload = state_payload(session_id, game)
+    publish(session_id, payload)
+
+def apply_move(session_id, move):
+    # Gemeinsam für POST /move und den WebSocket-Kanal: (payload, fehler, statuscode)
+    if not isinstance(session_id, str):
+        return None, "Bad request", 400
+    game = games.get(session_id)
+    if not game:
+        return None, "No such game", 404
+    try:
+        move_tuple = (tuple(move[0]), tuple(move[1]))
+    except (TypeError, IndexError):
+        return None, "Bad request", 400
+    with state_lock:
+        if move_tuple not in game.get_valid_moves(game.turn):
+            return None, "Invalid move", 400
+        game.make_move(move_tuple)
+        versions[session_id] = versions.get(session_id, 0) + 1
+        notify_change(session_id)
+        payload = state_payload(session_id, game)
+    publish(session_id, payload)
+    return payload, None, 200
 
 @app.route("/new_game", methods=["POST"])
 def new_game():
     session_id = request.json.get("session_id")
-    games[session_id] = Game()
+    if not isinstance(session_id, str):
+        return jsonify({"error": "Bad request"}), 400
+    start_game(session_id)
     return jsonify({"status": "ok"})
 
 @app.route("/get_state", methods=["GET"])
@@ -68,28 +249,127 @@ def get_state():
     game = games.get(session_id)
     if not game:
         return jsonify({"error": "No such game"}), 404
-    return jsonify({
-        "board": game.board,
-        "turn": game.turn,
-        "winner": game.winner
-    })
+    return jsonify(state_payload(session_id, game))
+
+@app.route("/wait_state", methods=["GET"])
+def wait_state():
+    # Long-Poll: antwortet erst, wenn sich die Version gegenüber "since" geändert hat (oder nach timeout Sekunden)
+    session_id = request.args.get("session_id")
+    since = request.args.get("since", type=int)
+    timeout = request.args.get("timeout", 25, type=float)
+    if not math.isfinite(timeout):
+        return jsonify({"error": "Bad request"}), 400
+    timeout = max(0.0, min(timeout, WAIT_TIMEOUT_MAX))
+    with state_lock:
+        wait_for_change(session_id, since, timeout)
+        game = games.get(session_id)
+        if not game:
+            return jsonify({"error": "No such game"}), 404
+        return jsonify(state_payload(session_id, game))
 
 @app.route("/move", methods=["POST"])
 def move():
     session_id = request.json.get("session_id")
     move = request.json.get("move")  # [[r1, c1], [r2, c2]]
-    game = games.get(session_id)
-    if not game:
-        return jsonify({"error": "No such game"}), 404
-    move_tuple = (tuple(move[0]), tuple(move[1]))
-    if move_tuple not in game.get_valid_moves(game.turn):
-        return jsonify({"error": "Invalid move"}), 400
-    game.make_move(move_tuple)
-    return jsonify({
-        "board": game.board,
-        "turn": game.turn,
-        "winner": game.winner
-    })
+    payload, error, status = apply_move(session_id, move)
+    if error:
+        return jsonify({"error": error}), status
+    return jsonify(payload)
+
+BATCH_MAX = 1000  # Operationen pro /batch-Anfrage
+
+def run_op(op):
+    # Eine Operation aus /batch: (statuscode, body) genau wie beim einzelnen Endpunkt
+    session_id = op.get("session_id")
+    kind = op.get("op")
+    if not isinstance(session_id, str):
+        return 400, {"error": "Bad request"}
+    if kind == "new_game":
+        start_game(session_id)
+        return 200, {"status": "ok"}
+    if kind == "get_state":
+        game = games.get(session_id)
+        if not game:
+            return 404, {"error": "No such game"}
+        return 200, state_payload(session_id, game)
+    if kind == "move":
+        try:
+            payload, error, status = apply_move(session_id, op.get("move"))
+        except (TypeError, IndexError):
+            return 400, {"error": "Bad request"}
+        if error:
+            return status, {"error": error}
+        return 200, payload
+    return 400, {"error": "Unknown op"}
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    # Für Bots: [{"session_id": ..., "op": "new_game" | "get_state" | "move", "move": ...}, ...]
+    # werden der Reihe nach ausgeführt, Antwort {"results": [{"status": 200, "body": {...}}, ...]}
+    ops = request.json
+    if not isinstance(ops, list) or len(ops) > BATCH_MAX or not all(isinstance(op, dict) for op in ops):
+        return jsonify({"error": "Bad request"}), 400
+    results = []
+    for op in ops:
+        status, body = run_op(op)
+        results.append({"status": status, "body": body})
+    return jsonify({"results": results})
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify(games.stats())
+
+# --- WebSocket-Kanal /ws (braucht flask-sock) ---
+# Client -> Server: {"type": "join", "session_id": ..., "new_game": false}
+#                   {"type": "move", "move": [[r1, c1], [r2, c2]]}
+# Server -> Client: {"type": "state", "board": ..., "turn": ..., "winner": ..., "version": ...}
+#                   {"type": "error", "error": ...}
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route("/ws")
+    def game_socket(ws):
+        session_id = None
+        try:
+            while True:
+                # Ein kaputter Frame (kein JSON, falsche Felder) wird mit einem Fehler beantwortet,
+                # die Verbindung bleibt offen
+                error = None
+                try:
+                    message = json.loads(ws.receive())
+                    if not isinstance(message, dict):
+                        raise ValueError("message is not an object")
+                    if message.get("type") == "join":
+                        if not isinstance(message.get("session_id"), str):
+                            raise ValueError("session_id missing")
+                        with sockets_lock:
+                            if session_id is not None:
+                                rooms.get(session_id, set()).discard(ws)
+                            session_id = message["session_id"]
+                            rooms.setdefault(session_id, set()).add(ws)
+                        game = games.get(session_id)
+                        if message.get("new_game") or game is None:
+                            start_game(session_id)
+                        else:
+                            send_ws(ws, json.dumps(dict(state_payload(session_id, game), type="state")))
+                    elif message.get("type") == "move":
+                        if session_id is None:
+                            error = "Join a game first"
+                        else:
+                            _, error, _ = apply_move(session_id, message.get("move"))
+                except (ValueError, TypeError, IndexError):
+                    error = "Bad request"
+                if error:
+                    send_ws(ws, json.dumps({"type": "error", "error": error}))
+        except ConnectionClosed:
+            pass
+        finally:
+            with sockets_lock:
+                if session_id in rooms:
+                    rooms[session_id].discard(ws)
+                    if not rooms[session_id]:
+                        del rooms[session_id]
+            send_locks.pop(ws, None)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", debug=True)
\ No newline at end of file
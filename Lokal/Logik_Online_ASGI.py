@@ -0,0 +1,234 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from urllib.parse import parse_qs
+from Logik_Online import Game, SessionStore
+
+# ASGI-Variante des Netzwerk-PvP aus Logik_Online.py, ohne Framework und mit demselben JSON.
+# Starten mit: uvicorn Logik_Online_ASGI:app --host 0.0.0.0 --port 5000
+# Jeder wartende Client (/wait_state, /events) ist nur eine Coroutine und kein Thread.
+# /ws gibt es hier nicht, die Frontends spielen dann automatisch über HTTP.
+
+WAIT_TIMEOUT_MAX = 60
+EVENTS_HEARTBEAT = 15  # Sekunden, danach schickt /events eine Kommentarzeile, damit die Verbindung offen bleibt
+
+versions = {}  # session_id -> Zähler, steigt bei jeder Änderung
+changed = {}  # session_id -> [asyncio.Event, Anzahl Wartende], wird bei jeder Änderung gesetzt und ersetzt
+loop = None
+
+def notify(session_id):
+    entry = changed.pop(session_id, None)
+    if entry is not None:
+        entry[0].set()
+
+async def wait_event(session_id, timeout):
+    # True, wenn notify(session_id) kam, False nach timeout Sekunden
+    entry = changed.get(session_id)
+    if entry is None:
+        entry = changed[session_id] = [asyncio.Event(), 0]
+    entry[1] += 1
+    try:
+        await asyncio.wait_for(entry[0].wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and changed.get(session_id) is entry:
+            del changed[session_id]
+
+class AsyncSessionStore(SessionStore):
+    # Wie SessionStore, aber entfernte Partien wecken die wartenden Coroutinen.
+    # Der Aufräum-Thread läuft außerhalb der Event-Loop, daher call_soon_threadsafe.
+    def _forget(self, session_id):
+        versions.pop(session_id, None)
+        loop.call_soon_threadsafe(notify, session_id)
+
+games = AsyncSessionStore(threading.RLock())  # session_id -> Game
+
+def state_payload(session_id, game):
+    return {
+        "board": game.board,
+        "turn": game.turn,
+        "winner": game.winner,
+        "version": versions.get(session_id, 0)
+    }
+
+def start_game(session_id):
+    game = Game()
+    games.put(session_id, game)
+    versions[session_id] = versions.get(session_id, 0) + 1
+    notify(session_id)
+    return game
+
+def apply_move(session_id, move):
+    # (payload, fehler, statuscode) wie apply_move in Logik_Online.py
+    game = games.get(session_id)
+    if not game:
+        return None, "No such game", 404
+    try:
+        move_tuple = (tuple(move[0]), tuple(move[1]))
+    except (TypeError, IndexError):
+        return None, "Bad request", 400
+    if move_tuple not in game.get_valid_moves(game.turn):
+        return None, "Invalid move", 400
+    game.make_move(move_tuple)
+    versions[session_id] = versions.get(session_id, 0) + 1
+    notify(session_id)
+    return state_payload(session_id, game), None, 200
+
+async def wait_change(session_id, since, timeout):
+    # Wartet, bis sich die Version gegenüber since ändert; False nach timeout Sekunden
+    deadline = time.monotonic() + timeout
+    while versions.get(session_id) == since:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not await wait_event(session_id, remaining):
+            return False
+    return True
+
+# --- HTTP-Hilfen ---
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+
+def query(scope):
+    return {key: values[0] for key, values in parse_qs(scope["query_string"].decode()).items()}
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"null")
+    except ValueError:
+        return None
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + CORS_HEADERS
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+# --- Endpunkte, gleiche Anfragen und Antworten wie Logik_Online.py ---
+async def new_game(scope, receive, send):
+    data = await read_json(receive)
+    if not isinstance(data, dict) or not isinstance(data.get("session_id"), str):
+        return await send_json(send, {"error": "Bad request"}, 400)
+    start_game(data["session_id"])
+    await send_json(send, {"status": "ok"})
+
+async def get_state(scope, receive, send):
+    session_id = query(scope).get("session_id")
+    game = games.get(session_id)
+    if not game:
+        return await send_json(send, {"error": "No such game"}, 404)
+    await send_json(send, state_payload(session_id, game))
+
+async def wait_state(scope, receive, send):
+    # Long-Poll: antwortet erst, wenn sich die Version gegenüber "since" geändert hat (oder nach timeout Sekunden)
+    params = query(scope)
+    session_id = params.get("session_id")
+    try:
+        since = int(params["since"]) if "since" in params else None
+        timeout = float(params.get("timeout", 25))
+    except ValueError:
+        return await send_json(send, {"error": "Bad request"}, 400)
+    if not math.isfinite(timeout):
+        return await send_json(send, {"error": "Bad request"}, 400)
+    timeout = max(0.0, min(timeout, WAIT_TIMEOUT_MAX))
+    await wait_change(session_id, since, timeout)
+    game = games.get(session_id)
+    if not game:
+        return await send_json(send, {"error": "No such game"}, 404)
+    await send_json(send, state_payload(session_id, game))
+
+async def move(scope, receive, send):
+    data = await read_json(receive)
+    if not isinstance(data, dict) or not isinstance(data.get("session_id"), str):
+        return await send_json(send, {"error": "Bad request"}, 400)
+    payload, error, status = apply_move(data["session_id"], data.get("move"))
+    if error:
+        return await send_json(send, {"error": error}, status)
+    await send_json(send, payload)
+
+async def events(scope, receive, send):
+    # Server-Sent Events: jeder neue Stand als "data: {...}", solange der Client verbunden ist
+    session_id = query(scope).get("session_id")
+    if not games.get(session_id):
+        return await send_json(send, {"error": "No such game"}, 404)
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")] + CORS_HEADERS
+    })
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    since = None
+    try:
+        while not disconnected.done():
+            game = games.get(session_id)
+            if not game:
+                chunk = "event: error\ndata: " + json.dumps({"error": "No such game"}) + "\n\n"
+                await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+                break
+            payload = state_payload(session_id, game)
+            if payload["version"] != since:
+                since = payload["version"]
+                chunk = "data: " + json.dumps(payload) + "\n\n"
+            else:
+                chunk = ": ping\n\n"
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+            waiter = asyncio.ensure_future(wait_change(session_id, since, EVENTS_HEARTBEAT))
+            await asyncio.wait({waiter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+    finally:
+        disconnected.cancel()
+    await send({"type": "http.response.body", "body": b""})
+
+ROUTES = {
+    ("POST", "/new_game"): new_game,
+    ("GET", "/get_state"): get_state,
+    ("GET", "/wait_state"): wait_state,
+    ("POST", "/move"): move,
+    ("GET", "/events"): events,
+    ("GET", "/stats"): lambda scope, receive, send: send_json(send, games.stats()),
+}
+
+async def app(scope, receive, send):
+    global loop
+    if scope["type"] == "lifespan":
+        while (await receive())["type"] != "lifespan.shutdown":
+            await send({"type": "lifespan.startup.complete"})
+        await send({"type": "lifespan.shutdown.complete"})
+        return
+    loop = loop or asyncio.get_running_loop()
+    if scope["type"] != "http":
+        # z. B. websocket: ablehnen, die Frontends fallen dann auf HTTP zurück
+        await send({"type": "websocket.close", "code": 1008})
+        return
+    if scope["method"] == "OPTIONS":
+        await send({
+            "type": "http.response.start",
+            "status": 204,
+            "headers": CORS_HEADERS + [(b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+                                       (b"access-control-allow-headers", b"Content-Type")]
+        })
+        await send({"type": "http.response.body", "body": b""})
+        return
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        return await send_json(send, {"error": "Not found"}, 404)
+    await handler(scope, receive, send)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
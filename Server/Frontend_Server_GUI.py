@@ -1,23 +1,35 @@
+import os
+import sys
 import pygame
-import requests
 import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Gemeinsam"))  # Netzwerk.py liegt in Gemeinsam/
+from Netzwerk import HttpGameClient, optimistic_state
 
 SERVER = "https://swurbs.pythonanywhere.com"
 
+WAIT_TIMEOUT = 5  # Sekunden pro Long-Poll auf /wait_state
+
 BOARD_SIZE = 3
 SQUARE_SIZE = 180
 WIDTH, HEIGHT = BOARD_SIZE * SQUARE_SIZE, BOARD_SIZE * SQUARE_SIZE
+FPS = 60  # Obergrenze für alle Schleifen, gezeichnet wird trotzdem nur, was sich geändert hat
 
 def text_input_box(screen, prompt, y, font):
+    # Neu gezeichnet wird nur, wenn sich die Eingabe ändert
+    clock = pygame.time.Clock()
+    prompt_surf = font.render(prompt, True, (255,255,255))
     input_text = ""
+    changed = True
     active = True
     while active:
-        screen.fill((60, 60, 80))
-        prompt_surf = font.render(prompt, True, (255,255,255))
-        screen.blit(prompt_surf, (WIDTH//2 - prompt_surf.get_width()//2, y))
-        input_surf = font.render(input_text, True, (255,255,0))
-        screen.blit(input_surf, (WIDTH//2 - input_surf.get_width()//2, y+50))
-        pygame.display.flip()
+        clock.tick(FPS)
+        if changed:
+            screen.fill((60, 60, 80))
+            screen.blit(prompt_surf, (WIDTH//2 - prompt_surf.get_width()//2, y))
+            input_surf = font.render(input_text, True, (255,255,0))
+            screen.blit(input_surf, (WIDTH//2 - input_surf.get_width()//2, y+50))
+            pygame.display.flip()
+            changed = False
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -27,25 +39,30 @@ def text_input_box(screen, prompt, y, font):
                     active = False
                 elif event.key == pygame.K_BACKSPACE:
                     input_text = input_text[:-1]
+                    changed = True
                 else:
                     if len(input_text) < 20:
                         input_text += event.unicode
+                        changed = True
     return input_text.strip()
 
 def color_choice_box(screen, font):
+    # Der Bildschirm ändert sich nicht: einmal zeichnen, danach nur noch auf einen Klick warten
+    clock = pygame.time.Clock()
+    screen.fill((60, 60, 80))
+    prompt = font.render("Welche Farbe spielst du?", True, (255,255,255))
+    screen.blit(prompt, (WIDTH//2 - prompt.get_width()//2, HEIGHT//2 - 60))
+    w_box = pygame.Rect(WIDTH//2 - 110, HEIGHT//2, 80, 50)
+    b_box = pygame.Rect(WIDTH//2 + 30, HEIGHT//2, 80, 50)
+    pygame.draw.rect(screen, (220,220,220), w_box)
+    pygame.draw.rect(screen, (50,50,50), b_box)
+    w_text = font.render("Weiß", True, (0,0,0))
+    b_text = font.render("Schwarz", True, (255,255,255))
+    screen.blit(w_text, (w_box.x + w_box.width//2 - w_text.get_width()//2, w_box.y + w_box.height//2 - w_text.get_height()//2))
+    screen.blit(b_text, (b_box.x + b_box.width//2 - b_text.get_width()//2, b_box.y + b_box.height//2 - b_text.get_height()//2))
+    pygame.display.flip()
     while True:
-        screen.fill((60, 60, 80))
-        prompt = font.render("Welche Farbe spielst du?", True, (255,255,255))
-        screen.blit(prompt, (WIDTH//2 - prompt.get_width()//2, HEIGHT//2 - 60))
-        w_box = pygame.Rect(WIDTH//2 - 110, HEIGHT//2, 80, 50)
-        b_box = pygame.Rect(WIDTH//2 + 30, HEIGHT//2, 80, 50)
-        pygame.draw.rect(screen, (220,220,220), w_box)
-        pygame.draw.rect(screen, (50,50,50), b_box)
-        w_text = font.render("Weiß", True, (0,0,0))
-        b_text = font.render("Schwarz", True, (255,255,255))
-        screen.blit(w_text, (w_box.x + w_box.width//2 - w_text.get_width()//2, w_box.y + w_box.height//2 - w_text.get_height()//2))
-        screen.blit(b_text, (b_box.x + b_box.width//2 - b_text.get_width()//2, b_box.y + b_box.height//2 - b_text.get_height()//2))
-        pygame.display.flip()
+        clock.tick(FPS)
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
@@ -56,82 +73,91 @@ def color_choice_box(screen, font):
                 elif b_box.collidepoint(event.pos):
                     return "b"
 
-def get_state(session_id):
-    resp = requests.get(f"{SERVER}/get_state", params={"session_id": session_id})
-    if resp.status_code != 200:
-        return None
-    return resp.json()
-
-def send_move(session_id, move):
-    resp = requests.post(f"{SERVER}/move", json={"session_id": session_id, "move": move})
-    return resp.status_code == 200
-
-def draw_board(screen, board, selected=None):
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            rect = pygame.Rect(c*SQUARE_SIZE, r*SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-            color = (240,240,240) if (r+c)%2==0 else (100,200,100)
-            pygame.draw.rect(screen, color, rect)
-            piece = board[r][c]
-            if piece == 'w':
-                pygame.draw.circle(screen, (220,220,220), rect.center, SQUARE_SIZE//3)
-            elif piece == 'b':
-                pygame.draw.circle(screen, (50,50,50), rect.center, SQUARE_SIZE//3)
-            if selected == (r, c):
-                pygame.draw.rect(screen, (100,100,200), rect, 4)
-    pygame.display.flip()
-
-def main():
-    pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption("Online Bauernschach")
-    font = pygame.font.SysFont(None, 40)
-
-    # Session-ID und Farbe im GUI abfragen
-    session_id = text_input_box(screen, "Session-ID für das Spiel eingeben:", HEIGHT//2 - 80, font)
-    player = color_choice_box(screen, font)
-
-    # Versuche, ein neues Spiel zu starten (ignoriert Fehler, falls es schon existiert)
-    try:
-        requests.post(f"{SERVER}/new_game", json={"session_id": session_id})
-    except Exception as e:
-        print("Konnte kein neues Spiel starten:", e)
-
+class BoardRenderer:
+    # Felder, Steine und Auswahlrahmen werden einmal vorgerendert. draw() merkt sich, was in jedem Feld
+    # zu sehen ist, und schickt nur die geänderten Felder per pygame.display.update an den Bildschirm.
+    def __init__(self, screen):
+        self.screen = screen
+        self.squares = []
+        for color in ((240,240,240), (100,200,100)):
+            square = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE)).convert()
+            square.fill(color)
+            self.squares.append(square)
+        self.pieces = {}
+        for piece, color in (('w', (220,220,220)), ('b', (50,50,50))):
+            surf = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA).convert_alpha()
+            pygame.draw.circle(surf, color, (SQUARE_SIZE//2, SQUARE_SIZE//2), SQUARE_SIZE//3)
+            self.pieces[piece] = surf
+        self.frame = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA).convert_alpha()
+        pygame.draw.rect(self.frame, (100,100,200), self.frame.get_rect(), 4)
+        self.shown = None  # (r, c) -> (Stein, ausgewählt) wie zuletzt gezeichnet; None = alles neu
+
+    def invalidate(self):
+        self.shown = None
+
+    def draw(self, board, selected=None):
+        full = self.shown is None
+        if full:
+            self.shown = {}
+        dirty = []
+        for r in range(BOARD_SIZE):
+            for c in range(BOARD_SIZE):
+                cell = (board[r][c], selected == (r, c))
+                if self.shown.get((r, c)) == cell:
+                    continue
+                self.shown[(r, c)] = cell
+                pos = (c*SQUARE_SIZE, r*SQUARE_SIZE)
+                self.screen.blit(self.squares[(r+c)%2], pos)
+                if cell[0] in self.pieces:
+                    self.screen.blit(self.pieces[cell[0]], pos)
+                if cell[1]:
+                    self.screen.blit(self.frame, pos)
+                dirty.append(pygame.Rect(pos, (SQUARE_SIZE, SQUARE_SIZE)))
+        if full:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+
+def online_loop(screen, client, player):
+    # Das Netzwerk läuft in den Threads von client (WebSocket oder HTTP), hier wird nur gezeichnet.
+    # Ein eigener Zug erscheint sofort und wird zurückgenommen, wenn der Server ihn ablehnt.
+    clock = pygame.time.Clock()
+    renderer = BoardRenderer(screen)
+    confirmed = None  # letzter Stand vom Server
+    pending = None  # confirmed plus eigener, noch nicht bestätigter Zug
     selected = None
     running = True
-
     while running:
-        state = get_state(session_id)
-        if not state:
-            print("Fehler beim Abrufen des Spielstands.")
-            time.sleep(2)
+        clock.tick(FPS)
+        new_state = client.latest_state()
+        if new_state is not None:
+            confirmed = new_state
+            pending = None
+        if client.pop_error():
+            print("Ungültiger Zug!")
+            pending = None
+        if client.closed:
+            print("Verbindung zum Server verloren.")
+            break
+        state = pending or confirmed
+        if state is None:
+            # Noch kein Stand vom Server: nur auf QUIT achten, damit sich das Fenster trotzdem schließen lässt
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                running = False
             continue
         board = state["board"]
-        turn = state["turn"]
-        winner = state["winner"]
-
-        draw_board(screen, board, selected)
-
-        if winner:
-            if winner == "draw":
+        renderer.draw(board, selected)
+        if state["winner"]:
+            if state["winner"] == "draw":
                 print("Spiel beendet! Unentschieden!")
             else:
-                print(f"Spiel beendet! Gewinner: {winner}")
+                print(f"Spiel beendet! Gewinner: {state['winner']}")
             time.sleep(3)
             break
-
-        if turn != player:
-            # Warte, bis du dran bist
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-            time.sleep(1)
-            continue
-
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-            elif event.type == pygame.MOUSEBUTTONDOWN:
+            elif event.type == pygame.MOUSEBUTTONDOWN and state["turn"] == player and pending is None:
                 x, y = event.pos
                 r, c = y // SQUARE_SIZE, x // SQUARE_SIZE
                 if selected is None:
@@ -139,11 +165,27 @@ def main():
                         selected = (r, c)
                 else:
                     move = [list(selected), [r, c]]
-                    if send_move(session_id, move):
-                        selected = None
-                    else:
-                        print("Ungültiger Zug!")
-                        selected = None
+                    client.send_move(move)
+                    pending = optimistic_state(confirmed, move)
+                    selected = None
+    client.close()
+
+def main():
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Online Bauernschach")
+    font = pygame.font.SysFont(None, 40)
+
+    # Session-ID und Farbe im GUI abfragen
+    session_id = text_input_box(screen, "Session-ID für das Spiel eingeben:", HEIGHT//2 - 80, font)
+    player = color_choice_box(screen, font)
+
+    try:
+        client = HttpGameClient(SERVER, session_id, new_game=True, wait_timeout=WAIT_TIMEOUT)
+    except Exception as e:
+        print("Konnte kein neues Spiel starten:", e)
+        return
+    online_loop(screen, client, player)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
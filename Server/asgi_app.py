@@ -0,0 +1,283 @@
+import asyncio
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from flask_app import Game, ConnectionPool, DB_PATH, SQL_LOAD, SQL_SAVE, SQL_VERSION, WAIT_POLL_INTERVAL, WAIT_TIMEOUT_MAX
+
+# ASGI-Variante von flask_app.py, ohne Framework und mit demselben JSON und derselben games.db.
+# Starten mit: uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+# Alle SQLite-Zugriffe laufen nacheinander auf einem eigenen Datenbank-Thread, die Event-Loop blockiert nie.
+# Wartende Clients (/wait_state, /events) sind nur Coroutinen; Commits anderer Prozesse bemerkt ein
+# einziger Task über PRAGMA data_version und weckt dann nur die Partien, deren Version sich geändert hat.
+
+EVENTS_HEARTBEAT = 15  # Sekunden, danach schickt /events eine Kommentarzeile, damit die Verbindung offen bleibt
+
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+db_pool = ConnectionPool(DB_PATH, size=1)  # wird nur vom Datenbank-Thread benutzt
+changed = {}  # session_id -> [asyncio.Event, Anzahl Wartende, Version, auf deren Änderung gewartet wird]
+watcher = None
+
+async def run_db(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(db_executor, func, *args)
+
+# --- Auf dem Datenbank-Thread ---
+def db_load(session_id):
+    with db_pool.connection() as db:
+        row = db.execute(SQL_LOAD, (session_id,)).fetchone()
+    if row:
+        return Game.from_code(row["code"], row["version"])
+    return None
+
+def db_save(db, session_id, game):
+    db.execute(SQL_SAVE, (session_id, game.to_code()))
+    game.version = db.execute(SQL_VERSION, (session_id,)).fetchone()["version"]
+
+def db_new_game(session_id):
+    game = Game()
+    with db_pool.transaction(immediate=True) as db:
+        db_save(db, session_id, game)
+    return game
+
+def db_move(session_id, move_tuple):
+    # Laden, Prüfen und Speichern in einer Transaktion wie /move in flask_app.py: (game, fehler, statuscode)
+    with db_pool.transaction(immediate=True) as db:
+        row = db.execute(SQL_LOAD, (session_id,)).fetchone()
+        if not row:
+            return None, "No such game", 404
+        game = Game.from_code(row["code"], row["version"])
+        if move_tuple not in game.get_valid_moves(game.turn):
+            return None, "Invalid move", 400
+        game.make_move(move_tuple)
+        db_save(db, session_id, game)
+    return game, None, 200
+
+def db_poll(data_version, session_ids):
+    # Neue data_version und (session_id, version) der beobachteten Partien, falls jemand anders committet hat
+    with db_pool.connection() as db:
+        current = db.execute("PRAGMA data_version").fetchone()[0]
+        if current == data_version:
+            return current, []
+        rows = []
+        for start in range(0, len(session_ids), 500):
+            chunk = session_ids[start:start + 500]
+            rows += db.execute("SELECT session_id, version FROM games WHERE session_id IN (%s)"
+                               % ",".join("?" * len(chunk)), chunk).fetchall()
+        return current, [(row["session_id"], row["version"]) for row in rows]
+
+# --- Warten ---
+def notify(session_id):
+    entry = changed.pop(session_id, None)
+    if entry is not None:
+        entry[0].set()
+
+async def wait_event(session_id, version, timeout):
+    # True, wenn sich die Partie gegenüber version geändert hat, False nach timeout Sekunden
+    entry = changed.get(session_id)
+    if entry is None:
+        entry = changed[session_id] = [asyncio.Event(), 0, version]
+    entry[1] += 1
+    start_watcher()
+    try:
+        await asyncio.wait_for(entry[0].wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and changed.get(session_id) is entry:
+            del changed[session_id]
+
+async def watch_database():
+    data_version = None
+    while True:
+        await asyncio.sleep(WAIT_POLL_INTERVAL)
+        if not changed:
+            continue
+        data_version, rows = await run_db(db_poll, data_version, list(changed))
+        for session_id, version in rows:
+            entry = changed.get(session_id)
+            if entry is not None and entry[2] != version:
+                notify(session_id)
+
+def start_watcher():
+    global watcher
+    if watcher is None or watcher.done():
+        watcher = asyncio.ensure_future(watch_database())
+
+async def wait_change(session_id, since, timeout):
+    # Aktuelle Partie, sobald ihre Version von since abweicht (oder nach timeout Sekunden)
+    deadline = time.monotonic() + timeout
+    game = await run_db(db_load, session_id)
+    while game and game.version == since:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not await wait_event(session_id, game.version, remaining):
+            break
+        game = await run_db(db_load, session_id)
+    return game
+
+# --- HTTP-Hilfen ---
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+
+def query(scope):
+    return {key: values[0] for key, values in parse_qs(scope["query_string"].decode()).items()}
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"null")
+    except ValueError:
+        return None
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                   + CORS_HEADERS + list(headers)
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def send_state(scope, send, game):
+    # Die Version ist das ETag wie in flask_app.py: wer den Stand schon hat, bekommt 304 ohne Body
+    etag = b'"%d"' % game.version
+    if_none_match = dict(scope["headers"]).get(b"if-none-match", b"")
+    if etag in [tag.strip() for tag in if_none_match.split(b",")] or if_none_match.strip() == b"*":
+        await send({"type": "http.response.start", "status": 304, "headers": CORS_HEADERS + [(b"etag", etag)]})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    await send_json(send, state_payload(game), headers=[(b"etag", etag)])
+
+def state_payload(game):
+    return {
+        "board": game.board,
+        "turn": game.turn,
+        "winner": game.winner,
+        "version": game.version
+    }
+
+async def wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+# --- Endpunkte, gleiche Anfragen und Antworten wie flask_app.py ---
+async def new_game(scope, receive, send):
+    data = await read_json(receive)
+    if not isinstance(data, dict) or not isinstance(data.get("session_id"), str):
+        # session_id ist Primärschlüssel (NOT NULL), wie in flask_app.py
+        return await send_json(send, {"error": "Bad request"}, 400)
+    session_id = data["session_id"]
+    await run_db(db_new_game, session_id)
+    notify(session_id)
+    await send_json(send, {"status": "ok"})
+
+async def get_state(scope, receive, send):
+    game = await run_db(db_load, query(scope).get("session_id"))
+    if not game:
+        return await send_json(send, {"error": "No such game"}, 404)
+    await send_state(scope, send, game)
+
+async def wait_state(scope, receive, send):
+    # Long-Poll: antwortet erst, wenn sich die Version gegenüber "since" geändert hat (oder nach timeout Sekunden)
+    params = query(scope)
+    try:
+        since = int(params["since"]) if "since" in params else None
+        timeout = float(params.get("timeout", 25))
+    except ValueError:
+        return await send_json(send, {"error": "Bad request"}, 400)
+    if not math.isfinite(timeout):
+        return await send_json(send, {"error": "Bad request"}, 400)
+    timeout = max(0.0, min(timeout, WAIT_TIMEOUT_MAX))
+    game = await wait_change(params.get("session_id"), since, timeout)
+    if not game:
+        return await send_json(send, {"error": "No such game"}, 404)
+    await send_state(scope, send, game)
+
+async def move(scope, receive, send):
+    data = await read_json(receive)
+    if not isinstance(data, dict) or not isinstance(data.get("session_id"), str):
+        return await send_json(send, {"error": "Bad request"}, 400)
+    session_id = data["session_id"]
+    move = data.get("move")  # [[r1, c1], [r2, c2]]
+    try:
+        move_tuple = (tuple(move[0]), tuple(move[1]))
+    except (TypeError, IndexError):
+        return await send_json(send, {"error": "Bad request"}, 400)
+    game, error, status = await run_db(db_move, session_id, move_tuple)
+    if error:
+        return await send_json(send, {"error": error}, status)
+    notify(session_id)
+    await send_json(send, state_payload(game))
+
+async def events(scope, receive, send):
+    # Server-Sent Events: jeder neue Stand als "data: {...}", solange der Client verbunden ist
+    session_id = query(scope).get("session_id")
+    game = await run_db(db_load, session_id)
+    if not game:
+        return await send_json(send, {"error": "No such game"}, 404)
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")] + CORS_HEADERS
+    })
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    since = None
+    try:
+        while game and not disconnected.done():
+            if game.version != since:
+                since = game.version
+                chunk = "data: " + json.dumps(state_payload(game)) + "\n\n"
+            else:
+                chunk = ": ping\n\n"
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+            waiter = asyncio.ensure_future(wait_change(session_id, since, EVENTS_HEARTBEAT))
+            await asyncio.wait({waiter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not waiter.done():
+                waiter.cancel()
+                break
+            game = waiter.result()
+    finally:
+        disconnected.cancel()
+    await send({"type": "http.response.body", "body": b""})
+
+ROUTES = {
+    ("POST", "/new_game"): new_game,
+    ("GET", "/get_state"): get_state,
+    ("GET", "/wait_state"): wait_state,
+    ("POST", "/move"): move,
+    ("GET", "/events"): events,
+}
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while (await receive())["type"] != "lifespan.shutdown":
+            await send({"type": "lifespan.startup.complete"})
+        await send({"type": "lifespan.shutdown.complete"})
+        return
+    if scope["type"] != "http":
+        await send({"type": "websocket.close", "code": 1008})
+        return
+    if scope["method"] == "OPTIONS":
+        await send({
+            "type": "http.response.start",
+            "status": 204,
+            "headers": CORS_HEADERS + [(b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+                                       (b"access-control-allow-headers", b"Content-Type, If-None-Match")]
+        })
+        await send({"type": "http.response.body", "body": b""})
+        return
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        return await send_json(send, {"error": "Not found"}, 404)
+    await handler(scope, receive, send)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000)
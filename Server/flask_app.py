@@ -1,36 +1,141 @@
 import os
+import sys
 import sqlite3
 import json
-from flask import Flask, request, jsonify
+import threading
+import time
+import queue
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 
 BOARD_SIZE = 3
+
+# Ein Spielstand als eine Zahl: Felder zur Basis 3 (Feld 0 höchstwertig, wie state_index in 2.0),
+# dann 1 Bit für den Zug und 2 Bit für den Sieger -> code = (brett * 2 + zug) * 4 + sieger
+CELL_CODES = {'.': 0, 'w': 1, 'b': 2}
+CELL_CHARS = '.wb'
+WINNER_CODES = {None: 0, 'w': 1, 'b': 2, "draw": 3}
+WINNER_NAMES = {code: name for name, code in WINNER_CODES.items()}
 DB_PATH = os.path.join(os.path.dirname(__file__), "games.db")
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# SQL einmal als Konstanten, damit der Statement-Cache jeder Verbindung sie wiederverwendet
+SQL_LOAD = "SELECT code, version FROM games WHERE session_id = ?"
+SQL_SAVE = """INSERT INTO games (session_id, code, version) VALUES (?, ?, 1)
+               ON CONFLICT(session_id) DO UPDATE SET code = excluded.code, version = games.version + 1"""
+SQL_VERSION = "SELECT version FROM games WHERE session_id = ?"
 
-def init_db():
-    with get_db() as db:
-        db.execute("""
-            CREATE TABLE IF NOT EXISTS games (
-                session_id TEXT PRIMARY KEY,
-                board TEXT,
-                turn TEXT,
-                winner TEXT
-            )
-        """)
+# --- Metriken im Textformat von Prometheus (GET /metrics), siehe Gemeinsam/Metriken.py ---
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Gemeinsam"))
+from Metriken import Metrics, LATENCY_BUCKETS, FAST_BUCKETS
+
+metrics = Metrics()
+metrics.describe("bauernschach_http_requests_total", "counter", "Anfragen je Route, Methode und Status")
+metrics.describe("bauernschach_http_request_duration_seconds", "histogram", "Dauer der Anfragen je Route",
+                 LATENCY_BUCKETS)
+metrics.describe("bauernschach_moves_total", "counter", "Züge nach Ergebnis (ok, invalid, no_game)")
+metrics.describe("bauernschach_get_valid_moves_seconds", "histogram",
+                 "Zeit in Game.get_valid_moves beim Prüfen eines Zugs", FAST_BUCKETS)
+
+def valid_moves(game):
+    # game.get_valid_moves(game.turn) mit Zeitmessung
+    start = time.perf_counter()
+    moves = game.get_valid_moves(game.turn)
+    metrics.observe("bauernschach_get_valid_moves_seconds", time.perf_counter() - start)
+    return moves
+
+metrics.describe("bauernschach_sqlite_query_seconds", "histogram",
+                 "Dauer der SQLite-Statements (begin wartet auf die Schreibsperre)", LATENCY_BUCKETS)
+
+def timed_query(db, name, sql, params):
+    # db.execute(sql, params).fetchone() mit Zeitmessung unter query=name
+    start = time.perf_counter()
+    row = db.execute(sql, params).fetchone()
+    metrics.observe("bauernschach_sqlite_query_seconds", time.perf_counter() - start, (("query", name),))
+    return row
+
+DB_POOL_SIZE = 8  # so viele freie Verbindungen bleiben offen
+
+class ConnectionPool:
+    # Hält offene SQLite-Verbindungen (WAL, synchronous=NORMAL) und gibt sie nach jeder Anfrage zurück.
+    # isolation_level=None: Transaktionen werden hier explizit mit BEGIN/COMMIT gesteuert.
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                               check_same_thread=False, cached_statements=64)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # in WAL sicher, spart das fsync pro Commit
+        conn.execute("PRAGMA cache_size=-2048")  # 2 MB Seiten-Cache pro Verbindung
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self.idle.qsize() < self.size:
+                self.idle.put(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        # BEGIN IMMEDIATE holt die Schreibsperre sofort, zwei gleichzeitige /move laufen so nacheinander
+        with self.connection() as conn:
+            timed_query(conn, "begin", "BEGIN IMMEDIATE" if immediate else "BEGIN", ())
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            start = time.perf_counter()
+            conn.commit()
+            metrics.observe("bauernschach_sqlite_query_seconds", time.perf_counter() - start, (("query", "commit"),))
+
+db_pool = ConnectionPool(DB_PATH)
 
 class Game:
-    def __init__(self, board=None, turn='w', winner=None):
+    def __init__(self, board=None, turn='w', winner=None, version=0):
         if board is None:
             self.board = [['w'] * BOARD_SIZE] + [['.'] * BOARD_SIZE] + [['b'] * BOARD_SIZE]
         else:
             self.board = board
         self.turn = turn
         self.winner = winner
+        self.version = version
+
+    @classmethod
+    def from_code(cls, code, version=0):
+        code, winner = divmod(code, 4)
+        code, turn_bit = divmod(code, 2)
+        cells = []
+        for _ in range(BOARD_SIZE * BOARD_SIZE):
+            code, cell = divmod(code, 3)
+            cells.append(CELL_CHARS[cell])
+        cells.reverse()
+        board = [cells[r * BOARD_SIZE:(r + 1) * BOARD_SIZE] for r in range(BOARD_SIZE)]
+        return cls(board, 'b' if turn_bit else 'w', WINNER_NAMES[winner], version)
+
+    def to_code(self):
+        code = 0
+        for row in self.board:
+            for cell in row:
+                code = code * 3 + CELL_CODES[cell]
+        return (code * 2 + (self.turn == 'b')) * 4 + WINNER_CODES[self.winner]
 
     def get_valid_moves(self, player):
         moves = []
@@ -64,29 +169,174 @@ class Game:
             if not self.get_valid_moves(self.turn):
                 self.winner = "draw"
 
-def save_game(session_id, game):
-    with get_db() as db:
-        db.execute(
-            "REPLACE INTO games (session_id, board, turn, winner) VALUES (?, ?, ?, ?)",
-            (session_id, json.dumps(game.board), game.turn, game.winner)
-        )
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS games (
+        session_id TEXT PRIMARY KEY,
+        code INTEGER NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+"""
+
+def init_db():
+    with db_pool.transaction(immediate=True) as db:
+        db.execute(SCHEMA)
+        # Ältere games.db mit JSON-Brett (board/turn/winner, evtl. ohne version) umstellen
+        columns = [row["name"] for row in db.execute("PRAGMA table_info(games)")]
+        if "board" in columns:
+            rows = db.execute("SELECT * FROM games").fetchall()
+            db.execute("DROP TABLE games")
+            db.execute(SCHEMA)
+            for row in rows:
+                game = Game(json.loads(row["board"]), row["turn"], row["winner"])
+                version = row["version"] if "version" in columns else 0
+                db.execute("INSERT INTO games (session_id, code, version) VALUES (?, ?, ?)",
+                           (row["session_id"], game.to_code(), version))
+
+# Weckt wartende Long-Polls im selben Prozess sofort; andere Worker-Prozesse merken
+# Änderungen spätestens nach WAIT_POLL_INTERVAL Sekunden über die Datenbank.
+state_changed = threading.Condition()
+WAIT_POLL_INTERVAL = 0.25
+WAIT_TIMEOUT_MAX = 60
 
-def load_game(session_id):
-    db = get_db()
-    row = db.execute("SELECT * FROM games WHERE session_id = ?", (session_id,)).fetchone()
+def game_saved(session_id, game):
+    # Nach dem Commit: Cache aktualisieren und wartende Long-Polls wecken
+    game_cache.put(session_id, game)
+    with state_changed:
+        state_changed.notify_all()
+
+def save_game(session_id, game, db=None):
+    # Jede Speicherung erhöht die Version, darauf warten die Long-Poll-Anfragen.
+    # Mit db läuft das Speichern in der Transaktion des Aufrufers, der danach game_saved() ruft.
+    if db is None:
+        with db_pool.transaction(immediate=True) as db:
+            save_game(session_id, game, db)
+        game_saved(session_id, game)
+        return
+    timed_query(db, "save", SQL_SAVE, (session_id, game.to_code()))
+    game.version = timed_query(db, "version", SQL_VERSION, (session_id,))["version"]
+
+def load_game(session_id, db=None):
+    if db is None:
+        with db_pool.connection() as db:
+            return load_game(session_id, db)
+    row = timed_query(db, "load", SQL_LOAD, (session_id,))
     if row:
-        board = json.loads(row["board"])
-        return Game(board, row["turn"], row["winner"])
+        return Game.from_code(row["code"], row["version"])
     return None
 
+CACHE_CAPACITY = 1024  # Partien im Speicher pro Prozess
+CACHE_TTL = 300  # Sekunden, danach wird eine Partie neu aus der Datenbank gelesen
+
+class GameCache:
+    # LRU-Cache session_id -> Game für die lesenden Endpunkte, Schreiben geht über game_saved() durch.
+    # Mehrere Worker-Prozesse: PRAGMA data_version auf einer eigenen Verbindung ändert sich, sobald irgendwer
+    # committet. Solange es gleich bleibt, gilt jeder Eintrag ohne Datenbankzugriff; danach wird er einmal
+    # billig über SELECT version geprüft und nur bei neuer Version wirklich neu geladen.
+    def __init__(self, path, capacity=CACHE_CAPACITY, ttl=CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.entries = OrderedDict()  # session_id -> (game, gespeichert um, data_version)
+        self.lock = threading.Lock()
+        self.watch = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.hits = self.misses = self.revalidations = 0
+
+    def data_version(self):
+        return self.watch.execute("PRAGMA data_version").fetchone()[0]
+
+    def put(self, session_id, game, epoch=None):
+        with self.lock:
+            self.entries[session_id] = (game, time.monotonic(), epoch)
+            self.entries.move_to_end(session_id)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def get(self, session_id):
+        with self.lock:
+            epoch = self.data_version()
+            entry = self.entries.get(session_id)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self.entries[session_id]
+                entry = None
+            if entry is not None and entry[2] == epoch:
+                self.hits += 1
+                self.entries.move_to_end(session_id)
+                return entry[0]
+        with db_pool.connection() as db:
+            if entry is not None:
+                row = timed_query(db, "version", SQL_VERSION, (session_id,))
+                if row and row["version"] == entry[0].version:
+                    with self.lock:
+                        self.hits += 1
+                        self.revalidations += 1
+                        if session_id in self.entries:
+                            self.entries[session_id] = (entry[0], entry[1], epoch)
+                            self.entries.move_to_end(session_id)
+                    return entry[0]
+            game = load_game(session_id, db)
+        with self.lock:
+            self.misses += 1
+        if game is None:
+            with self.lock:
+                self.entries.pop(session_id, None)
+        else:
+            self.put(session_id, game, epoch)
+        return game
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+game_cache = GameCache(DB_PATH)
+
+def state_response(game):
+    # Die Version ist das ETag: wer den Stand schon hat, bekommt 304 ohne Body
+    etag = str(game.version)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({
+            "board": game.board,
+            "turn": game.turn,
+            "winner": game.winner,
+            "version": game.version
+        })
+    response.set_etag(etag)
+    return response
+
 # --- Flask Backend ---
 app = Flask(__name__)
 CORS(app)
 init_db()
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.inc("bauernschach_http_requests_total",
+                    (("route", route), ("method", request.method), ("status", response.status_code)))
+        metrics.observe("bauernschach_http_request_duration_seconds", time.perf_counter() - start, (("route", route),))
+    return response
+
 @app.route("/new_game", methods=["POST"])
 def new_game():
     session_id = request.json.get("session_id")
+    if not isinstance(session_id, str):
+        # session_id ist Primärschlüssel (NOT NULL), ohne sie würde das INSERT scheitern
+        return jsonify({"error": "Bad request"}), 400
     game = Game()
     save_game(session_id, game)
     return jsonify({"status": "ok"})
@@ -94,33 +344,152 @@ def new_game():
 @app.route("/get_state", methods=["GET"])
 def get_state():
     session_id = request.args.get("session_id")
-    game = load_game(session_id)
+    game = game_cache.get(session_id)
     if not game:
         return jsonify({"error": "No such game"}), 404
-    return jsonify({
-        "board": game.board,
-        "turn": game.turn,
-        "winner": game.winner
-    })
+    return state_response(game)
+
+@app.route("/wait_state", methods=["GET"])
+def wait_state():
+    # Long-Poll: antwortet erst, wenn sich die Version gegenüber "since" geändert hat (oder nach timeout Sekunden)
+    session_id = request.args.get("session_id")
+    since = request.args.get("since", type=int)
+    timeout = min(request.args.get("timeout", 25, type=float), WAIT_TIMEOUT_MAX)
+    deadline = time.monotonic() + timeout
+    game = game_cache.get(session_id)
+    while game and game.version == since and time.monotonic() < deadline:
+        with state_changed:
+            state_changed.wait(min(WAIT_POLL_INTERVAL, max(0, deadline - time.monotonic())))
+        game = game_cache.get(session_id)
+    if not game:
+        return jsonify({"error": "No such game"}), 404
+    return state_response(game)
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    return jsonify(game_cache.stats())
+
+SESSION_COUNT_TTL = 15  # Sekunden, so lange gilt die gezählte Anzahl Partien (etwa ein Scrape-Intervall)
+session_count = {"at": None, "row": None}
+session_count_lock = threading.Lock()
+
+def count_sessions():
+    # Partien zählt die Datenbank (alle Worker-Prozesse). Das ist ein Durchlauf über die ganze Tabelle,
+    # daher höchstens einmal pro SESSION_COUNT_TTL; weitere Scrapes bekommen den letzten Stand.
+    with session_count_lock:
+        now = time.monotonic()
+        if session_count["at"] is None or now - session_count["at"] >= SESSION_COUNT_TTL:
+            with db_pool.connection() as db:
+                row = timed_query(db, "count", "SELECT COUNT(*) AS total, COALESCE(SUM(code % 4 != 0), 0) AS finished FROM games", ())
+            session_count["row"] = (row["total"], row["finished"])
+            session_count["at"] = now
+        return session_count["row"]
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    # Den Cache zählt jeder Prozess für sich
+    total, finished = count_sessions()
+    cache = game_cache.stats()
+    text = metrics.render([
+        ("bauernschach_sessions", "gauge", "Partien in der Datenbank",
+         [((("state", "active"),), total - finished), ((("state", "finished"),), finished)]),
+        ("bauernschach_cache_requests_total", "counter", "Lookups im GameCache",
+         [((("result", "hit"),), cache["hits"]), ((("result", "miss"),), cache["misses"])]),
+        ("bauernschach_cache_revalidations_total", "counter", "Treffer, die per SELECT version bestätigt wurden",
+         [((), cache["revalidations"])]),
+        ("bauernschach_cache_hit_ratio", "gauge", "Anteil der Lookups ohne Neuladen", [((), cache["hit_rate"])]),
+        ("bauernschach_cache_entries", "gauge", "Partien im GameCache", [((), cache["size"])]),
+    ])
+    return text, 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 @app.route("/move", methods=["POST"])
 def move():
     session_id = request.json.get("session_id")
     move = request.json.get("move")  # [[r1, c1], [r2, c2]]
-    game = load_game(session_id)
-    if not game:
-        return jsonify({"error": "No such game"}), 404
-    move_tuple = (tuple(move[0]), tuple(move[1]))
-    if move_tuple not in game.get_valid_moves(game.turn):
-        return jsonify({"error": "Invalid move"}), 400
-    game.make_move(move_tuple)
-    save_game(session_id, game)
+    if not isinstance(session_id, str):
+        return jsonify({"error": "Bad request"}), 400
+    # Laden, Prüfen und Speichern in einer Transaktion: kein anderer Zug kann dazwischen schreiben
+    with db_pool.transaction(immediate=True) as db:
+        game = load_game(session_id, db)
+        if not game:
+            metrics.inc("bauernschach_moves_total", (("result", "no_game"),))
+            return jsonify({"error": "No such game"}), 404
+        try:
+            move_tuple = (tuple(move[0]), tuple(move[1]))
+        except (TypeError, IndexError):
+            return jsonify({"error": "Bad request"}), 400
+        if move_tuple not in valid_moves(game):
+            metrics.inc("bauernschach_moves_total", (("result", "invalid"),))
+            return jsonify({"error": "Invalid move"}), 400
+        game.make_move(move_tuple)
+        save_game(session_id, game, db)
+    metrics.inc("bauernschach_moves_total", (("result", "ok"),))
+    game_saved(session_id, game)
     return jsonify({
         "board": game.board,
         "turn": game.turn,
-        "winner": game.winner
+        "winner": game.winner,
+        "version": game.version
     })
 
+BATCH_MAX = 1000  # Operationen pro /batch-Anfrage
+
+def run_op(db, op, saved):
+    # Eine Operation aus /batch innerhalb der gemeinsamen Transaktion: (statuscode, body) wie beim
+    # einzelnen Endpunkt. Gespeicherte Partien landen in saved und werden nach dem Commit gemeldet.
+    session_id = op.get("session_id")
+    kind = op.get("op")
+    if not isinstance(session_id, str):
+        return 400, {"error": "Bad request"}
+    if kind == "new_game":
+        game = Game()
+        save_game(session_id, game, db)
+        saved[session_id] = game
+        return 200, {"status": "ok"}
+    if kind not in ("get_state", "move"):
+        return 400, {"error": "Unknown op"}
+    game = load_game(session_id, db)
+    if not game:
+        if kind == "move":
+            metrics.inc("bauernschach_moves_total", (("result", "no_game"),))
+        return 404, {"error": "No such game"}
+    if kind == "move":
+        try:
+            move = op.get("move")
+            move_tuple = (tuple(move[0]), tuple(move[1]))
+        except (TypeError, IndexError):
+            return 400, {"error": "Bad request"}
+        if move_tuple not in valid_moves(game):
+            metrics.inc("bauernschach_moves_total", (("result", "invalid"),))
+            return 400, {"error": "Invalid move"}
+        game.make_move(move_tuple)
+        save_game(session_id, game, db)
+        saved[session_id] = game
+        metrics.inc("bauernschach_moves_total", (("result", "ok"),))
+    return 200, {
+        "board": game.board,
+        "turn": game.turn,
+        "winner": game.winner,
+        "version": game.version
+    }
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    # Für Bots: [{"session_id": ..., "op": "new_game" | "get_state" | "move", "move": ...}, ...]
+    # laufen der Reihe nach in einer Transaktion, Antwort {"results": [{"status": 200, "body": {...}}, ...]}
+    ops = request.json
+    if not isinstance(ops, list) or len(ops) > BATCH_MAX or not all(isinstance(op, dict) for op in ops):
+        return jsonify({"error": "Bad request"}), 400
+    results = []
+    saved = {}
+    with db_pool.transaction(immediate=True) as db:
+        for op in ops:
+            status, body = run_op(db, op, saved)
+            results.append({"status": status, "body": body})
+    for session_id, game in saved.items():
+        game_saved(session_id, game)
+    return jsonify({"results": results})
+
 # Wichtig: Kein app.run() am Ende, wenn du auf PythonAnywhere hostest!
 
 # if __name__ == "__main__":
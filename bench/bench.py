@@ -0,0 +1,344 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Reproduzierbare Benchmarks für Spiellogik, KI und Server. Jede Messung hat einen festen Seed und eine
+# feste Menge Arbeit, nur die Zeit ändert sich zwischen zwei Läufen. Ergebnis ist JSON, z. B.:
+#   python bench/bench.py --out vorher.json
+#   python bench/bench.py --out nachher.json --compare vorher.json
+# Die Module werden in einen Temp-Ordner kopiert und von dort geladen: Q-Tabellen und games.db der
+# Benchmarks landen so nie neben den echten Dateien.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENGINE = os.path.join(ROOT, "2.0", "Backend.py")
+SERVERS = {
+    "2.0": os.path.join(ROOT, "2.0", "Backend.py"),
+    "Server": os.path.join(ROOT, "Server", "flask_app.py"),
+    "Lokal": os.path.join(ROOT, "Lokal", "Logik_Online.py"),
+}
+# Die kopierten Module finden Gemeinsam/ nicht über ihren eigenen Pfad
+sys.path.insert(0, os.path.join(ROOT, "Gemeinsam"))
+SUITES = ["movegen", "playouts", "selfplay", "qtable_io", "server"]
+
+# Arbeitsmengen: normal und --quick
+SIZES = {
+    False: {"positions": 2000, "movegen_rounds": 50, "playouts": 5000, "selfplay_episodes": 5000,
+            "qtable_sizes": [1000, 10000, 100000], "lookups": 20000, "server_steps": 2000},
+    True: {"positions": 500, "movegen_rounds": 10, "playouts": 500, "selfplay_episodes": 500,
+           "qtable_sizes": [1000, 10000], "lookups": 2000, "server_steps": 200},
+}
+
+def load_module(path, workdir):
+    # Lädt eine Kopie von path aus workdir unter eigenem Namen (mehrere Dateien heißen sonst gleich)
+    copy = os.path.join(workdir, os.path.basename(path))
+    shutil.copy(path, copy)
+    name = "bench_%s_%s" % (os.path.basename(os.path.dirname(path)).replace(".", "_"),
+                            os.path.splitext(os.path.basename(path))[0])
+    spec = importlib.util.spec_from_file_location(name, copy)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@contextmanager
+def in_tempdir():
+    old = os.getcwd()
+    path = tempfile.mkdtemp(prefix="bench-")
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(old)
+        shutil.rmtree(path, ignore_errors=True)
+
+def timed(func, repeat):
+    # Median und Bestwert von repeat Läufen in Sekunden
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2], times[0]
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def random_positions(engine, count, seed):
+    # Stellungen aus zufälligen Partien, jede Stellung mit dem Spieler am Zug
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = engine.Game()
+        while not game.is_game_over() and len(positions) < count:
+            positions.append(([row[:] for row in game.board], game.turn))
+            game.make_move(rng.choice(game.get_valid_moves(game.turn)))
+    return positions
+
+# --- Benchmarks ---
+def bench_movegen(engine, sizes, seed, repeat):
+    positions = random_positions(engine, sizes["positions"], seed)
+    rounds = sizes["movegen_rounds"]
+    results = {}
+    for name in ["Game", "BitboardGame"]:
+        games = []
+        for board, turn in positions:
+            game = getattr(engine, name)()
+            game.board = [row[:] for row in board]
+            game.turn = turn
+            games.append(game)
+
+        def run():
+            for _ in range(rounds):
+                for game in games:
+                    game.get_valid_moves(game.turn)
+
+        median, best = timed(run, repeat)
+        calls = rounds * len(games)
+        results[name] = {"calls": calls, "calls_per_sec": calls / median, "best_calls_per_sec": calls / best}
+    return results
+
+def bench_playouts(engine, sizes, seed, repeat):
+    count = sizes["playouts"]
+    results = {}
+    for name in ["Game", "BitboardGame"]:
+        game_cls = getattr(engine, name)
+        plies = [0]
+
+        def run():
+            rng = random.Random(seed)
+            plies[0] = 0
+            for _ in range(count):
+                game = game_cls()
+                while not game.is_game_over():
+                    game.make_move(rng.choice(game.get_valid_moves(game.turn)))
+                    plies[0] += 1
+
+        median, best = timed(run, repeat)
+        results[name] = {"playouts": count, "plies": plies[0], "playouts_per_sec": count / median,
+                         "plies_per_sec": plies[0] / median, "best_playouts_per_sec": count / best}
+    return results
+
+def bench_selfplay(engine, sizes, seed, repeat):
+    episodes = sizes["selfplay_episodes"]
+    configs = [("dict", "game")]
+    if engine.np is not None:
+        configs += [("dense", "game"), ("dense", "vector")]
+    results = {}
+    for backend, mode in configs:
+        def run():
+            # Jeder Lauf beginnt mit leerer Tabelle in einem frischen Ordner
+            with in_tempdir():
+                engine.train_ai_selfplay(episodes, backend=backend, seed=seed, engine=mode)
+
+        median, best = timed(run, repeat)
+        results["%s/%s" % (backend, mode)] = {"episodes": episodes, "episodes_per_sec": episodes / median,
+                                              "best_episodes_per_sec": episodes / best}
+    return results
+
+def synthetic_qtable(engine, size, seed):
+    # size verschiedene (Stellung, Zug)-Schlüssel, gleichmäßig über alle Indizes verteilt
+    rng = random.Random(seed)
+    table = {}
+    for key in rng.sample(range(engine.NUM_STATES * engine.NUM_MOVE_SLOTS), size):
+        state_id, slot = divmod(key, engine.NUM_MOVE_SLOTS)
+        state = engine.index_state(state_id)
+        table[(state, engine.index_move(slot, state[1]))] = rng.uniform(-1, 1)
+    return table
+
+def bench_qtable_io(engine, sizes, seed, repeat):
+    results = {}
+    with in_tempdir():
+        for size in sizes["qtable_sizes"]:
+            table = synthetic_qtable(engine, size, seed)
+            keys = random.Random(seed).sample(list(table), min(sizes["lookups"], size))
+            save, _ = timed(lambda: engine.write_qtable_file("qtable.bin", table), repeat)
+            load, _ = timed(lambda: engine.read_qtable_file("qtable.bin"), repeat)
+
+            def lookups():
+                with engine.QTableFile("qtable.bin") as qf:
+                    for key in keys:
+                        qf.get(key)
+
+            lookup, _ = timed(lookups, repeat)
+            results[str(size)] = {"entries": size, "bytes": os.path.getsize("qtable.bin"),
+                                  "save_s": save, "load_s": load,
+                                  "mmap_lookups_per_sec": len(keys) / lookup}
+    return results
+
+def run_client(module, client, name, steps, reads, seed, latencies):
+    # Ein Lastgenerator: reads x /get_state, dann 1 x /move mit einem zufälligen gültigen Zug.
+    # Eine eigene Game-Instanz spiegelt die Partie, ist sie vorbei, kommt /new_game.
+    rng = random.Random(seed)
+    session_id = "bench-%s" % name
+
+    def request(route, call):
+        start = time.perf_counter()
+        response = call()
+        latencies[route].append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError("%s %s: %s" % (route, response.status_code, response.get_data(as_text=True)))
+        return response
+
+    game = None
+    for _ in range(steps):
+        if game is None or game.winner or not game.get_valid_moves(game.turn):
+            request("/new_game", lambda: client.post("/new_game", json={"session_id": session_id}))
+            game = module.Game()
+        for _ in range(reads):
+            request("/get_state", lambda: client.get("/get_state", query_string={"session_id": session_id}))
+        move = rng.choice(game.get_valid_moves(game.turn))
+        request("/move", lambda: client.post("/move", json={"session_id": session_id,
+                                                           "move": [list(move[0]), list(move[1])]}))
+        game.make_move(move)
+
+def bench_server(name, path, sizes, seed, clients, reads):
+    results = {}
+    with in_tempdir() as workdir:
+        module = load_module(path, workdir)
+        for count in clients:
+            latencies = {"/new_game": [], "/get_state": [], "/move": []}
+            errors = []
+            steps = sizes["server_steps"] // count
+
+            def worker(i):
+                try:
+                    run_client(module, module.app.test_client(), "%d-%d" % (count, i), steps, reads,
+                               seed + i, latencies)
+                except Exception as e:
+                    errors.append(repr(e))
+
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            if errors:
+                raise RuntimeError("%s: %s" % (name, errors[0]))
+            routes = {}
+            for route, values in latencies.items():
+                values.sort()
+                routes[route] = {
+                    "requests": len(values),
+                    "requests_per_sec": len(values) / elapsed,
+                    "p50_ms": percentile(values, 50) * 1000,
+                    "p99_ms": percentile(values, 99) * 1000,
+                    "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+                }
+            total = sum(len(values) for values in latencies.values())
+            results["clients=%d" % count] = {"requests": total, "requests_per_sec": total / elapsed,
+                                             "routes": routes}
+    return results
+
+# --- Vergleich ---
+def flatten(data, prefix=""):
+    items = {}
+    for key, value in data.items():
+        path = prefix + "/" + key if prefix else key
+        if isinstance(value, dict):
+            items.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and (key.endswith("_per_sec") or key.endswith("_ms")
+                                                 or key.endswith("_s")):
+            items[path] = value
+    return items
+
+def compare(old, new, threshold):
+    # Druckt alle gemeinsamen Messwerte; Rückgabe: Anzahl der Verschlechterungen über threshold Prozent
+    old_values, new_values = flatten(old["results"]), flatten(new["results"])
+    regressions = 0
+    for path in sorted(set(old_values) & set(new_values)):
+        before, after = old_values[path], new_values[path]
+        if not before:
+            continue
+        change = (after - before) / before * 100
+        worse = -change if path.endswith("_per_sec") else change  # Durchsatz: mehr ist besser, Zeiten: weniger
+        flag = ""
+        if worse > threshold:
+            flag = "  <-- langsamer"
+            regressions += 1
+        print("%-60s %12.4g -> %12.4g  %+7.1f%%%s" % (path, before, after, change, flag), file=sys.stderr)
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks für Bauernschach (Ausgabe als JSON)")
+    parser.add_argument("--only", default=",".join(SUITES), help="Komma-Liste aus " + ", ".join(SUITES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="Läufe pro Messung, berichtet wird der Median")
+    parser.add_argument("--quick", action="store_true", help="kleine Arbeitsmengen für einen schnellen Durchlauf")
+    parser.add_argument("--servers", default=",".join(SERVERS), help="Komma-Liste aus " + ", ".join(SERVERS))
+    parser.add_argument("--clients", default="1,4", help="gleichzeitige Lastgeneratoren pro Server, z. B. 1,4")
+    parser.add_argument("--reads", type=int, default=3, help="/get_state-Anfragen pro /move")
+    parser.add_argument("--out", help="JSON in diese Datei statt auf stdout")
+    parser.add_argument("--compare", help="früheres JSON, Abweichungen gehen auf stderr")
+    parser.add_argument("--threshold", type=float, default=10.0, help="ab so viel Prozent gilt es als langsamer")
+    args = parser.parse_args(argv)
+
+    suites = [name for name in args.only.split(",") if name]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error("unbekannte Benchmarks: " + ", ".join(sorted(unknown)))
+    sizes = SIZES[args.quick]
+    workdir = tempfile.mkdtemp(prefix="bench-engine-")
+    try:
+        engine = load_module(ENGINE, workdir)
+        results = {}
+        for suite in suites:
+            print("bench:", suite, file=sys.stderr)
+            random.seed(args.seed)
+            if suite == "server":
+                clients = [int(n) for n in args.clients.split(",") if n]
+                results[suite] = {name: bench_server(name, SERVERS[name], sizes, args.seed, clients, args.reads)
+                                  for name in args.servers.split(",") if name}
+            else:
+                results[suite] = globals()["bench_" + suite](engine, sizes, args.seed, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "quick": args.quick,
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(json.load(f), report, args.threshold):
+                return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+import importlib
+import os
+import shutil
+import sys
+
+import pytest
+
+# Die Tests laden Kopien der Module aus einem Temp-Ordner (wie bench/bench.py): Q-Tabellen und games.db
+# landen so nie neben den echten Dateien. Jeder Test bekommt frische Module ohne Partien vom Test davor.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Gemeinsam"))
+
+@pytest.fixture
+def load(tmp_path, monkeypatch):
+    loaded = []
+
+    def load(folder, *names):
+        for name in names:
+            shutil.copy(os.path.join(ROOT, folder, name + ".py"), tmp_path)
+        monkeypatch.syspath_prepend(str(tmp_path))
+        importlib.invalidate_caches()
+        modules = []
+        for name in names:
+            sys.modules.pop(name, None)
+            modules.append(importlib.import_module(name))
+            loaded.append(name)
+        return modules[0] if len(modules) == 1 else modules
+
+    monkeypatch.chdir(tmp_path)
+    yield load
+    for name in loaded:
+        sys.modules.pop(name, None)
@@ -0,0 +1,93 @@
+import random
+
+def play_both(backend, rng, others=()):
+    # Spielt dieselbe Zufallspartie auf Game, BitboardGame und weiteren Game-Klassen, vergleicht jeden Schritt
+    games = [backend.Game(), backend.BitboardGame()] + [cls() for cls in others]
+    while True:
+        states = [(tuple(tuple(row) for row in game.board), game.turn, game.winner) for game in games]
+        assert all(state == states[0] for state in states)
+        assert games[1].get_state() == games[0].get_state()
+        if games[0].winner is not None:
+            return
+        moves = [sorted(game.get_valid_moves(game.turn)) for game in games]
+        assert all(m == moves[0] for m in moves)
+        move = rng.choice(moves[0])
+        for game in games:
+            game.make_move(move)
+
+def test_bitboard_matches_list_board(load):
+    backend = load("2.0", "Backend")
+    rng = random.Random(1)
+    for _ in range(300):
+        play_both(backend, rng)
+
+def test_online_versions_match(load):
+    # Die Server von Lokal und Server/ müssen dieselben Regeln haben wie 2.0
+    backend = load("2.0", "Backend")
+    online = load("Lokal", "Logik_Online")
+    server = load("Server", "flask_app")
+    rng = random.Random(2)
+    for _ in range(100):
+        play_both(backend, rng, (online.Game, server.Game))
+
+def test_version_1_matches(load):
+    # 1.0 kennt kein "draw" und wechselt auch nach dem letzten Zug die Seite, verglichen werden nur Brett und Züge
+    backend = load("2.0", "Backend")
+    logik = load("1.0", "Logik")
+    rng = random.Random(3)
+    for _ in range(100):
+        game, old = backend.Game(), logik.Game()
+        while game.winner is None:
+            assert not old.is_game_over()
+            assert old.get_state() == game.get_state()
+            moves = sorted(game.get_valid_moves(game.turn))
+            assert sorted(old.get_valid_moves(old.turn)) == moves
+            move = rng.choice(moves)
+            game.make_move(move)
+            old.make_move(move)
+        assert old.board == game.board and old.is_game_over()
+        assert old.winner == (None if game.winner == "draw" else game.winner)
+
+def test_copy_and_unmake(load):
+    backend = load("2.0", "Backend")
+    rng = random.Random(4)
+    for _ in range(100):
+        game = backend.Game()
+        bitboard = backend.BitboardGame()
+        while game.winner is None:
+            before = game.get_state()
+            copied = bitboard.copy()
+            move = rng.choice(game.get_valid_moves(game.turn))
+            undo = game.make_move(move)
+            bitboard.make_move(move)
+            assert copied.get_state() == before
+            game.unmake_move(undo)
+            assert game.get_state() == before and game.winner is None
+            game.make_move(move)
+
+def test_server_code_round_trip(load):
+    server = load("Server", "flask_app")
+    rng = random.Random(4)
+    for _ in range(100):
+        game = server.Game()
+        while True:
+            restored = server.Game.from_code(game.to_code())
+            assert (restored.board, restored.turn, restored.winner) == (game.board, game.turn, game.winner)
+            if game.winner is not None:
+                break
+            game.make_move(rng.choice(game.get_valid_moves(game.turn)))
+
+def test_state_and_move_encoding(load):
+    backend = load("2.0", "Backend")
+    rng = random.Random(5)
+    for _ in range(200):
+        game = backend.Game()
+        while game.winner is None:
+            state = game.get_state()
+            assert backend.index_state(backend.state_index(state)) == state
+            for move in game.get_valid_moves(game.turn):
+                assert backend.index_move(backend.move_index(move), game.turn) == move
+                # Spiegelpaare landen auf demselben Schlüssel
+                mirrored = backend.mirror_state(state), backend.mirror_move(move)
+                assert backend.canonical_key(*mirrored) == backend.canonical_key(state, move)
+            game.make_move(rng.choice(game.get_valid_moves(game.turn)))
@@ -0,0 +1,137 @@
+import os
+import pickle
+import random
+
+import pytest
+
+def sample_table(backend, seed=0):
+    # Alle erreichbaren kanonischen Schlüssel, Werte als Achtel (in float32 exakt darstellbar)
+    rng = random.Random(seed)
+    table = {}
+    seen = set()
+    stack = [backend.Game()]
+    while stack:
+        game = stack.pop()
+        state = game.get_state()
+        if game.winner is not None or state in seen:
+            continue
+        seen.add(state)
+        for move in game.get_valid_moves(game.turn):
+            table[backend.canonical_key(state, move)] = rng.randint(-4000, 8) / 8
+            child = game.copy()
+            child.make_move(move)
+            stack.append(child)
+    return table
+
+def test_binary_round_trip(load):
+    backend = load("2.0", "Backend")
+    table = sample_table(backend)
+    backend.write_qtable_file("q.bin", table)
+    assert backend.read_qtable_file("q.bin") == table
+    with backend.QTableFile("q.bin") as qf:
+        assert len(qf) == len(table)
+        for key, value in table.items():
+            assert key in qf and qf.get(key) == value
+    assert not [name for name in os.listdir() if name.endswith(".tmp")]
+
+def test_dense_round_trip(load):
+    backend = load("2.0", "Backend")
+    if backend.np is None:
+        pytest.skip("numpy fehlt")
+    table = sample_table(backend)
+    backend.write_qtable_file("q.bin", backend.DenseQTable.from_dict(table))
+    dense = backend.read_qtable_file("q.bin", dense=True)
+    assert isinstance(dense, backend.DenseQTable) and dense.is_canonical()
+    assert dense.to_dict() == table
+    assert backend.read_qtable_file("q.bin") == table
+
+def test_broken_files_are_rejected(load):
+    backend = load("2.0", "Backend")
+    backend.write_qtable_file("q.bin", sample_table(backend))
+    with open("q.bin", "rb") as f:
+        data = f.read()
+    for name, content in (("leer.bin", b""), ("kopf.bin", data[:5]), ("kurz.bin", data[:-1]),
+                          ("fremd.bin", b"XXXX" + data[4:])):
+        with open(name, "wb") as f:
+            f.write(content)
+        with pytest.raises(ValueError):
+            backend.QTableFile(name)
+
+def test_journal_and_compaction(load):
+    backend = load("2.0", "Backend")
+    table = sample_table(backend)
+    ai = backend.QLearningAI('w', qfile="q.bin", q_table=table, journal_limit=10 ** 9, background_compaction=False)
+    ai.save_qtable()
+    keys = list(table)
+    # Wenige Änderungen landen im Journal, der Snapshot bleibt wie er ist
+    for key in keys[:10]:
+        ai.q_table[key] = 0.25
+        ai.dirty.add(key)
+    ai.save_qtable()
+    assert os.path.exists("q.bin.journal")
+    assert backend.read_qtable_file("q.bin")[keys[0]] == table[keys[0]]
+    assert backend.QLearningAI('w', qfile="q.bin").q_table == ai.q_table
+    # Ein halb geschriebener Satz am Ende des Journals wird ignoriert
+    with open("q.bin.journal", "ab") as f:
+        f.write(b"\x01\x02\x03")
+    assert backend.QLearningAI('w', qfile="q.bin").q_table == ai.q_table
+    # Verdichten: Journal in den Snapshot, danach gibt es kein Journal mehr
+    ai.journal_limit = 0
+    ai.q_table[keys[10]] = 0.5
+    ai.dirty.add(keys[10])
+    ai.save_qtable()
+    assert not os.path.exists("q.bin.journal") and not os.path.exists("q.bin.journal.compacting")
+    assert backend.read_qtable_file("q.bin") == ai.q_table
+
+def test_dense_backend_reads_journal(load):
+    backend = load("2.0", "Backend")
+    if backend.np is None:
+        pytest.skip("numpy fehlt")
+    table = sample_table(backend)
+    backend.write_qtable_file("q.bin", table)
+    key = next(iter(table))
+    backend.append_qtable_journal("q.bin.journal", [(key, 0.75)])
+    table[key] = 0.75
+    assert backend.QLearningAI('w', qfile="q.bin", backend="dense").q_table.to_dict() == table
+
+def test_legacy_pickle_conversion(load):
+    backend = load("2.0", "Backend")
+    table = sample_table(backend)
+    # Ganz alte Schlüssel: str(board) + turn und str(move)
+    legacy = {(str([list(row) for row in state[0]]) + state[1], str([list(square) for square in move])): value
+              for (state, move), value in table.items()}
+    with open("q.pkl", "wb") as f:
+        pickle.dump(legacy, f)
+    assert backend.QLearningAI('w', qfile="q.bin").q_table == table
+    assert backend.read_qtable_file("q.bin") == table
+
+def test_symmetric_migration(load):
+    backend = load("2.0", "Backend")
+    table = sample_table(backend)
+    # Jeder Eintrag zusätzlich gespiegelt mit anderem Wert: nach der Migration bleibt der Mittelwert
+    mixed = {}
+    for (state, move), value in table.items():
+        mixed[(state, move)] = value
+        mirrored = (backend.mirror_state(state), backend.mirror_move(move))
+        if mirrored != (state, move):
+            mixed[mirrored] = value + 1
+    expected = backend.canonicalize_qtable(mixed)
+    backend.write_qtable_file("q.bin", mixed)
+    assert backend.QLearningAI('w', qfile="q.bin").q_table == expected
+    if backend.np is not None:
+        dense = backend.QLearningAI('w', qfile="q.bin", backend="dense").q_table
+        assert dense.to_dict() == pytest.approx(expected)
+    backend.migrate_qtable_symmetric("q.bin")
+    assert backend.read_qtable_file("q.bin") == pytest.approx(expected)
+
+def test_parallel_updates_stay_in_range(load):
+    # Zusammenführen der Worker darf die Werte nicht über die Belohnungen hinaus treiben
+    backend = load("2.0", "Backend")
+    ai = backend.QLearningAI('w', qfile="q.bin", q_table={})
+    key = backend.canonical_key(backend.Game().get_state(), ((0, 0), (1, 0)))
+    backend._replay_updates(ai, [[(key, 1.0)] * 50] * 8)
+    assert 0 < ai.q_table[key] <= 1.0
+    backend.train_ai_selfplay(episodes=400, workers=2, sync_interval=50, seed=1)
+    for qfile in ("qtable.bin", "qtable_white.bin"):
+        values = backend.read_qtable_file(qfile).values()
+        assert all(-500 <= value <= 1 for value in values)
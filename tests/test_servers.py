@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+
+# Fehlerverträge der Server: falsche Eingaben geben 400, unbekannte Partien 404, nie 500 oder ein hängender Request
+
+FLASK_APPS = [("2.0", "Backend"), ("Lokal", "Logik_Online"), ("Server", "flask_app")]
+ASGI_APPS = [("2.0", ("Backend", "Backend_ASGI")), ("Lokal", ("Logik_Online", "Logik_Online_ASGI")),
+             ("Server", ("flask_app", "asgi_app"))]
+BAD_MOVES = [None, "a", 5, [], [[0, 0]], [None, [1, 0]], [[0, 0], 7]]
+
+@pytest.fixture(params=FLASK_APPS, ids=[folder for folder, _ in FLASK_APPS])
+def client(request, load):
+    folder, name = request.param
+    return load(folder, name).app.test_client()
+
+def test_new_game_needs_session_id(client):
+    for body in ({}, {"session_id": None}, {"session_id": 5}, {"session_id": ["a"]}):
+        assert client.post("/new_game", json=body).status_code == 400
+    assert client.post("/new_game", json={"session_id": "a"}).status_code == 200
+
+def test_unknown_game(client):
+    assert client.get("/get_state?session_id=nope").status_code == 404
+    assert client.get("/wait_state?session_id=nope&timeout=0").status_code == 404
+    response = client.post("/move", json={"session_id": "nope", "move": [[0, 0], [1, 0]]})
+    assert response.status_code == 404 and response.json == {"error": "No such game"}
+
+def test_move_errors(client):
+    client.post("/new_game", json={"session_id": "a"})
+    for move in BAD_MOVES:
+        response = client.post("/move", json={"session_id": "a", "move": move})
+        assert response.status_code == 400 and response.json == {"error": "Bad request"}, move
+    for session_id in (None, 5, ["a"]):
+        assert client.post("/move", json={"session_id": session_id, "move": [[0, 0], [1, 0]]}).status_code == 400
+    response = client.post("/move", json={"session_id": "a", "move": [[0, 0], [2, 0]]})
+    assert response.status_code == 400 and response.json == {"error": "Invalid move"}
+    response = client.post("/move", json={"session_id": "a", "move": [[0, 0], [1, 0]]})
+    assert response.status_code == 200 and response.json["turn"] == "b"
+    assert response.json["board"][1][0] == "w"
+
+def test_wait_state_timeouts(client):
+    client.post("/new_game", json={"session_id": "a"})
+    version = client.get("/get_state?session_id=a").json["version"]
+    for timeout in ("-5", "0"):
+        assert client.get(f"/wait_state?session_id=a&since={version}&timeout={timeout}").status_code == 200
+    if client.application.name != "flask_app":
+        # flask_app.py wartet mit einer Deadline, nan beendet dort die Schleife sofort
+        assert client.get(f"/wait_state?session_id=a&since={version}&timeout=nan").status_code == 400
+
+def test_batch_errors(client):
+    for body in ({}, "x", [1], [{"op": "new_game"}] * 1001):
+        assert client.post("/batch", json=body).status_code == 400
+    ops = [{"op": "new_game", "session_id": "a"}, {"op": "new_game", "session_id": 5},
+           {"op": "get_state", "session_id": ["a"]}, {"op": "get_state", "session_id": "nope"},
+           {"op": "explode", "session_id": "a"}, {"op": "move", "session_id": "a", "move": "x"},
+           {"op": "move", "session_id": "a", "move": [[0, 0], [2, 0]]},
+           {"op": "move", "session_id": "a", "move": [[0, 0], [1, 0]]}]
+    response = client.post("/batch", json=ops)
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json["results"]] == [200, 400, 400, 404, 400, 400, 400, 200]
+
+def test_ai_move_errors(load):
+    backend = load("2.0", "Backend")
+    client = backend.app.test_client()
+    start = [["w", "w", "w"], [".", ".", "."], ["b", "b", "b"]]
+    for body in ({"board": start, "turn": "x", "ai": "search"}, {"board": start, "ai": "search"},
+                 {"board": start[:2], "turn": "w", "ai": "search"}, {"board": "www", "turn": "w", "ai": "search"},
+                 {"board": [["w", "w", "q"]] + start[1:], "turn": "w", "ai": "search"},
+                 {"board": start, "turn": "w", "ai": "magic"}, {"session_id": 5, "ai": "search"},
+                 {"board": start, "turn": "w", "ai": "search", "time_budget": "nan"}, [1, 2]):
+        assert client.post("/ai_move", json=body).status_code == 400, body
+    assert client.post("/ai_move", json={"session_id": "nope", "ai": "search"}).status_code == 404
+    response = client.post("/ai_move", json={"board": start, "turn": "w", "ai": "search", "time_budget": 0.05})
+    assert response.status_code == 200 and response.json["move"][0][0] == 0
+
+async def call(app, method, path, body=None, query=""):
+    # Ein HTTP-Request direkt an die ASGI-App, ohne Server: (status, JSON oder None)
+    messages = [{"type": "http.request", "body": b"" if body is None else json.dumps(body).encode(),
+                 "more_body": False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query.encode(), "headers": []}
+    await asyncio.wait_for(app(scope, receive, send), 5)
+    data = b"".join(message.get("body", b"") for message in sent[1:])
+    return sent[0]["status"], json.loads(data) if data else None
+
+@pytest.mark.parametrize("folder, names", ASGI_APPS, ids=[folder for folder, _ in ASGI_APPS])
+def test_asgi_errors(load, folder, names):
+    app = load(folder, *names)[1].app
+
+    async def scenario():
+        for body in ({}, {"session_id": 5}):
+            assert (await call(app, "POST", "/new_game", body))[0] == 400
+        assert (await call(app, "GET", "/get_state", query="session_id=nope"))[0] == 404
+        assert (await call(app, "POST", "/move", {"session_id": "nope", "move": [[0, 0], [1, 0]]}))[0] == 404
+        assert (await call(app, "POST", "/new_game", {"session_id": "a"}))[0] == 200
+        for move in BAD_MOVES:
+            response = await call(app, "POST", "/move", {"session_id": "a", "move": move})
+            assert response == (400, {"error": "Bad request"}), move
+        assert (await call(app, "POST", "/move", {"session_id": 5, "move": [[0, 0], [1, 0]]}))[0] == 400
+        assert (await call(app, "POST", "/move", {"session_id": "a", "move": [[0, 0], [2, 0]]}))[0] == 400
+        status, state = await call(app, "GET", "/get_state", query="session_id=a")
+        assert status == 200
+        query = "session_id=a&since=%d&timeout=" % state["version"]
+        assert (await call(app, "GET", "/wait_state", query=query + "nan"))[0] == 400
+        assert (await call(app, "GET", "/wait_state", query=query + "-1"))[0] == 200
+        status, state = await call(app, "POST", "/move", {"session_id": "a", "move": [[0, 0], [1, 0]]})
+        assert status == 200 and state["turn"] == "b"
+
+    asyncio.run(scenario())